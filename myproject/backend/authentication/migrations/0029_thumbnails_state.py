@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 03:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0028_usermedia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_thumbnails',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='usermedia',
+            name='file_thumbnails',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
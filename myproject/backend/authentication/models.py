@@ -14,6 +14,8 @@ def user_media_path(instance, filename):
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True, verbose_name="Электронная почта")
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    # Имя файла, для которого фоновая задача создала превью (см. products/thumbnails.py)
+    avatar_thumbnails = models.CharField(max_length=100, blank=True, default='', editable=False)
     address = models.TextField(
             verbose_name="Адрес",
             blank=True,
@@ -77,6 +79,8 @@ class UserMedia(models.Model):
     
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='media')
     file = models.FileField(upload_to=user_media_path, verbose_name="Медиафайл")
+    # Имя файла, для которого фоновая задача создала превью (см. products/thumbnails.py)
+    file_thumbnails = models.CharField(max_length=100, blank=True, default='', editable=False)
     media_type = models.CharField(max_length=10, choices=MEDIA_TYPE_CHOICES, default='image', verbose_name="Тип медиа")
     title = models.CharField(max_length=255, blank=True, null=True, verbose_name="Заголовок")
     description = models.TextField(blank=True, null=True, verbose_name="Описание")
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from products.thumbnails import get_srcset
 from .models import SellerApplicationImage, UserMedia
 
 User = get_user_model()
@@ -49,14 +50,18 @@ class RegisterSerializer(serializers.ModelSerializer):
 class AuthUserSerializer(serializers.ModelSerializer):
     is_seller = serializers.BooleanField(read_only=True)
     seller_status = serializers.CharField(read_only=True)
+    avatar_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = User
         fields = [
-            "id","username","email","avatar",
+            "id","username","email","avatar","avatar_srcset",
             "first_name","last_name","middle_name",
             "phone","show_phone","is_staff", "is_seller", "seller_status"
         ]
+
+    def get_avatar_srcset(self, obj):
+        return get_srcset(obj, 'avatar', self.context.get('request'))
         
 class SellerApplicationImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
@@ -75,11 +80,17 @@ class SellerApplicationImageSerializer(serializers.ModelSerializer):
 
 class UserMediaSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = UserMedia
-        fields = ['id', 'file', 'file_url', 'media_type', 'title', 'description', 'uploaded_at']
+        fields = ['id', 'file', 'file_url', 'srcset', 'media_type', 'title', 'description', 'uploaded_at']
         read_only_fields = ['uploaded_at']
+
+    def get_srcset(self, obj):
+        if obj.media_type != 'image':
+            return None
+        return get_srcset(obj, 'file', self.context.get('request'))
     
     def get_file_url(self, obj):
         if obj.file:
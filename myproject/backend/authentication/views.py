@@ -22,6 +22,8 @@ from rest_framework import status, generics
 from django.utils import timezone
 
 from authentication.serializers import AuthUserSerializer
+from products.tasks import enqueue
+from products.thumbnails import delete_thumbnails
 from .models import SellerApplicationImage, UserMedia
 
 User = get_user_model()
@@ -144,7 +146,15 @@ class UserMediaView(APIView):
         )
         
         serializer = UserMediaSerializer(media, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        data = dict(serializer.data)
+        if media_type == 'image':
+            # Проверка и превью выполняются фоновым воркером
+            data['task_id'] = enqueue(
+                'process_image',
+                {'model': 'authentication.UserMedia', 'pk': media.pk, 'field': 'file'},
+                user=request.user,
+            ).id
+        return Response(data, status=status.HTTP_201_CREATED)
 
 
 class UserMediaDetailView(APIView):
@@ -163,6 +173,7 @@ class UserMediaDetailView(APIView):
         """Delete a media file"""
         try:
             media = UserMedia.objects.get(id=media_id, user=request.user)
+            delete_thumbnails(media.file)
             media.file.delete(save=False)  # Delete the actual file
             media.delete()  # Delete the database record
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -204,14 +215,23 @@ class UploadAvatarView(APIView):
         
         if user.avatar:
             logger.info(f"Удаление старого аватара: {user.avatar.path}")
+            # Новый аватар получит то же имя файла — старые превью нужно убрать
+            delete_thumbnails(user.avatar)
             user.avatar.delete(save=False)
         
+        user.avatar_thumbnails = ''
         user.avatar.save(f'avatar_{user.id}.jpg', file, save=True)
         logger.info(f"Новый аватар сохранен: {user.avatar.path}")
+        task = enqueue(
+            'process_image',
+            {'model': 'authentication.CustomUser', 'pk': user.pk, 'field': 'avatar'},
+            user=user,
+        )
         
         return Response({
             "message": "Аватар обновлён",
-            "avatar_url": user.avatar.url
+            "avatar_url": user.avatar.url,
+            "task_id": task.id,
         }, status=200)
 class UpdatePasswordView(APIView):
     permission_classes = [IsAuthenticated]
@@ -269,11 +289,19 @@ class SellerApplicationView(APIView):
         user.save()
         
         # Save application images
+        task_ids = []
         for image in images:
-            SellerApplicationImage.objects.create(user=user, image=image)
+            application_image = SellerApplicationImage.objects.create(user=user, image=image)
+            task_ids.append(enqueue(
+                'process_image',
+                {'model': 'authentication.SellerApplicationImage', 'pk': application_image.pk, 'field': 'image'},
+                user=user,
+            ).id)
         
         serializer = SellerApplicationSerializer(user, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = dict(serializer.data)
+        data['task_ids'] = task_ids
+        return Response(data, status=status.HTTP_200_OK)
     
     def delete(self, request):
         """Delete an application image"""
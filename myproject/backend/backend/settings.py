@@ -86,15 +86,58 @@ TEMPLATES = [
 ]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Загрузка файлов частями (products/uploads.py)
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'tmp', 'chunked_uploads')
+CHUNKED_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_SIZE = 500 * 1024 * 1024
+CHUNKED_UPLOAD_EXPIRE_HOURS = 24
+
+# Сколько минут товар в корзине держится за покупателем (products/reservations.py)
+STOCK_RESERVATION_TTL_MINUTES = 15
+# Сколько часов повтор с тем же Idempotency-Key получает сохранённый ответ
+IDEMPOTENCY_KEY_TTL_HOURS = 24
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+REDIS_URL = os.environ.get('REDIS_URL')
+
 # Channels
+# Уведомления ws/notifications/ шлют REST-запросы из других процессов,
+# поэтому в продакшене нужен общий слой в Redis; слой в памяти годится
+# только для разработки (см. chat/checks.py)
 ASGI_APPLICATION = 'backend.asgi.application'
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# Cache
+# Версии категорий, корзин и messages-data (products/caching.py) должны
+# сбрасываться сразу во всех воркерах, поэтому кэш общий: по умолчанию
+# таблица в БД (её создаёт миграция products), при заданном REDIS_URL — Redis.
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        },
+    }
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
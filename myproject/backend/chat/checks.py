@@ -0,0 +1,26 @@
+"""
+Проверки конфигурации (manage.py check).
+
+Уведомления ws/notifications/ (chat/notifications.py) в основном
+отправляют REST-запросы, а слушают их websocket-потребители в другом
+процессе. Channel layer в памяти процесса до них событие не донесёт.
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+PROCESS_LOCAL_LAYERS = ('channels.layers.InMemoryChannelLayer',)
+
+
+@register()
+def check_shared_channel_layer(app_configs, **kwargs):
+    backend = getattr(settings, 'CHANNEL_LAYERS', {}).get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_LAYERS:
+        return []
+    return [
+        Warning(
+            'Channel layer по умолчанию не общий для процессов: уведомления из '
+            'REST-запросов не дойдут до websocket-клиентов.',
+            hint='Задайте REDIS_URL, чтобы использовать RedisChannelLayer (см. CHANNEL_LAYERS в settings.py).',
+            id='chat.W001',
+        )
+    ]
@@ -3,7 +3,10 @@ import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.contrib.auth import get_user_model
 from channels.db import database_sync_to_async
+from django.db import transaction
+from products.conversations import has_conversations, record_message, refresh_last_message, refresh_unread, unread_total
 from products.models import Message
+from .notifications import notification_group
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from django.utils import timezone
@@ -291,11 +294,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
     def save_message(self, sender_id, recipient_id, content):
         sender = User.objects.get(id=sender_id)
         recipient = User.objects.get(id=recipient_id)
-        message = Message.objects.create(
-            sender=sender,
-            recipient=recipient,
-            content=content
-        )
+        with transaction.atomic():
+            message = Message.objects.create(
+                sender=sender,
+                recipient=recipient,
+                content=content
+            )
+            record_message(message)
         return message
     
     @database_sync_to_async
@@ -312,7 +317,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
     def delete_message(self, message_id):
         try:
             message = Message.objects.get(id=message_id, sender=self.user)
-            message.delete()
+            with transaction.atomic():
+                message.delete()
+                refresh_last_message(message.sender_id, message.recipient_id)
             return True
         except Message.DoesNotExist:
             return False
@@ -321,12 +328,61 @@ class ChatConsumer(AsyncWebsocketConsumer):
     def mark_messages_read(self, message_ids):
         try:
             # Mark messages as read in the database
-            Message.objects.filter(
+            unread = Message.objects.filter(
                 id__in=message_ids,
                 recipient=self.user,
                 is_read=False
-            ).update(is_read=True)
+            )
+            with transaction.atomic():
+                partner_ids = list(unread.values_list('sender_id', flat=True).distinct())
+                unread.update(is_read=True)
+                refresh_unread(self.user.id, partner_ids)
             return True
         except Exception as e:
             logger.error(f"Error marking messages as read: {e}")
-            return False 
\ No newline at end of file
+            return False 
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Личный канал пользователя вместо опроса messages/unread-count/ и
+    users/messages-data/: при подключении приходит текущее число
+    непрочитанных, дальше — новые значения счётчиков при каждом изменении.
+    """
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        self.group_name = notification_group(self.user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        # Подписка раньше снимка: изменение не потеряется, а пришедшее до
+        # снимка событие несёт абсолютные значения и ничего не задвоит
+        unread_count, has_messages = await self.get_counters()
+        await self.send(text_data=json.dumps({
+            'type': 'unread_count',
+            'unread_count': unread_count,
+            'has_messages': has_messages,
+        }))
+        logger.info(f"User {self.user.id} subscribed to notifications")
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    # Receive unread counters from conversations.py
+    async def unread_update(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'unread_update',
+            'partner_id': event['partner_id'],
+            'unread': event['unread'],
+            'unread_count': event['unread_count'],
+            'has_messages': event['has_messages'],
+        }))
+
+    @database_sync_to_async
+    def get_counters(self):
+        return unread_total(self.user), has_conversations(self.user)
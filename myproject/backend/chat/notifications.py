@@ -0,0 +1,60 @@
+"""
+Уведомления пользователя через ws/notifications/.
+
+У каждого пользователя своя группа в channel layer; NotificationConsumer
+подписывает на неё все вкладки пользователя. Изменения счётчиков приходят
+из products/conversations.py сигналом unread_counters_changed. События
+отправляются только после коммита транзакции, поэтому клиент не увидит
+изменение, которое затем откатилось.
+
+REST-запросы и websocket-потребители обычно работают в разных процессах,
+поэтому channel layer должен быть общим (Redis, см. CHANNEL_LAYERS).
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.dispatch import receiver
+
+from products.conversations import unread_counters, unread_counters_changed
+
+logger = logging.getLogger(__name__)
+
+
+def notification_group(user_id):
+    return f'notifications_{user_id}'
+
+
+def _send(user_id, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(notification_group(user_id), event)
+    except Exception as e:
+        # Уведомление — не повод ронять запрос: клиент сверится при переподключении
+        logger.error(f"Error sending notification to user {user_id}: {e}")
+
+
+@receiver(unread_counters_changed)
+def push_unread_update(sender, user_id, partner_id, **kwargs):
+    """
+    После коммита сообщает клиенту абсолютные счётчики: непрочитанные от
+    partner_id, общее число и has_messages. Они читаются из уже
+    закоммиченных данных, поэтому повтор или запоздавшее событие не
+    сдвигают счётчик на клиенте, а лишь заменяют его.
+    """
+    def send():
+        if get_channel_layer() is None:
+            return
+        unread, unread_count, has_messages = unread_counters(user_id, partner_id)
+        _send(user_id, {
+            'type': 'unread_update',
+            'partner_id': partner_id,
+            'unread': unread,
+            'unread_count': unread_count,
+            'has_messages': has_messages,
+        })
+
+    transaction.on_commit(send)
@@ -1,6 +1,7 @@
 from django.urls import re_path
-from .consumers import ChatConsumer
+from .consumers import ChatConsumer, NotificationConsumer
 
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<chat_id>\d+)/$', ChatConsumer.as_asgi()),
+    re_path(r'ws/notifications/$', NotificationConsumer.as_asgi()),
 ] 
\ No newline at end of file
@@ -1,3 +1,143 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from chat.checks import check_shared_channel_layer
+from chat.routing import websocket_urlpatterns
+from products.caching import get_user_message_data, invalidate_user_message_data
+from products.models import Message
+
+User = get_user_model()
+
+application = URLRouter(websocket_urlpatterns)
+
+
+class Communicator(ApplicationCommunicator):
+    """Минимальный websocket-клиент поверх asgiref: channels.testing требует daphne."""
+
+    def __init__(self, path, user):
+        super().__init__(application, {
+            'type': 'websocket', 'path': path, 'query_string': b'', 'headers': [],
+            'subprotocols': [], 'user': user,
+        })
+
+    async def connect(self):
+        await self.send_input({'type': 'websocket.connect'})
+        return (await self.receive_output())['type'] == 'websocket.accept'
+
+    async def receive_json_from(self):
+        return json.loads((await self.receive_output())['text'])
+
+    async def disconnect(self):
+        await self.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.wait()
+
+
+class NotificationConsumerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='password123')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='password123')
+
+    def communicator(self, user):
+        return Communicator('/ws/notifications/', user)
+
+    def send_message(self, sender, recipient, content):
+        client = APIClient()
+        client.force_authenticate(sender)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('send-message'), {'recipient_id': recipient.id, 'content': content})
+        return response.data['id']
+
+    def read_chat(self, reader, partner):
+        client = APIClient()
+        client.force_authenticate(reader)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.get(reverse('chat_messages', args=[partner.id]))
+
+    def test_snapshot_then_absolute_updates(self):
+        self.send_message(self.alice, self.bob, 'привет')
+
+        async def scenario():
+            communicator = self.communicator(self.bob)
+            self.assertTrue(await communicator.connect())
+            self.assertEqual(await communicator.receive_json_from(),
+                             {'type': 'unread_count', 'unread_count': 1, 'has_messages': True})
+
+            await database_sync_to_async(self.send_message)(self.alice, self.bob, 'ещё')
+            self.assertEqual(await communicator.receive_json_from(), {
+                'type': 'unread_update', 'partner_id': self.alice.id,
+                'unread': 2, 'unread_count': 2, 'has_messages': True,
+            })
+
+            await database_sync_to_async(self.read_chat)(self.bob, self.alice)
+            self.assertEqual(await communicator.receive_json_from(), {
+                'type': 'unread_update', 'partner_id': self.alice.id,
+                'unread': 0, 'unread_count': 0, 'has_messages': True,
+            })
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_first_conversation_updates_sender(self):
+        async def scenario():
+            communicator = self.communicator(self.alice)
+            self.assertTrue(await communicator.connect())
+            self.assertEqual(await communicator.receive_json_from(),
+                             {'type': 'unread_count', 'unread_count': 0, 'has_messages': False})
+
+            await database_sync_to_async(self.send_message)(self.alice, self.bob, 'привет')
+            self.assertEqual(await communicator.receive_json_from(), {
+                'type': 'unread_update', 'partner_id': self.bob.id,
+                'unread': 0, 'unread_count': 0, 'has_messages': True,
+            })
+            await database_sync_to_async(self.send_message)(self.alice, self.bob, 'ещё')
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_anonymous_is_rejected(self):
+        async def scenario():
+            self.assertFalse(await self.communicator(AnonymousUser()).connect())
+
+        async_to_sync(scenario)()
+
+    def test_message_data_cache_is_invalidated(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        self.assertEqual(client.get(reverse('user_message_data')).data['unread_count'], 0)
+        self.assertEqual(client.get(reverse('user_message_data')).data['unread_count'], 0)
+        self.send_message(self.alice, self.bob, 'привет')
+        response = client.get(reverse('user_message_data'))
+        self.assertEqual(response.data['unread_count'], 1)
+        self.assertTrue(response.data['has_messages'])
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_stale_message_data_is_not_served(self):
+        def build_racing_with_write():
+            # Пока считается ответ, другой запрос коммитит изменение счётчиков
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidate_user_message_data(self.bob.id)
+            return {'unread_count': 0}
+
+        get_user_message_data(self.bob, build_racing_with_write)
+        self.assertEqual(get_user_message_data(self.bob, lambda: {'unread_count': 1}), {'unread_count': 1})
+
+    def test_process_local_channel_layer_is_reported(self):
+        in_memory = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+        with override_settings(CHANNEL_LAYERS=in_memory):
+            self.assertEqual([warning.id for warning in check_shared_channel_layer(None)], ['chat.W001'])
+        redis = {'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer'}}
+        with override_settings(CHANNEL_LAYERS=redis):
+            self.assertEqual(check_shared_channel_layer(None), [])
@@ -0,0 +1,149 @@
+"""
+Массовый импорт и обновление товаров продавца.
+
+Строки валидируются и записываются пачками по BATCH_SIZE: на пачку уходит
+один запрос за обновляемыми товарами, один bulk_create для новых и один
+upsert (INSERT ... ON CONFLICT DO UPDATE) для изменённых. Весь импорт идёт
+в одной транзакции, обновляемые товары читаются с SELECT ... FOR UPDATE:
+товар, который параллельно удаляют, не «воскреснет» через INSERT
+upsert'а. Невалидные строки пропускаются и попадают в отчёт с номером
+строки.
+"""
+import codecs
+import csv
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from . import search
+from .models import Category, Product
+from .serializers import ProductBulkRowSerializer
+
+BATCH_SIZE = 500
+UPDATABLE_FIELDS = (
+    'name', 'description', 'price', 'quantity', 'unit', 'category',
+    'delivery_available', 'seller_address',
+)
+
+
+def iter_json_rows(data):
+    for number, row in enumerate(data, start=1):
+        yield number, row
+
+
+def iter_csv_rows(upload, delimiter=','):
+    """Читает CSV построчно, не загружая файл в память целиком."""
+    reader = csv.DictReader(codecs.iterdecode(upload, 'utf-8-sig'), delimiter=delimiter)
+    for number, row in enumerate(reader, start=1):
+        # Пустые ячейки считаем незаполненными полями
+        yield number, {
+            key.strip(): value.strip()
+            for key, value in row.items()
+            if key and value is not None and value.strip() != ''
+        }
+
+
+class ProductImporter:
+    def __init__(self, farmer):
+        self.farmer = farmer
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        categories = Category.objects.all()
+        context = {
+            'categories': {category.id: category for category in categories},
+            'category_names': {category.name.lower(): category for category in categories},
+        }
+        # Сериализаторы создаём один раз: копирование полей на каждую строку
+        # обходится дороже самой валидации
+        self.create_serializer = ProductBulkRowSerializer(context=context)
+        self.update_serializer = ProductBulkRowSerializer(context=context, partial=True)
+
+    def run(self, rows):
+        with transaction.atomic():
+            batch = []
+            for number, row in rows:
+                batch.append((number, row))
+                if len(batch) >= BATCH_SIZE:
+                    self._process_batch(batch)
+                    batch = []
+            if batch:
+                self._process_batch(batch)
+        return {'created': self.created, 'updated': self.updated, 'errors': self.errors}
+
+    def _validate(self, batch):
+        to_create, to_update = [], []
+        for number, row in batch:
+            if not isinstance(row, dict):
+                self.errors.append({'row': number, 'errors': {'non_field_errors': ['Ожидается объект']}})
+                continue
+            serializer = self.update_serializer if row.get('id') else self.create_serializer
+            try:
+                data = serializer.run_validation(row)
+            except ValidationError as exc:
+                self.errors.append({'row': number, 'errors': exc.detail})
+                continue
+            (to_update if data.get('id') else to_create).append((number, data))
+        return to_create, to_update
+
+    def _process_batch(self, batch):
+        to_create, to_update = self._validate(batch)
+        touched_ids = []
+
+        if to_update:
+            # Удаление заблокированной строки ждёт конца импорта, поэтому
+            # upsert ниже только обновляет и никогда не вставляет
+            existing = Product.objects.select_for_update().filter(farmer=self.farmer).in_bulk(
+                [data['id'] for _, data in to_update]
+            )
+            products, fields = [], {'updated_at'}
+            for number, data in to_update:
+                product = existing.get(data['id'])
+                if product is None:
+                    self.errors.append({'row': number, 'errors': {'id': ['Товар не найден']}})
+                    continue
+                for field in UPDATABLE_FIELDS:
+                    if field in data:
+                        setattr(product, field, data[field])
+                        fields.add(field)
+                products.append(product)
+            if products:
+                # Upsert по первичному ключу заметно быстрее bulk_update с CASE WHEN
+                # на каждую строку; updated_at проставит auto_now
+                Product.objects.bulk_create(
+                    products,
+                    batch_size=BATCH_SIZE,
+                    update_conflicts=True,
+                    unique_fields=['id'],
+                    update_fields=sorted(fields),
+                )
+                self.updated += len(products)
+                touched_ids.extend(product.id for product in products)
+
+        if to_create:
+            products = [
+                Product(
+                    farmer=self.farmer,
+                    slug=Product.build_slug(data['name']),
+                    **{field: data[field] for field in UPDATABLE_FIELDS if field in data},
+                )
+                for _, data in to_create
+            ]
+            self._ensure_unique_slugs(products)
+            created = Product.objects.bulk_create(products, batch_size=BATCH_SIZE)
+            self.created += len(created)
+            touched_ids.extend(product.id for product in created)
+
+        # Сигналы post_save при bulk-операциях не срабатывают
+        search.index_products(touched_ids)
+
+    @staticmethod
+    def _ensure_unique_slugs(products):
+        """Перегенерирует slug, совпавшие внутри пачки или с уже существующими товарами."""
+        slugs = {product.slug for product in products}
+        taken = set(Product.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+        seen = set()
+        for product in products:
+            while product.slug in taken or product.slug in seen:
+                product.slug = Product.build_slug(product.name)
+            seen.add(product.slug)
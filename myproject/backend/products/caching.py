@@ -0,0 +1,195 @@
+"""
+Кэширование ответов каталога.
+
+Все ключи живут в общем для процессов кэше из settings.CACHES (таблица
+в БД или Redis): иначе сброс версии в одном воркере не увидят остальные.
+
+Категории меняются редко, а запрашиваются почти на каждой странице.
+Список хранится в кэше Django под ключом текущей версии; версия — это
+момент последнего изменения категорий, она же служит ETag/Last-Modified.
+Сигналы на Category сбрасывают версию (см. products/signals.py).
+
+Для товаров ETag строится по отпечатку Max(updated_at) + Count, который
+считается одним лёгким запросом до запуска сериализатора.
+
+Сводка корзины кэшируется так же — под версией корзины пользователя.
+Версия сдвигается после коммита любой записи в корзину, поэтому ответ,
+посчитанный по старым данным, попадает под старую версию и не читается.
+
+Ответ users/messages-data кэшируется так же — под версией пользователя,
+которая сдвигается после коммита любого изменения его счётчиков (см.
+conversations.py) или профиля.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+CATEGORIES_VERSION_KEY = 'products:categories:version'
+CATEGORIES_PAYLOAD_KEY = 'products:categories:payload:{version}'
+CATEGORIES_TIMEOUT = 60 * 60 * 24
+
+CART_VERSION_KEY = 'products:cart:version:{user_id}'
+CART_SUMMARY_KEY = 'products:cart:summary:{user_id}:{version}'
+# Цены товаров меняются и массовым импортом, минуя сигналы, — держим недолго
+CART_SUMMARY_TIMEOUT = 60 * 5
+
+USER_MESSAGE_DATA_VERSION_KEY = 'products:messages-data:version:{user_id}'
+USER_MESSAGE_DATA_KEY = 'products:messages-data:{user_id}:{version}'
+# Страховка на случай изменений в обход сигналов и conversations.py
+USER_MESSAGE_DATA_TIMEOUT = 60
+
+
+def bump_categories_version():
+    version = int(timezone.now().timestamp() * 1_000_000)
+    cache.set(CATEGORIES_VERSION_KEY, version, CATEGORIES_TIMEOUT)
+    return version
+
+
+def get_categories_version():
+    version = cache.get(CATEGORIES_VERSION_KEY)
+    if version is None:
+        version = bump_categories_version()
+    return version
+
+
+def categories_etag(request, *args, **kwargs):
+    return f'"categories-{get_categories_version()}"'
+
+
+def categories_last_modified(request, *args, **kwargs):
+    return datetime.fromtimestamp(get_categories_version() / 1_000_000, tz=dt_timezone.utc)
+
+
+def get_cached_categories():
+    """Сериализованный список категорий; в БД идём только при промахе кэша."""
+    from .models import Category
+    from .serializers import CategorySerializer
+
+    # Данные кладутся под ключ версии: устаревший ответ, записанный после сброса
+    # версии конкурентным запросом, больше никогда не будет прочитан.
+    key = CATEGORIES_PAYLOAD_KEY.format(version=get_categories_version())
+    payload = cache.get(key)
+    if payload is None:
+        payload = CategorySerializer(Category.objects.order_by('id'), many=True).data
+        cache.set(key, payload, CATEGORIES_TIMEOUT)
+    return payload
+
+
+def _bump_cart_versions(user_ids):
+    version = int(timezone.now().timestamp() * 1_000_000)
+    cache.set_many(
+        {CART_VERSION_KEY.format(user_id=user_id): version for user_id in user_ids},
+        CART_SUMMARY_TIMEOUT,
+    )
+
+
+def invalidate_cart_summary(*user_ids):
+    """Сбрасывает сводку корзины после коммита текущей транзакции."""
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: _bump_cart_versions(user_ids))
+
+
+def get_cart_summary(user):
+    """Число позиций, сумма количеств и итог корзины одним агрегирующим запросом."""
+    from .models import CartItem
+
+    version = cache.get(CART_VERSION_KEY.format(user_id=user.pk), 0)
+    key = CART_SUMMARY_KEY.format(user_id=user.pk, version=version)
+    summary = cache.get(key)
+    if summary is None:
+        totals = CartItem.objects.filter(user=user).aggregate(
+            item_count=Count('id'),
+            quantity_sum=Coalesce(Sum('quantity'), 0),
+            total_amount=Coalesce(
+                Sum(F('quantity') * F('product__price'),
+                    output_field=DecimalField(max_digits=12, decimal_places=2)),
+                0,
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        summary = {
+            'items': totals['item_count'],
+            'quantity': totals['quantity_sum'],
+            'total': f"{totals['total_amount']:.2f}",
+        }
+        cache.set(key, summary, CART_SUMMARY_TIMEOUT)
+    return summary
+
+
+def _bump_user_message_data_versions(user_ids):
+    version = int(timezone.now().timestamp() * 1_000_000)
+    cache.set_many(
+        {USER_MESSAGE_DATA_VERSION_KEY.format(user_id=user_id): version for user_id in user_ids},
+        USER_MESSAGE_DATA_TIMEOUT,
+    )
+
+
+def invalidate_user_message_data(*user_ids):
+    """Сбрасывает кэш users/messages-data после коммита текущей транзакции."""
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: _bump_user_message_data_versions(user_ids))
+
+
+def get_user_message_data(user, build):
+    """Закэшированный ответ users/messages-data; build() вызывается при промахе."""
+    version = cache.get(USER_MESSAGE_DATA_VERSION_KEY.format(user_id=user.pk), 0)
+    key = USER_MESSAGE_DATA_KEY.format(user_id=user.pk, version=version)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, USER_MESSAGE_DATA_TIMEOUT)
+    return data
+
+
+def products_fingerprint(queryset):
+    """(Max(updated_at), Count) товаров queryset одним агрегирующим запросом."""
+    fingerprint = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return fingerprint['last_modified'], fingerprint['count']
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified для GET у generic-вью товаров: если клиент прислал
+    актуальные If-None-Match/If-Modified-Since, отдаём 304 без сериализации.
+    """
+    conditional_prefix = 'products'
+
+    def get_conditional_queryset(self):
+        return self.get_queryset()
+
+    def get_validators(self):
+        last_modified, count = products_fingerprint(self.get_conditional_queryset())
+        if last_modified is None:
+            return None, None
+        # В ответе есть поля, зависящие от пользователя (is_owner/editable),
+        # и название категории — учитываем их в ETag
+        viewer = self.request.user.pk if self.request.user.is_authenticated else 0
+        etag = '"{}-{}-{}-{}-{}"'.format(
+            self.conditional_prefix,
+            int(last_modified.timestamp() * 1_000_000),
+            count,
+            viewer,
+            get_categories_version(),
+        )
+        return etag, int(last_modified.timestamp())
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        if etag is None:
+            return super().get(request, *args, **kwargs)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.headers['ETag'] = etag
+            response.headers['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,118 @@
+"""
+Быстрое добавление товара в корзину.
+
+Один SELECT читает товар вместе с позицией корзины покупателя (LEFT JOIN
+через FilteredRelation), продавцом первой позиции корзины и суммой чужих
+резервов. Затем позиция увеличивается атомарным F()-UPDATE или создаётся
+INSERT'ом без full_clean(), а резерв обновляется upsert'ом. Итого три
+запроса независимо от содержимого корзины.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, FilteredRelation, Q, Subquery
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .caching import invalidate_cart_summary
+from .models import CartItem, Product, StockReservation
+from .reservations import reservation_ttl, reserved_quantity
+
+
+def parse_product_id(value):
+    try:
+        product_id = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({'product': 'Укажите ID товара'})
+    if product_id < 1:
+        raise ValidationError({'product': 'Некорректный ID товара'})
+    return product_id
+
+
+def out_of_stock(product, available):
+    return ValidationError(f"Недостаточно товара '{product.name}'. Доступно: {max(available, 0)}")
+
+
+def parse_quantity(value):
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({'quantity': 'Количество должно быть целым числом'})
+    if quantity < 1:
+        raise ValidationError({'quantity': 'Количество не может быть меньше 1'})
+    return quantity
+
+
+def increment_cart_item(user, product, quantity, available):
+    """
+    Увеличивает существующую позицию корзины, только если вместе с ней
+    хватает available единиц: проверка идёт в условии самого UPDATE.
+    """
+    updated = CartItem.objects.filter(
+        user=user, product=product, quantity__lte=available - quantity
+    ).update(quantity=F('quantity') + quantity)
+    if not updated:
+        raise out_of_stock(product, available)
+    return CartItem.objects.get(user=user, product=product)
+
+
+def add_to_cart(user, product_id, quantity):
+    """Добавляет quantity единиц товара в корзину и возвращает позицию корзины."""
+    first_farmer = (
+        CartItem.objects.filter(user=user).order_by('id').values('product__farmer_id')[:1]
+    )
+    with transaction.atomic():
+        product = (
+            Product.objects.select_for_update(of=('self',))
+            .annotate(
+                own_cart=FilteredRelation('cartitem', condition=Q(cartitem__user=user)),
+                cart_item_id=F('own_cart__id'),
+                cart_item_quantity=F('own_cart__quantity'),
+                cart_item_created_at=F('own_cart__created_at'),
+                cart_farmer_id=Subquery(first_farmer),
+                reserved=reserved_quantity(exclude_user=user),
+            )
+            .filter(pk=product_id)
+            .first()
+        )
+        if product is None:
+            raise ValidationError({"product": "Товар не найден"})
+        if product.cart_farmer_id is not None and product.cart_farmer_id != product.farmer_id:
+            raise ValidationError("Нельзя добавлять товары от разных продавцов в одну корзину.")
+
+        new_quantity = (product.cart_item_quantity or 0) + quantity
+        available = product.quantity - product.reserved
+        if new_quantity > available:
+            raise out_of_stock(product, available)
+
+        cart_item = CartItem(
+            id=product.cart_item_id,
+            user=user,
+            product=product,
+            quantity=new_quantity,
+            created_at=product.cart_item_created_at,
+        )
+        if cart_item.id is not None:
+            CartItem.objects.filter(pk=cart_item.id).update(quantity=F('quantity') + quantity)
+        else:
+            try:
+                with transaction.atomic():
+                    CartItem.objects.bulk_create([cart_item])
+            except IntegrityError:
+                # Параллельный запрос успел создать позицию — увеличиваем её
+                cart_item = increment_cart_item(user, product, quantity, available)
+                new_quantity = cart_item.quantity
+
+        StockReservation.objects.bulk_create(
+            [StockReservation(
+                cart_item_id=cart_item.id,
+                product_id=product.id,
+                user=user,
+                quantity=new_quantity,
+                expires_at=timezone.now() + reservation_ttl(),
+            )],
+            update_conflicts=True,
+            unique_fields=['cart_item'],
+            update_fields=['quantity', 'expires_at'],
+        )
+        # update() и bulk_create() не вызывают сигналы — сбрасываем сводку сами
+        invalidate_cart_summary(user.pk)
+    return cart_item
@@ -0,0 +1,148 @@
+"""
+Оформление заказа с атомарным списанием остатков.
+
+Остатки списываются одним условным UPDATE:
+
+    UPDATE products_product
+       SET quantity = CASE WHEN id = 1 THEN quantity - 2 ... END
+     WHERE (id = 1 AND quantity >= 2) OR ...
+
+Если обновилось меньше строк, чем позиций в заказе, какого-то товара уже
+не хватает — транзакция откатывается целиком. Проверка и списание идут
+одной командой, поэтому параллельные заказы не могут продать больше, чем
+есть на складе. UPDATE выполняется первым: он сразу берёт блокировку на
+запись (строк в PostgreSQL, базы в SQLite), и цены читаются уже под ней.
+
+Активные резервы других покупателей (см. reservations.py) вычитаются из
+остатка прямо в условии UPDATE; собственные резервы покупателя после
+оформления снимаются.
+"""
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import CartItem, Order, OrderItem, Product
+from .reservations import release, reserved_quantity
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def normalize_items(items):
+    """Схлопывает повторяющиеся товары: {product_id: количество}."""
+    quantities = OrderedDict()
+    for item in items or []:
+        if not isinstance(item, dict):
+            raise ValidationError({'items': 'Некорректная позиция заказа'})
+        try:
+            product_id = int(item.get('product'))
+            quantity = int(item.get('quantity', 1))
+        except (TypeError, ValueError):
+            raise ValidationError({'items': 'Некорректная позиция заказа'})
+        if quantity < 1:
+            raise ValidationError({'quantity': 'Количество должно быть положительным'})
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if not quantities:
+        raise ValidationError({'items': 'Заказ не содержит товаров'})
+    return quantities
+
+
+def deduct_stock(user, quantities):
+    """Списывает остатки одним UPDATE; при нехватке бросает OutOfStock."""
+    reserved_by_others = reserved_quantity(exclude_user=user)
+    condition = Q()
+    for product_id, quantity in quantities.items():
+        condition |= Q(id=product_id, quantity__gte=reserved_by_others + quantity)
+    updated = Product.objects.filter(condition).update(
+        quantity=Case(
+            *[When(id=product_id, then=F('quantity') - quantity)
+              for product_id, quantity in quantities.items()],
+            default=F('quantity'),
+            output_field=PositiveIntegerField(),
+        ),
+        # update() не вызывает auto_now, а от updated_at зависят ETag каталога
+        updated_at=timezone.now(),
+    )
+    if updated != len(quantities):
+        raise OutOfStock()
+
+
+def stock_error(user, quantities):
+    """Понятное сообщение о том, какого товара не хватило."""
+    products = Product.objects.annotate(
+        reserved=reserved_quantity(exclude_user=user)
+    ).in_bulk(list(quantities))
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None:
+            return ValidationError({'product': f'Продукт с ID {product_id} не найден'})
+        available = max(product.quantity - product.reserved, 0)
+        if available < quantity:
+            return ValidationError(
+                f"Недостаточно товара '{product.name}'. Доступно: {available}"
+            )
+    return ValidationError('Остатки изменились, повторите оформление заказа')
+
+
+def create_order(user, quantities, products, order_fields):
+    total = sum(products[product_id].price * quantity
+                for product_id, quantity in quantities.items())
+    order = Order.objects.create(user=user, total_amount=total, **order_fields)
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product=products[product_id],
+            seller_id=products[product_id].farmer_id,
+            quantity=quantity,
+            price=products[product_id].price,
+        )
+        for product_id, quantity in quantities.items()
+    ])
+    return order
+
+
+def place_order(user, items, **order_fields):
+    quantities = normalize_items(items)
+    try:
+        with transaction.atomic():
+            deduct_stock(user, quantities)
+            products = Product.objects.select_for_update().in_bulk(list(quantities))
+            order = create_order(user, quantities, products, order_fields)
+            release(user, list(quantities))
+    except OutOfStock:
+        # Транзакция уже откачена — читаем остатки только ради сообщения
+        raise stock_error(user, quantities)
+    return order
+
+
+def checkout_cart(user, **order_fields):
+    """
+    Оформляет заказ из корзины за фиксированное число запросов: SELECT
+    корзины, UPDATE остатков, SELECT товаров, INSERT заказа и позиций,
+    DELETE резервов и корзины. Как и в place_order, цены читаются после
+    UPDATE, уже под блокировкой, а не вместе с корзиной до неё.
+    """
+    quantities = OrderedDict()
+    try:
+        with transaction.atomic():
+            cart_items = list(
+                CartItem.objects.filter(user=user)
+                .order_by('id')
+                .values_list('id', 'product_id', 'quantity')
+            )
+            if not cart_items:
+                raise ValidationError({'cart': 'Корзина пуста'})
+            for _, product_id, quantity in cart_items:
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            deduct_stock(user, quantities)
+            products = Product.objects.select_for_update().in_bulk(list(quantities))
+            order = create_order(user, quantities, products, order_fields)
+            # Резервы удаляются каскадом вместе с позициями корзины
+            CartItem.objects.filter(pk__in=[cart_item_id for cart_item_id, _, _ in cart_items]).delete()
+    except OutOfStock:
+        raise stock_error(user, quantities)
+    return order
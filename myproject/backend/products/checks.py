@@ -0,0 +1,26 @@
+"""
+Проверки конфигурации (manage.py check).
+
+Версии корзины, категорий и messages-data в products/caching.py
+сбрасываются записью в кэш. В кэше, локальном для процесса, сброс не
+увидят остальные воркеры, и они будут отдавать устаревшие сводки.
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            'Кэш по умолчанию не общий для процессов: сброс версий корзины и '
+            'категорий не дойдёт до других воркеров.',
+            hint='Используйте DatabaseCache или RedisCache (см. CACHES в settings.py).',
+            id='products.W001',
+        )
+    ]
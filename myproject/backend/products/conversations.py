@@ -0,0 +1,221 @@
+"""
+Поддержка таблицы Conversation в актуальном состоянии.
+
+Каждое изменение сообщений, которое меняет список диалогов, вызывает одну
+из функций ниже в той же транзакции:
+
+  record_message  — новое сообщение: последнее сообщение, время активности
+                    и +1 к непрочитанным получателя (F-выражением, без гонок);
+  refresh_unread  — сообщения прочитаны: счётчик читателя пересчитывается
+                    по одному диалогу, поэтому повторное или параллельное
+                    прочтение не уводит его в минус;
+  refresh_last_message — сообщение удалено: последним становится
+                    предыдущее неудалённое, непрочитанные пересчитываются.
+
+Список диалогов, общее число непрочитанных и «есть ли сообщения» читаются
+уже из Conversation по индексам пользователя. Каждое изменение счётчика
+сбрасывает кэш users/messages-data и отправляет сигнал
+unread_counters_changed: по нему chat после коммита шлёт клиенту в
+ws/notifications/ абсолютные значения счётчиков (см. chat/notifications.py).
+"""
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+
+from .caching import invalidate_user_message_data
+from .models import Conversation, Message
+
+MESSAGES_PAGE_SIZE = 50
+
+# Счётчики user_id в диалоге с partner_id изменились. Отправляется внутри
+# транзакции; уведомление клиента (chat/notifications.py) ждёт коммита
+unread_counters_changed = Signal()
+
+
+def ordered_pair(user_id, other_id):
+    return (user_id, other_id) if user_id <= other_id else (other_id, user_id)
+
+
+def conversations_of(user):
+    return Conversation.objects.filter(Q(first_user=user) | Q(second_user=user))
+
+
+def messages_between(user_id, other_id):
+    return Message.objects.filter(
+        Q(sender_id=user_id, recipient_id=other_id) | Q(sender_id=other_id, recipient_id=user_id)
+    )
+
+
+def get_conversation(user_id, other_id):
+    first, second = ordered_pair(user_id, other_id)
+    return Conversation.objects.filter(first_user_id=first, second_user_id=second).first()
+
+
+def message_page(user_id, other_id, before_id=None, after_id=None):
+    """
+    Страница переписки по возрастанию времени: MESSAGES_PAGE_SIZE сообщений
+    до before_id, после after_id или самые свежие. Позиция курсора —
+    (timestamp, id) сообщения-якоря, её читает скалярный подзапрос, так что
+    страница выбирается одним запросом по индексу (sender, recipient, timestamp).
+    """
+    messages = messages_between(user_id, other_id).filter(is_deleted=False).select_related(
+        'sender', 'recipient'
+    )
+    anchor_id = before_id if before_id is not None else after_id
+    if anchor_id is not None:
+        anchor = Message.objects.filter(pk=anchor_id).values('timestamp')
+        if before_id is not None:
+            position = Q(timestamp__lt=Subquery(anchor)) | Q(timestamp=Subquery(anchor), id__lt=anchor_id)
+        else:
+            position = Q(timestamp__gt=Subquery(anchor)) | Q(timestamp=Subquery(anchor), id__gt=anchor_id)
+        messages = messages.filter(position)
+    if after_id is not None:
+        return list(messages.order_by('timestamp', 'id')[:MESSAGES_PAGE_SIZE])
+    page = list(messages.order_by('-timestamp', '-id')[:MESSAGES_PAGE_SIZE])
+    page.reverse()
+    return page
+
+
+def mark_conversation_read(reader, partner_id):
+    """Отмечает прочитанными сообщения собеседника, если счётчик не нулевой."""
+    conversation = get_conversation(reader.id, partner_id)
+    if conversation is None or not conversation.unread_for(reader):
+        return
+    with transaction.atomic():
+        Message.objects.filter(sender_id=partner_id, recipient=reader, is_read=False).update(is_read=True)
+        refresh_unread(reader.id, [partner_id])
+
+
+def unread_counter(conversation_pair, reader_id):
+    """Имя поля-счётчика непрочитанных для reader_id в паре (first, second)."""
+    return 'first_unread' if conversation_pair[0] == reader_id else 'second_unread'
+
+
+def record_message(message):
+    first, second = ordered_pair(message.sender_id, message.recipient_id)
+    counter = unread_counter((first, second), message.recipient_id)
+    with transaction.atomic():
+        conversation, created = Conversation.objects.get_or_create(
+            first_user_id=first,
+            second_user_id=second,
+            defaults={
+                'last_message': message,
+                'last_activity': message.timestamp,
+                counter: 1,
+            },
+        )
+        if created:
+            # У отправителя тоже меняется has_messages
+            invalidate_user_message_data(message.sender_id)
+            unread_counters_changed.send(
+                sender=Conversation, user_id=message.sender_id, partner_id=message.recipient_id
+            )
+        else:
+            Conversation.objects.filter(pk=conversation.pk).update(
+                last_message=message,
+                last_activity=message.timestamp,
+                **{counter: F(counter) + 1},
+            )
+        unread_changed(message.recipient_id, message.sender_id, 1)
+
+
+def unread_changed(user_id, partner_id, delta):
+    """Сбрасывает кэш messages-data и, если счётчик изменился, шлёт его клиенту после коммита."""
+    invalidate_user_message_data(user_id)
+    if delta:
+        unread_counters_changed.send(sender=Conversation, user_id=user_id, partner_id=partner_id)
+
+
+def unread_counters(user_id, partner_id):
+    """Непрочитанные user_id от partner_id, всего и есть ли у него диалоги."""
+    first, second = ordered_pair(user_id, partner_id)
+    counter = unread_counter((first, second), user_id)
+    unread = (
+        Conversation.objects.filter(first_user_id=first, second_user_id=second)
+        .values_list(counter, flat=True)
+        .first()
+    )
+    return unread or 0, unread_total(user_id), unread is not None or has_conversations(user_id)
+
+
+def _unread_subquery(sender_ref, recipient_ref):
+    unread = (
+        Message.objects.filter(
+            sender=sender_ref, recipient=recipient_ref, is_read=False, is_deleted=False
+        )
+        .values('recipient')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    return Coalesce(Subquery(unread, output_field=IntegerField()), 0)
+
+
+def _locked_conversation(first, second, **annotations):
+    # Вызывающий уже изменил сообщения в этой транзакции, поэтому в SQLite
+    # запись сериализована, а в PostgreSQL строку держит FOR UPDATE
+    return (
+        Conversation.objects.select_for_update()
+        .filter(first_user_id=first, second_user_id=second)
+        .annotate(**annotations)
+        .first()
+    )
+
+
+def refresh_unread(reader_id, partner_ids):
+    """Пересчитывает непрочитанные reader_id в диалогах с partner_ids."""
+    for partner_id in set(partner_ids):
+        first, second = ordered_pair(reader_id, partner_id)
+        counter = unread_counter((first, second), reader_id)
+        conversation = _locked_conversation(
+            first, second, actual=_unread_subquery(partner_id, reader_id)
+        )
+        if conversation is None:
+            continue
+        delta = conversation.actual - getattr(conversation, counter)
+        if delta:
+            Conversation.objects.filter(pk=conversation.pk).update(**{counter: conversation.actual})
+        unread_changed(reader_id, partner_id, delta)
+
+
+def refresh_last_message(user_id, other_id):
+    """После удаления сообщения пересчитывает последнее сообщение и оба счётчика."""
+    first, second = ordered_pair(user_id, other_id)
+    latest = (
+        messages_between(first, second)
+        .filter(is_deleted=False)
+        .order_by('-timestamp', '-id')
+        .values('id')[:1]
+    )
+    conversation = _locked_conversation(
+        first,
+        second,
+        actual_last=Subquery(latest),
+        actual_first=_unread_subquery(second, first),
+        actual_second=_unread_subquery(first, second),
+    )
+    if conversation is None:
+        return
+    if first == second:
+        conversation.actual_second = 0
+    Conversation.objects.filter(pk=conversation.pk).update(
+        last_message_id=conversation.actual_last,
+        first_unread=conversation.actual_first,
+        second_unread=conversation.actual_second,
+    )
+    unread_changed(first, second, conversation.actual_first - conversation.first_unread)
+    if first != second:
+        unread_changed(second, first, conversation.actual_second - conversation.second_unread)
+
+
+def unread_total(user):
+    """Сколько непрочитанных сообщений у пользователя во всех диалогах."""
+    totals = conversations_of(user).aggregate(
+        first=Sum('first_unread', filter=Q(first_user=user)),
+        second=Sum('second_unread', filter=Q(second_user=user) & ~Q(first_user=user)),
+    )
+    return (totals['first'] or 0) + (totals['second'] or 0)
+
+
+def has_conversations(user):
+    return conversations_of(user).exists()
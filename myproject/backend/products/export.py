@@ -0,0 +1,76 @@
+"""
+Потоковая выгрузка каталога и заказов в CSV / NDJSON.
+
+Строки читаются через .values().iterator(chunk_size=...), сериализуются по
+одной и сразу уходят клиенту через StreamingHttpResponse, поэтому память
+не растёт с размером таблицы.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Order, OrderItem, Product
+
+CHUNK_SIZE = 2000
+
+EXPORTS = {
+    'products': (
+        Product.objects.all(),
+        [
+            'id', 'name', 'slug', 'description', 'price', 'quantity', 'unit',
+            'category_id', 'category__name', 'farmer_id', 'delivery_available',
+            'seller_address', 'created_at', 'updated_at',
+        ],
+    ),
+    'orders': (
+        Order.objects.all(),
+        [
+            'id', 'user_id', 'user__email', 'status', 'delivery_type', 'payment_method',
+            'total_amount', 'delivery_address', 'pickup_address', 'created_at',
+            'cancel_reason', 'canceled_by_id',
+        ],
+    ),
+    'order-items': (
+        OrderItem.objects.all(),
+        ['id', 'order_id', 'product_id', 'product__name', 'quantity', 'price'],
+    ),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: write() просто возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(resource):
+    queryset, fields = EXPORTS[resource]
+    return fields, queryset.values(*fields).order_by('id').iterator(chunk_size=CHUNK_SIZE)
+
+
+def stream_csv(resource):
+    fields, rows = iter_rows(resource)
+    writer = csv.writer(Echo())
+    # BOM, чтобы Excel корректно открыл кириллицу
+    yield '\ufeff' + writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[field] for field in fields])
+
+
+def stream_ndjson(resource):
+    _, rows = iter_rows(resource)
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
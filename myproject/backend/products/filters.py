@@ -0,0 +1,253 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+TRUE_VALUES = ('1', 'true', 'yes')
+FALSE_VALUES = ('0', 'false', 'no')
+
+
+class ProductFilter:
+    """
+    Серверные фильтры каталога и фасетные счётчики к ним.
+
+    Параметры запроса:
+      category, farmer        — id через запятую;
+      min_price, max_price    — границы цены;
+      delivery_available      — true / false;
+      in_stock                — true (по умолчанию) / false / all.
+
+    Счётчики фасета считаются с учётом всех фильтров, кроме его собственного,
+    чтобы клиент видел, сколько товаров даст каждое значение.
+    """
+
+    def __init__(self, params):
+        self.category = self._parse_ids(params, 'category')
+        self.farmer = self._parse_ids(params, 'farmer')
+        self.min_price = self._parse_price(params, 'min_price')
+        self.max_price = self._parse_price(params, 'max_price')
+        self.delivery_available = self._parse_bool(params, 'delivery_available')
+        if params.get('in_stock', '').lower() == 'all':
+            self.in_stock = None
+        else:
+            self.in_stock = self._parse_bool(params, 'in_stock', default=True)
+
+    @staticmethod
+    def _parse_ids(params, name):
+        value = params.get(name)
+        if not value:
+            return None
+        try:
+            return [int(item) for item in value.split(',') if item.strip()]
+        except ValueError:
+            raise ValidationError({name: 'Ожидается список id через запятую'})
+
+    @staticmethod
+    def _parse_price(params, name):
+        value = params.get(name)
+        if not value:
+            return None
+        try:
+            return Decimal(value)
+        except InvalidOperation:
+            raise ValidationError({name: 'Некорректная цена'})
+
+    @staticmethod
+    def _parse_bool(params, name, default=None):
+        value = params.get(name, '').lower()
+        if not value:
+            return default
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+        raise ValidationError({name: 'Ожидается true или false'})
+
+    def get_conditions(self, exclude=None):
+        conditions = {}
+        if self.category:
+            conditions['category'] = Q(category_id__in=self.category)
+        if self.farmer:
+            conditions['farmer'] = Q(farmer_id__in=self.farmer)
+        price = Q()
+        if self.min_price is not None:
+            price &= Q(price__gte=self.min_price)
+        if self.max_price is not None:
+            price &= Q(price__lte=self.max_price)
+        if price:
+            conditions['price'] = price
+        if self.delivery_available is not None:
+            conditions['delivery_available'] = Q(delivery_available=self.delivery_available)
+        if self.in_stock is not None:
+            conditions['in_stock'] = Q(quantity__gt=0) if self.in_stock else Q(quantity=0)
+        return [condition for name, condition in conditions.items() if name != exclude]
+
+    def filter_queryset(self, queryset, exclude=None):
+        for condition in self.get_conditions(exclude=exclude):
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def _combined_condition(self, exclude):
+        condition = Q()
+        for part in self.get_conditions(exclude=exclude):
+            condition &= part
+        return condition
+
+    def _scalar_facets(self, queryset):
+        """
+        Цена, доставка и наличие — одним aggregate(): у каждого агрегата свой
+        FILTER со всеми условиями, кроме условия его фасета.
+        """
+        excluded = {
+            name: self._combined_condition(exclude=name)
+            for name in ('price', 'delivery_available', 'in_stock')
+        }
+
+        def count(facet, condition=None):
+            facet_condition = excluded[facet]
+            if condition is not None:
+                facet_condition &= condition
+            return Count('id', filter=facet_condition) if facet_condition else Count('id')
+
+        price_filter = excluded['price'] or None
+        row = queryset.aggregate(
+            price_min=Min('price', filter=price_filter),
+            price_max=Max('price', filter=price_filter),
+            price_count=count('price'),
+            delivery_true=count('delivery_available', Q(delivery_available=True)),
+            delivery_false=count('delivery_available', Q(delivery_available=False)),
+            stock_true=count('in_stock', Q(quantity__gt=0)),
+            stock_false=count('in_stock', Q(quantity=0)),
+        )
+        return {
+            'price': {'min': row['price_min'], 'max': row['price_max'], 'count': row['price_count']},
+            'delivery_available': {'true': row['delivery_true'], 'false': row['delivery_false']},
+            'in_stock': {'true': row['stock_true'], 'false': row['stock_false']},
+        }
+
+    def facet_counts(self, queryset):
+        """
+        Три запроса: группировки по категории и по фермеру и один агрегат
+        для остальных фасетов.
+        """
+        facets = {}
+
+        by_category = self.filter_queryset(queryset, exclude='category').values(
+            'category_id', 'category__name'
+        ).annotate(count=Count('id')).order_by('category__name')
+        facets['category'] = [
+            {'id': row['category_id'], 'name': row['category__name'], 'count': row['count']}
+            for row in by_category
+        ]
+
+        by_farmer = self.filter_queryset(queryset, exclude='farmer').values(
+            'farmer_id', 'farmer__first_name', 'farmer__last_name'
+        ).annotate(count=Count('id')).order_by('-count', 'farmer_id')
+        facets['farmer'] = [
+            {
+                'id': row['farmer_id'],
+                'name': f"{row['farmer__first_name']} {row['farmer__last_name']}".strip(),
+                'count': row['count'],
+            }
+            for row in by_farmer
+        ]
+
+        facets.update(self._scalar_facets(queryset))
+        return facets
+
+
+class OrderFilter:
+    """
+    Фильтры списков заказов.
+
+    Параметры запроса:
+      status          — статусы через запятую;
+      date_from       — дата (YYYY-MM-DD) или момент ISO 8601, включительно;
+      date_to         — дата включительно или момент ISO 8601, не включая его;
+      delivery_type   — delivery / pickup;
+      min_amount, max_amount — границы суммы заказа;
+      search          — номер заказа или часть названия товара в нём
+                        (от 3 символов).
+
+    Границы дат переводятся в диапазон по created_at, чтобы работал индекс.
+    """
+
+    MIN_SEARCH_LENGTH = 3
+
+    def __init__(self, params):
+        from .models import Order
+
+        self.status = self._parse_choices(params, 'status', dict(Order.STATUS_CHOICES))
+        self.delivery_type = self._parse_choices(
+            params, 'delivery_type', dict(Order._meta.get_field('delivery_type').choices)
+        )
+        self.date_from = self._parse_moment(params, 'date_from')
+        self.date_to = self._parse_moment(params, 'date_to', end_of_day=True)
+        self.min_amount = ProductFilter._parse_price(params, 'min_amount')
+        self.max_amount = ProductFilter._parse_price(params, 'max_amount')
+        search = params.get('search', '').strip()
+        self.search = search if len(search) >= self.MIN_SEARCH_LENGTH else None
+
+    @staticmethod
+    def _parse_choices(params, name, choices):
+        value = params.get(name)
+        if not value:
+            return None
+        values = [item.strip() for item in value.split(',') if item.strip()]
+        unknown = [item for item in values if item not in choices]
+        if unknown:
+            raise ValidationError({name: f"Недопустимые значения: {', '.join(unknown)}"})
+        return values
+
+    @staticmethod
+    def _parse_moment(params, name, end_of_day=False):
+        value = params.get(name)
+        if not value:
+            return None
+        try:
+            # Сначала дата: parse_datetime принял бы «YYYY-MM-DD» за полночь
+            day = parse_date(value)
+            if day is not None:
+                if end_of_day:
+                    day += timedelta(days=1)
+                moment = datetime.combine(day, time.min)
+            else:
+                moment = parse_datetime(value)
+                if moment is None:
+                    raise ValueError
+        except ValueError:
+            raise ValidationError({name: 'Ожидается дата YYYY-MM-DD или ISO 8601'})
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def filter_queryset(self, queryset):
+        if self.status:
+            queryset = queryset.filter(status__in=self.status)
+        if self.delivery_type:
+            queryset = queryset.filter(delivery_type__in=self.delivery_type)
+        if self.date_from:
+            queryset = queryset.filter(created_at__gte=self.date_from)
+        if self.date_to:
+            queryset = queryset.filter(created_at__lt=self.date_to)
+        if self.min_amount is not None:
+            queryset = queryset.filter(total_amount__gte=self.min_amount)
+        if self.max_amount is not None:
+            queryset = queryset.filter(total_amount__lte=self.max_amount)
+        if self.search:
+            queryset = queryset.filter(self._search_condition())
+        return queryset
+
+    def _search_condition(self):
+        from .models import OrderItem
+
+        # Полусоединение, как и в seller_orders: без DISTINCT по заказу
+        condition = Q(id__in=OrderItem.objects.filter(
+            product__name__icontains=self.search
+        ).values('order_id'))
+        if self.search.isdigit():
+            condition |= Q(id=int(self.search))
+        return condition
@@ -0,0 +1,142 @@
+"""
+Поддержка заголовка Idempotency-Key для небезопасных запросов.
+
+Первый запрос с ключом записывает его в IdempotencyKey (уникально для
+пары пользователь + ключ) вместе с хэшем тела запроса, выполняется и
+сохраняет ответ. Повтор с тем же ключом и телом получает сохранённый
+ответ без повторного выполнения; с другим телом — 422; пока первый
+запрос ещё выполняется — 409. Ответы 5xx и ошибки, выброшенные
+исключением (например, валидации), не сохраняются: ничего не изменив,
+такой запрос можно просто повторить.
+
+Обработчик и сохранение ответа идут в одной транзакции, и ответ
+записывается условным UPDATE по моменту захвата ключа. Поэтому после
+падения процесса ключ перехватывается без риска: незакоммиченный заказ
+откатился вместе с ключом. А если ключ перехватили у ещё живого, но
+медленного запроса, его UPDATE не найдёт строку и заказ откатится.
+
+Ключ действует IDEMPOTENCY_KEY_TTL_HOURS часов: просроченный ключ
+выполняет запрос заново, а записи удаляет cleanup_idempotency_keys.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Ключ, «зависший» после падения процесса, можно перехватить через это время
+LOCK_TIMEOUT = timedelta(minutes=5)
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def key_ttl():
+    return timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+
+
+def _claim(user, key, request_hash):
+    """Записывает ключ. Возвращает (запись, True) или (существующая запись, False)."""
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user, key=key, request_hash=request_hash, expires_at=now + key_ttl()
+            )
+            return record, True
+    except IntegrityError:
+        record = IdempotencyKey.objects.get(user=user, key=key)
+    if record.expires_at <= now:
+        # Просроченный ключ больше ни от чего не защищает: выполняем запрос заново
+        IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+        return _claim(user, key, request_hash)
+    if record.status_code is None and record.request_hash == request_hash:
+        taken_over = IdempotencyKey.objects.filter(
+            pk=record.pk, status_code__isnull=True, created_at__lt=now - LOCK_TIMEOUT
+        ).update(created_at=now)
+        if taken_over:
+            record.created_at = now
+            return record, True
+    return record, False
+
+
+def _owned(record):
+    """Ключ, пока им владеет этот запрос: его не перехватили и ответ не записан."""
+    return IdempotencyKey.objects.filter(
+        pk=record.pk, status_code__isnull=True, created_at=record.created_at
+    )
+
+
+def in_progress_response():
+    return Response(
+        {"error": "Запрос с этим ключом ещё выполняется"},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+def idempotent_response(request, handler):
+    """Выполняет handler() не более одного раза на Idempotency-Key пользователя."""
+    key = request.headers.get(HEADER)
+    if not key:
+        return handler()
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {"error": f"{HEADER} длиннее {MAX_KEY_LENGTH} символов"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    request_hash = request_fingerprint(request)
+    record, claimed = _claim(request.user, key, request_hash)
+    if not claimed:
+        if record.request_hash != request_hash:
+            return Response(
+                {"error": "Ключ идемпотентности уже использован с другим запросом"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if record.status_code is None:
+            return in_progress_response()
+        response = Response(record.response, status=record.status_code)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    try:
+        with transaction.atomic():
+            response = handler()
+            if response.status_code >= 500:
+                transaction.set_rollback(True)
+            elif not _owned(record).update(status_code=response.status_code, response=response.data):
+                # Ключ перехватил другой запрос — результат этого откатываем
+                transaction.set_rollback(True)
+                return in_progress_response()
+    except Exception:
+        _owned(record).delete()
+        raise
+    if response.status_code >= 500:
+        _owned(record).delete()
+    return response
+
+
+def delete_expired_keys():
+    """Удаляет просроченные ключи идемпотентности."""
+    return IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+class IdempotentCreateMixin:
+    """Делает create() вьюсета идемпотентным по заголовку Idempotency-Key."""
+
+    def create(self, request, *args, **kwargs):
+        parent = super()
+        return idempotent_response(request, lambda: parent.create(request, *args, **kwargs))
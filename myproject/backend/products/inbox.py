@@ -0,0 +1,30 @@
+"""
+Список диалогов пользователя одним запросом.
+
+Диалоги читаются из Conversation (см. conversations.py) вместе с обоими
+участниками и последним сообщением через JOIN. Сортировка и курсорная
+пагинация идут по last_activity по индексам пользователя.
+"""
+from .conversations import conversations_of
+
+INBOX_ORDERING = ('-last_activity', '-id')
+
+
+def inbox_queryset(user):
+    return (
+        conversations_of(user)
+        .select_related('first_user', 'second_user', 'last_message')
+        .order_by(*INBOX_ORDERING)
+    )
+
+
+def last_message_of(conversation):
+    """Последнее сообщение с отправителем и получателем из уже загруженной пары."""
+    message = conversation.last_message
+    if message is None or message.is_deleted:
+        return None
+    users = {conversation.first_user_id: conversation.first_user,
+             conversation.second_user_id: conversation.second_user}
+    message.sender = users[message.sender_id]
+    message.recipient = users[message.recipient_id]
+    return message
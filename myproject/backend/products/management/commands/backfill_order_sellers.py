@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.sellers import backfill_sellers
+
+
+class Command(BaseCommand):
+    help = 'Проставляет продавца позициям заказов, где он не заполнен'
+
+    def handle(self, *args, **kwargs):
+        count = backfill_sellers()
+        self.stdout.write(self.style.SUCCESS(f'✅ Обновлено позиций заказов: {count}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from products.thumbnails import backfill_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Отмечает готовые превью изображений и ставит в очередь создание недостающих'
+
+    def handle(self, *args, **kwargs):
+        marked, queued = backfill_thumbnails()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Отмечено готовых превью: {marked}, поставлено в очередь: {queued}'
+        ))
@@ -0,0 +1,162 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from products.conversations import MESSAGES_PAGE_SIZE
+from products.models import Message
+
+User = get_user_model()
+
+BATCH_SIZE = 10000
+# Схема до оптимизации: только одиночные индексы внешних ключей
+BASELINE_INDEXES = [
+    models.Index(fields=['sender'], name='bench_message_sender_idx'),
+    models.Index(fields=['recipient'], name='bench_message_recipient_idx'),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает планы и время запросов к сообщениям на старой схеме индексов '
+        'и на Message.Meta.indexes. Данные создаются в транзакции и откатываются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000, help='Сколько сообщений создать')
+        parser.add_argument('--users', type=int, default=2000, help='Сколько пользователей создать')
+        parser.add_argument('--partners', type=int, default=20, help='Собеседников у пользователя')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого запроса')
+        parser.add_argument(
+            '--i-know',
+            action='store_true',
+            help='Запустить при DEBUG=False: индексы сообщений снимаются на всё время бенчмарка',
+        )
+
+    def handle(self, *args, **options):
+        # Индексы Message удаляются внутри длинной транзакции: в PostgreSQL
+        # это ACCESS EXCLUSIVE на таблицу, и чат стоит до отката
+        if not settings.DEBUG and not options['i_know']:
+            raise CommandError(
+                'Бенчмарк удаляет индексы сообщений и блокирует таблицу до конца работы. '
+                'Запускайте его на копии базы с DEBUG=True или добавьте --i-know'
+            )
+        random.seed(42)
+        try:
+            with transaction.atomic():
+                self.benchmark(options)
+                raise Rollback()
+        except Rollback:
+            self.stdout.write(self.style.SUCCESS('✅ Данные бенчмарка откачены'))
+
+    def benchmark(self, options):
+        # Индексы создаются после вставки: так и вставка быстрее
+        self.switch_indexes(drop=Message._meta.indexes, create=[])
+        users = self.seed_users(options['users'])
+        self.seed_messages(users, options['messages'], options['partners'])
+        probe = self.pick_probe()
+
+        self.switch_indexes(drop=[], create=BASELINE_INDEXES)
+        self.stdout.write(self.style.MIGRATE_HEADING('До: индексы sender и recipient'))
+        before = self.measure(probe, options['repeat'])
+
+        self.switch_indexes(drop=BASELINE_INDEXES, create=Message._meta.indexes)
+        self.stdout.write(self.style.MIGRATE_HEADING('После: Message.Meta.indexes'))
+        after = self.measure(probe, options['repeat'])
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Итог, мс на запрос'))
+        for name in before:
+            self.stdout.write(f'{name:<28} {before[name]:>10.3f} → {after[name]:>10.3f}')
+
+    def switch_indexes(self, drop, create):
+        # Не через «with schema_editor()»: в SQLite он не работает внутри транзакции
+        editor = connection.schema_editor()
+        statements = [index.remove_sql(Message, editor) for index in drop]
+        statements += [index.create_sql(Message, editor) for index in create]
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(str(statement))
+            cursor.execute('ANALYZE')
+
+    def seed_users(self, count):
+        prefix = f'bench{int(time.time())}'
+        User.objects.bulk_create(
+            [
+                User(username=f'{prefix}_{i}', email=f'{prefix}_{i}@example.com', password='!')
+                for i in range(count)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        return list(User.objects.filter(username__startswith=prefix).values_list('id', flat=True))
+
+    def seed_messages(self, users, count, partners_per_user):
+        partners = {
+            user_id: random.sample(users, min(partners_per_user, len(users)))
+            for user_id in users
+        }
+        start = timezone.now() - timedelta(days=365)
+        step = timedelta(days=365) / count
+
+        # Как и generate_orders, временно отключаем auto_now_add, чтобы задать время
+        timestamp_field = Message._meta.get_field('timestamp')
+        timestamp_field.auto_now_add = False
+        try:
+            for offset in range(0, count, BATCH_SIZE):
+                batch = []
+                for i in range(offset, min(offset + BATCH_SIZE, count)):
+                    sender = random.choice(users)
+                    age = count - i
+                    batch.append(Message(
+                        sender_id=sender,
+                        recipient_id=random.choice(partners[sender]),
+                        content='Сообщение для бенчмарка',
+                        timestamp=start + step * i,
+                        # Непрочитаны в основном последние сообщения
+                        is_read=age > 20000 or random.random() < 0.5,
+                        is_deleted=random.random() < 0.02,
+                    ))
+                Message.objects.bulk_create(batch)
+                self.stdout.write(f'  создано сообщений: {offset + len(batch)}', ending='\r')
+        finally:
+            timestamp_field.auto_now_add = True
+        self.stdout.write('')
+
+    def pick_probe(self):
+        message = Message.objects.order_by('-id').first()
+        return message.recipient_id, message.sender_id
+
+    def measure(self, probe, repeat):
+        user_id, partner_id = probe
+        unread = Message.objects.filter(is_read=False, is_deleted=False)
+        conversation = Message.objects.filter(
+            Q(sender_id=user_id, recipient_id=partner_id) | Q(sender_id=partner_id, recipient_id=user_id),
+            is_deleted=False,
+        ).order_by('-timestamp', '-id')[:MESSAGES_PAGE_SIZE]
+        queries = [
+            ('unread_count', unread.filter(recipient_id=user_id), lambda qs: qs.count()),
+            ('unread_in_conversation', unread.filter(sender_id=partner_id, recipient_id=user_id),
+             lambda qs: qs.count()),
+            ('has_messages', Message.objects.filter(Q(sender_id=user_id) | Q(recipient_id=user_id)),
+             lambda qs: qs.exists()),
+            ('conversation_page', conversation, lambda qs: list(qs)),
+        ]
+        timings = {}
+        for name, queryset, run in queries:
+            self.stdout.write(f'\n{name}:')
+            self.stdout.write(queryset.explain())
+            started = time.perf_counter()
+            for _ in range(repeat):
+                run(queryset.all())
+            timings[name] = (time.perf_counter() - started) / repeat * 1000
+            self.stdout.write(f'  {timings[name]:.3f} мс')
+        return timings
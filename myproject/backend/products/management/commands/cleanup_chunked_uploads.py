@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.uploads import delete_expired_uploads
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные загрузки файлов частями'
+
+    def handle(self, *args, **kwargs):
+        count = delete_expired_uploads()
+        self.stdout.write(self.style.SUCCESS(f'✅ Удалено незавершённых загрузок: {count}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.idempotency import delete_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Удаляет просроченные ключи идемпотентности'
+
+    def handle(self, *args, **kwargs):
+        count = delete_expired_keys()
+        self.stdout.write(self.style.SUCCESS(f'✅ Удалено просроченных ключей: {count}'))
@@ -88,7 +88,10 @@ class Command(BaseCommand):
                 for product in selected_products:
                     quantity = random.randint(1, 10)
                     price = product.price
-                    order_item = OrderItem(order=order, product=product, quantity=quantity, price=price)
+                    order_item = OrderItem(
+                        order=order, product=product, seller_id=product.farmer_id,
+                        quantity=quantity, price=price
+                    )
                     order_items.append(order_item)
 
                 # Вычисляем общую сумму
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from products import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс товаров'
+
+    def handle(self, *args, **kwargs):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING('Полнотекстовый поиск не поддерживается этой СУБД'))
+            return
+        search.create_search_table()
+        search.rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS('✅ Поисковый индекс пересобран'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Снимает просроченные резервы товаров в корзинах'
+
+    def handle(self, *args, **kwargs):
+        count = release_expired()
+        self.stdout.write(self.style.SUCCESS(f'✅ Снято просроченных резервов: {count}'))
@@ -0,0 +1,30 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from products.tasks import requeue_stale, run_pending
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркер фоновых задач (обработка загруженных файлов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить очередь и завершиться')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Пауза при пустой очереди, сек.')
+        parser.add_argument('--stale-minutes', type=int, default=30,
+                            help='Через сколько минут задача в статусе running считается зависшей')
+
+    def handle(self, *args, **options):
+        stale_timeout = timedelta(minutes=options['stale_minutes'])
+        while True:
+            requeued = requeue_stale(stale_timeout)
+            if requeued:
+                self.stdout.write(self.style.WARNING(f'Возвращено в очередь зависших задач: {requeued}'))
+            processed = run_pending()
+            if processed:
+                self.stdout.write(f'Выполнено задач: {processed}')
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['sleep'])
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# SQL заморожен здесь, а не берётся из products/search.py: последующие
+# правки модуля не должны менять то, что делает эта миграция
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_product_search USING fts5("
+    "name, category, description, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+    "DELETE FROM products_product_search",
+    "INSERT INTO products_product_search (rowid, name, category, description) "
+    "SELECT p.id, p.name, c.name, p.description FROM products_product p "
+    "JOIN products_category c ON c.id = p.category_id",
+]
+
+POSTGRESQL_CREATE = [
+    "CREATE TABLE IF NOT EXISTS products_product_search ("
+    "product_id bigint PRIMARY KEY REFERENCES products_product (id) "
+    "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS products_product_search_document_idx "
+    "ON products_product_search USING GIN (document)",
+    "DELETE FROM products_product_search",
+    "INSERT INTO products_product_search (product_id, document) "
+    "SELECT p.id, "
+    "setweight(to_tsvector('russian', coalesce(p.name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(c.name, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(p.description, '')), 'C') "
+    "FROM products_product p JOIN products_category c ON c.id = p.category_id "
+    "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+]
+
+CREATE_STATEMENTS = {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRESQL_CREATE}
+
+
+def create_search_index(apps, schema_editor):
+    for statement in CREATE_STATEMENTS.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_STATEMENTS:
+        schema_editor.execute("DROP TABLE IF EXISTS products_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0022_product_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
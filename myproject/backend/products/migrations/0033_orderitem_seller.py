@@ -0,0 +1,36 @@
+# Generated by Django 5.0.14 on 2026-10-18 03:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_sellers(apps, schema_editor):
+    OrderItem = apps.get_model('products', 'OrderItem')
+    Product = apps.get_model('products', 'Product')
+    farmer = Product.objects.filter(pk=OuterRef('product_id')).values('farmer_id')[:1]
+    OrderItem.objects.filter(seller__isnull=True, product__isnull=False).update(
+        seller_id=Subquery(farmer)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0032_seller_order_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='seller',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sold_items', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_sellers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['seller', 'order'], name='orderitem_seller_order_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.14 on 2026-10-18 03:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_conversations(apps, schema_editor):
+    Message = apps.get_model('products', 'Message')
+    Conversation = apps.get_model('products', 'Conversation')
+    conversations = {}
+    messages = Message.objects.order_by('timestamp', 'id').values_list(
+        'id', 'sender_id', 'recipient_id', 'timestamp', 'is_read', 'is_deleted'
+    )
+    for message_id, sender_id, recipient_id, timestamp, is_read, is_deleted in messages.iterator():
+        pair = tuple(sorted((sender_id, recipient_id)))
+        conversation = conversations.get(pair)
+        if conversation is None:
+            conversation = conversations[pair] = Conversation(
+                first_user_id=pair[0], second_user_id=pair[1], last_activity=timestamp
+            )
+        conversation.last_activity = timestamp
+        if not is_deleted:
+            conversation.last_message_id = message_id
+            if not is_read:
+                if recipient_id == pair[0]:
+                    conversation.first_unread += 1
+                else:
+                    conversation.second_unread += 1
+    Conversation.objects.bulk_create(conversations.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0033_orderitem_seller'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_activity', models.DateTimeField()),
+                ('first_unread', models.PositiveIntegerField(default=0)),
+                ('second_unread', models.PositiveIntegerField(default=0)),
+                ('first_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.message')),
+                ('second_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['first_user', '-last_activity', '-id'], name='conversation_first_idx'), models.Index(fields=['second_user', '-last_activity', '-id'], name='conversation_second_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('first_user', 'second_user'), name='conversation_pair_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.CheckConstraint(check=models.Q(('first_user__lte', models.F('second_user'))), name='conversation_pair_ordered'),
+        ),
+        migrations.RunPython(build_conversations, migrations.RunPython.noop),
+    ]
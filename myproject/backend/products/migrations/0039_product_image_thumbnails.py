@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 03:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0038_backgroundtask_run_after'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_thumbnails',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-18 03:59
+
+from datetime import timedelta
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_expires_at(apps, schema_editor):
+    IdempotencyKey = apps.get_model('products', 'IdempotencyKey')
+    IdempotencyKey.objects.update(
+        expires_at=F('created_at') + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0039_product_image_thumbnails'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='expires_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_expires_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='idempotencykey',
+            index=models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from django.utils.text import slugify
 from django.core.exceptions import ValidationError  
 import uuid
@@ -14,20 +16,37 @@ class Product(models.Model):
     unit = models.CharField(max_length=20, default="шт")
     category = models.ForeignKey("Category", on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Имя файла, для которого фоновая задача создала превью (см. products/thumbnails.py)
+    image_thumbnails = models.CharField(max_length=100, blank=True, default='', editable=False)
     farmer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     delivery_available = models.BooleanField(default=False, verbose_name="Доступна доставка")
     seller_address = models.TextField(blank=True, null=True, verbose_name="Адрес продавца")
+
+    class Meta:
+        indexes = [
+            # Keyset-пагинация каталога идёт по (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            # Фильтры и фасеты каталога
+            models.Index(fields=['category', 'quantity'], name='product_category_qty_idx'),
+            models.Index(fields=['farmer', 'created_at'], name='product_farmer_created_idx'),
+            models.Index(fields=['delivery_available', 'quantity'], name='product_delivery_qty_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
+    @staticmethod
+    def build_slug(name):
+        # Используется и в bulk_create, где save() не вызывается
+        return f"{slugify(name)}-{uuid.uuid4().hex[:6]}"
+
     def save(self, *args, **kwargs):
         # Обновляем slug при изменении названия
         if not self.slug or self._state.adding:
-            base_slug = slugify(self.name)
-            unique_id = uuid.uuid4().hex[:6]
-            self.slug = f"{base_slug}-{unique_id}"
+            self.slug = self.build_slug(self.name)
         super().save(*args, **kwargs)
 
 class Category(models.Model):
@@ -51,6 +70,11 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='cartitem_user_product_uniq'),
+        ]
+
     def clean(self):
         if self.quantity < 1:
             raise ValidationError("Количество не может быть меньше 1")
@@ -59,6 +83,25 @@ class CartItem(models.Model):
         self.full_clean()
         super().save(*args, **kwargs)
 
+class StockReservation(models.Model):
+    """Резерв товара под позицию корзины; действует до expires_at."""
+    cart_item = models.OneToOneField(CartItem, on_delete=models.CASCADE, related_name='reservation')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Сумма активных резервов по товару и поиск просроченных
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_exp_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} x{self.quantity} до {self.expires_at:%H:%M}"
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('processing', 'В обработке'),
@@ -101,6 +144,14 @@ class Order(models.Model):
         verbose_name="Отменен пользователем"
     )
 
+    class Meta:
+        indexes = [
+            # Список заказов покупателя с курсорной пагинацией
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            # Заказы продавца: обход по времени с отбором по id из позиций
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} - {self.user.email}"
 
@@ -112,26 +163,98 @@ class OrderItem(models.Model):
         null=True,
         blank=True
     )
+    # Продавец на момент заказа: копия product.farmer, переживает удаление товара
+    seller = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='sold_items'
+    )
     # Удалено ошибочное поле slug
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            # Покрывающий индекс для «заказов продавца»: продавец → заказ
+            models.Index(fields=['seller', 'order'], name='orderitem_seller_order_idx'),
+        ]
+
     def __str__(self):
         if self.product:
             return f"{self.product.name} x{self.quantity}"
         return f"Удаленный продукт x{self.quantity}"
 
 class Message(models.Model):
-    sender = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="sent_messages", on_delete=models.CASCADE)
-    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="received_messages", on_delete=models.CASCADE)
+    # Одиночные индексы внешних ключей не нужны: с sender и recipient
+    # начинаются составные индексы из Meta
+    sender = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="sent_messages", on_delete=models.CASCADE, db_index=False
+    )
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="received_messages", on_delete=models.CASCADE, db_index=False
+    )
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     is_deleted = models.BooleanField(default=False)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Переписка пары по времени: каждое направление — диапазон индекса
+            models.Index(fields=['sender', 'recipient', 'timestamp'], name='message_pair_time_idx'),
+            # «Есть ли переписка» со стороны получателя
+            models.Index(fields=['recipient', 'sender'], name='message_recipient_sender_idx'),
+            # Непрочитанные: маленький частичный индекс только по живым непрочитанным
+            models.Index(
+                fields=['recipient', 'sender'],
+                name='message_unread_idx',
+                condition=models.Q(is_read=False, is_deleted=False),
+            ),
+        ]
+
     def __str__(self):
         return f"Message from {self.sender} to {self.recipient}"
 
+class Conversation(models.Model):
+    """
+    Диалог двух пользователей: first_user.id <= second_user.id. Последнее
+    сообщение и непрочитанные каждой стороны обновляются вместе с сообщениями
+    (см. conversations.py), чтобы список диалогов не собирался из Message.
+    """
+    first_user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE)
+    second_user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE)
+    last_message = models.ForeignKey(
+        Message, related_name='+', on_delete=models.SET_NULL, null=True, blank=True
+    )
+    last_activity = models.DateTimeField()
+    # Непрочитанные сообщения, адресованные first_user / second_user
+    first_unread = models.PositiveIntegerField(default=0)
+    second_unread = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['first_user', 'second_user'], name='conversation_pair_uniq'),
+            models.CheckConstraint(
+                check=models.Q(first_user__lte=models.F('second_user')), name='conversation_pair_ordered'
+            ),
+        ]
+        indexes = [
+            # Диалоги пользователя по времени активности — с любой стороны пары
+            models.Index(fields=['first_user', '-last_activity', '-id'], name='conversation_first_idx'),
+            models.Index(fields=['second_user', '-last_activity', '-id'], name='conversation_second_idx'),
+        ]
+
+    def __str__(self):
+        return f"Conversation {self.first_user_id} <-> {self.second_user_id}"
+
+    def partner_of(self, user):
+        return self.second_user if self.first_user_id == user.id else self.first_user
+
+    def unread_for(self, user):
+        return self.first_unread if self.first_user_id == user.id else self.second_unread
+
 class Review(models.Model):
     STATUS_CHOICES = [
         ('pending', 'На рассмотрении'),
@@ -157,6 +280,107 @@ class Review(models.Model):
     def __str__(self):
         return f"Review by {self.author} for {self.recipient}"
 
+class BackgroundTask(models.Model):
+    """Задача фоновой очереди; выполняется командой manage.py run_tasks."""
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнена'),
+        ('failed', 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # Раньше этого момента задачу не берут: так повторы идут с паузой
+    run_after = models.DateTimeField(default=timezone.now)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='background_tasks'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Под выборку воркера: status = 'pending' AND run_after <= now ORDER BY run_after
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+class IdempotencyKey(models.Model):
+    """Результат запроса с заголовком Idempotency-Key (см. products/idempotency.py)."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys'
+    )
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    # Пока запрос выполняется, status_code пуст
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # После этого момента ключ не действует; запись удаляет cleanup_idempotency_keys
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'выполняется'})"
+
+class ChunkedUpload(models.Model):
+    """Незавершённая загрузка файла частями (см. products/uploads.py)."""
+    PURPOSE_CHOICES = [
+        ('chat', 'Вложение в чат'),
+        ('user_media', 'Медиафайл профиля'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='chunked_uploads'
+    )
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES)
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    received_chunks = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def chunk_length(self, index):
+        if index == self.total_chunks - 1:
+            return self.total_size - index * self.chunk_size
+        return self.chunk_size
+
+    @property
+    def is_complete(self):
+        return len(self.received_chunks) == self.total_chunks
+
+    def __str__(self):
+        return f"{self.filename} ({len(self.received_chunks)}/{self.total_chunks})"
+
 def add_categories():
     from products.models import Category
     categories = [
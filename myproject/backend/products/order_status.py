@@ -0,0 +1,103 @@
+"""
+Переходы статусов заказа.
+
+Продавец двигает заказ только вперёд по STATUS_SEQUENCE (через шаги
+перескакивать можно); доставленный и отменённый заказы больше не меняются,
+а отмена идёт отдельным действием cancel. Из этого правила для любого
+целевого статуса выводится множество допустимых исходных, поэтому пачка
+заказов переводится одним условным UPDATE:
+
+    UPDATE products_order SET status = 'shipped'
+     WHERE id IN (...) AND status IN ('processing', 'confirmed')
+
+Условие по статусу повторяет проверку в самом UPDATE, так что заказ,
+который параллельно успели отменить, не «оживёт».
+"""
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import Order
+from .sellers import seller_orders
+
+STATUS_SEQUENCE = ['processing', 'confirmed', 'shipped', 'in_transit', 'delivered']
+MAX_BULK_ORDERS = 100
+
+NOT_SELLER_ERROR = 'Вы не можете изменить статус этого заказа'
+CONFLICT_ERROR = 'Статус заказа изменился, обновите страницу'
+
+
+def allowed_sources(new_status):
+    """Статусы, из которых продавец может перевести заказ в new_status."""
+    if new_status not in STATUS_SEQUENCE:
+        return []
+    return STATUS_SEQUENCE[:STATUS_SEQUENCE.index(new_status)]
+
+
+def transition_error(current_status, new_status):
+    """Почему заказ нельзя перевести из current_status в new_status (None — можно)."""
+    if new_status not in dict(Order.STATUS_CHOICES):
+        return 'Недопустимый статус заказа'
+    if current_status == 'canceled':
+        return 'Нельзя изменить статус отмененного заказа'
+    if current_status == 'delivered':
+        return 'Нельзя изменить статус доставленного заказа'
+    if current_status not in allowed_sources(new_status):
+        return 'Невозможно вернуться к предыдущему статусу'
+    return None
+
+
+def parse_order_ids(value):
+    if not isinstance(value, list) or not value:
+        raise ValidationError({'order_ids': 'Передайте непустой список ID заказов'})
+    if len(value) > MAX_BULK_ORDERS:
+        raise ValidationError({'order_ids': f'Не больше {MAX_BULK_ORDERS} заказов за раз'})
+    try:
+        return list(dict.fromkeys(int(order_id) for order_id in value))
+    except (TypeError, ValueError):
+        raise ValidationError({'order_ids': 'Некорректный ID заказа'})
+
+
+def transition_orders(seller, order_ids, new_status):
+    """
+    Переводит заказы продавца в new_status. Возвращает результаты в порядке
+    order_ids: {'id', 'success', 'status'} или {'id', 'success', 'error'}.
+    Запросов три при любом числе заказов: чтение статусов, UPDATE и, только
+    если UPDATE задел меньше строк, чем ожидалось, перечитывание.
+    """
+    if new_status not in dict(Order.STATUS_CHOICES):
+        raise ValidationError({'status': 'Недопустимый статус заказа'})
+    sources = allowed_sources(new_status)
+    with transaction.atomic():
+        current = dict(
+            seller_orders(seller)
+            .filter(id__in=order_ids)
+            .select_for_update(of=('self',))
+            .values_list('id', 'status')
+        )
+        errors = {}
+        for order_id in order_ids:
+            if order_id not in current:
+                errors[order_id] = NOT_SELLER_ERROR
+            else:
+                error = transition_error(current[order_id], new_status)
+                if error:
+                    errors[order_id] = error
+        movable = [order_id for order_id in order_ids if order_id not in errors]
+        if movable:
+            updated = Order.objects.filter(id__in=movable, status__in=sources).update(
+                status=new_status
+            )
+            if updated != len(movable):
+                # Без блокировок строк (SQLite) статус мог измениться между запросами
+                now = dict(Order.objects.filter(id__in=movable).values_list('id', 'status'))
+                for order_id in movable:
+                    if now.get(order_id) != new_status:
+                        errors[order_id] = CONFLICT_ERROR
+
+    results = []
+    for order_id in order_ids:
+        if order_id in errors:
+            results.append({'id': order_id, 'success': False, 'error': errors[order_id]})
+        else:
+            results.append({'id': order_id, 'success': True, 'status': new_status})
+    return results
@@ -0,0 +1,36 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация, которая включается только по запросу клиента.
+
+    Без параметров ``cursor`` / ``page_size`` эндпоинт отдаёт обычный список,
+    как и раньше, поэтому существующий фронтенд продолжает работать.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        # Вью может задать свой порядок, например по релевантности поиска
+        if hasattr(view, 'get_cursor_ordering'):
+            return view.get_cursor_ordering()
+        return super().get_ordering(request, queryset, view)
+
+
+class DefaultCursorPagination(OptionalCursorPagination):
+    """
+    Та же keyset-пагинация, но включённая всегда: для списков, которые без
+    страниц растут неограниченно (например, заказы продавца).
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return CursorPagination.paginate_queryset(self, queryset, request, view)
@@ -0,0 +1,77 @@
+"""
+Резервирование товара на время, пока он лежит в корзине.
+
+Добавление в корзину создаёт (или продлевает) StockReservation на
+STOCK_RESERVATION_TTL_MINUTES минут. Доступный остаток товара —
+quantity минус сумма активных резервов других покупателей; он считается
+коррелированным подзапросом в том же SELECT, что и сам товар. Просроченные
+резервы просто перестают учитываться, а физически их удаляет команда
+manage.py release_expired_reservations.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Product, StockReservation
+
+
+def reservation_ttl():
+    return timedelta(minutes=settings.STOCK_RESERVATION_TTL_MINUTES)
+
+
+def reserved_quantity(exclude_user=None, product_ref='pk'):
+    """Подзапрос: сумма активных резервов по товару (0, если резервов нет)."""
+    reservations = StockReservation.objects.filter(
+        product=OuterRef(product_ref), expires_at__gt=timezone.now()
+    )
+    if exclude_user is not None:
+        reservations = reservations.exclude(user=exclude_user)
+    total = reservations.values('product').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(total, output_field=IntegerField()), 0)
+
+
+def annotate_available(queryset):
+    return queryset.annotate(available=F('quantity') - reserved_quantity())
+
+
+def reserve(cart_item):
+    """
+    Резервирует cart_item.quantity единиц товара и продлевает срок резерва.
+    Вызывается внутри транзакции, сохранившей позицию корзины: при нехватке
+    товара ValidationError откатывает и её.
+    """
+    with transaction.atomic():
+        product = (
+            Product.objects.select_for_update()
+            .annotate(reserved=reserved_quantity(exclude_user=cart_item.user_id))
+            .get(pk=cart_item.product_id)
+        )
+        available = product.quantity - product.reserved
+        if cart_item.quantity > available:
+            raise ValidationError(
+                f"Недостаточно товара '{product.name}'. Доступно: {max(available, 0)}"
+            )
+        StockReservation.objects.update_or_create(
+            cart_item=cart_item,
+            defaults={
+                'product_id': cart_item.product_id,
+                'user_id': cart_item.user_id,
+                'quantity': cart_item.quantity,
+                'expires_at': timezone.now() + reservation_ttl(),
+            },
+        )
+
+
+def release(user, product_ids):
+    """Снимает резервы покупателя, например после оформления заказа."""
+    return StockReservation.objects.filter(user=user, product_id__in=product_ids).delete()[0]
+
+
+def release_expired():
+    """Удаляет просроченные резервы одним DELETE. Возвращает их число."""
+    return StockReservation.objects.filter(expires_at__lte=timezone.now()).delete()[0]
@@ -0,0 +1,187 @@
+"""
+Полнотекстовый поиск по товарам (название, категория, описание).
+
+SQLite: виртуальная таблица FTS5 (rowid = id товара), ранжирование bm25().
+PostgreSQL: таблица с tsvector и GIN-индексом, ранжирование ts_rank().
+На остальных СУБД поиск деградирует до icontains без ранжирования.
+
+Индекс обновляется сигналами (см. products/signals.py), полностью
+пересобирается командой rebuild_search_index. Таблицу создаёт миграция
+0023 со своей замороженной копией SQL — при изменении схемы индекса здесь
+нужна новая миграция.
+Аннотация ``search_rank``: чем меньше значение, тем релевантнее товар.
+"""
+import re
+
+from django.db import connection as default_connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'products_product_search'
+PRODUCT_TABLE = 'products_product'
+CATEGORY_TABLE = 'products_category'
+
+# Веса колонок: название важнее категории, категория важнее описания
+NAME_WEIGHT, CATEGORY_WEIGHT, DESCRIPTION_WEIGHT = 10.0, 5.0, 1.0
+MAX_TERMS = 8
+BATCH_SIZE = 500
+
+
+def is_supported(connection=None):
+    connection = connection or default_connection
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def _terms(query):
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def _match_expression(connection, terms):
+    # Каждое слово ищем по префиксу, чтобы работал поиск «по мере ввода»
+    if connection.vendor == 'sqlite':
+        return ' '.join(f'"{term}"*' for term in terms)
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def create_search_table(connection=None):
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                "name, category, description, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+                f"product_id bigint PRIMARY KEY REFERENCES {PRODUCT_TABLE} (id) "
+                "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                "document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx "
+                f"ON {SEARCH_TABLE} USING GIN (document)"
+            )
+
+
+def drop_search_table(connection=None):
+    connection = connection or default_connection
+    if is_supported(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+def index_products(product_ids, connection=None):
+    """Переиндексирует товары с указанными id пачками по BATCH_SIZE."""
+    connection = connection or default_connection
+    product_ids = list(product_ids)
+    if not product_ids or not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            batch = product_ids[start:start + BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", batch
+                )
+                cursor.execute(
+                    f"INSERT INTO {SEARCH_TABLE} (rowid, name, category, description) "
+                    f"SELECT p.id, p.name, c.name, p.description FROM {PRODUCT_TABLE} p "
+                    f"JOIN {CATEGORY_TABLE} c ON c.id = p.category_id "
+                    f"WHERE p.id IN ({placeholders})",
+                    batch,
+                )
+            else:
+                cursor.execute(
+                    f"INSERT INTO {SEARCH_TABLE} (product_id, document) "
+                    "SELECT p.id, "
+                    "setweight(to_tsvector('russian', coalesce(p.name, '')), 'A') || "
+                    "setweight(to_tsvector('russian', coalesce(c.name, '')), 'B') || "
+                    "setweight(to_tsvector('russian', coalesce(p.description, '')), 'C') "
+                    f"FROM {PRODUCT_TABLE} p JOIN {CATEGORY_TABLE} c ON c.id = p.category_id "
+                    f"WHERE p.id IN ({placeholders}) "
+                    "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                    batch,
+                )
+
+
+def remove_products(product_ids, connection=None):
+    connection = connection or default_connection
+    product_ids = list(product_ids)
+    if not product_ids or not is_supported(connection):
+        return
+    column = 'rowid' if connection.vendor == 'sqlite' else 'product_id'
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            batch = product_ids[start:start + BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE {column} IN ({placeholders})", batch
+            )
+
+
+def rebuild_search_index(connection=None):
+    """Полностью пересобирает индекс по всем товарам."""
+    connection = connection or default_connection
+    if not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(f"SELECT id FROM {PRODUCT_TABLE}")
+        product_ids = [row[0] for row in cursor.fetchall()]
+    index_products(product_ids, connection)
+
+
+def search_products(queryset, query, ranked=True):
+    """
+    Фильтрует queryset товаров по поисковой строке и добавляет аннотацию
+    ``search_rank`` (по возрастанию — от самых релевантных).
+    С ranked=False только фильтрует — например, для агрегатов.
+    """
+    connection = default_connection
+    terms = _terms(query)
+    no_rank = Value(0.0, output_field=FloatField())
+    if not terms:
+        queryset = queryset.none()
+        return queryset.annotate(search_rank=no_rank) if ranked else queryset
+
+    if not is_supported(connection):
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(name__icontains=term)
+                | Q(description__icontains=term)
+                | Q(category__name__icontains=term)
+            )
+        queryset = queryset.filter(condition)
+        return queryset.annotate(search_rank=no_rank) if ranked else queryset
+
+    match = _match_expression(connection, terms)
+    product_id = f'"{PRODUCT_TABLE}"."id"'
+    if connection.vendor == 'sqlite':
+        matched_ids = RawSQL(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", (match,)
+        )
+        rank = RawSQL(
+            f"SELECT bm25({SEARCH_TABLE}, {NAME_WEIGHT}, {CATEGORY_WEIGHT}, {DESCRIPTION_WEIGHT}) "
+            f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND rowid = {product_id}",
+            (match,),
+            output_field=FloatField(),
+        )
+    else:
+        matched_ids = RawSQL(
+            f"SELECT product_id FROM {SEARCH_TABLE} "
+            "WHERE document @@ to_tsquery('russian', %s)",
+            (match,),
+        )
+        # ts_rank растёт с релевантностью, меняем знак для единого порядка
+        rank = RawSQL(
+            f"SELECT -ts_rank(document, to_tsquery('russian', %s)) "
+            f"FROM {SEARCH_TABLE} WHERE product_id = {product_id}",
+            (match,),
+            output_field=FloatField(),
+        )
+    queryset = queryset.filter(id__in=matched_ids)
+    return queryset.annotate(search_rank=rank) if ranked else queryset
@@ -0,0 +1,33 @@
+"""
+Запросы «со стороны продавца» через денормализованный OrderItem.seller.
+
+Раньше каждый такой запрос шёл через items__product__farmer — соединение
+трёх таблиц, которое к тому же теряет позиции удалённых товаров
+(OrderItem.product обнуляется). Теперь продавец записывается в позицию при
+оформлении заказа, а заказы продавца выбираются подзапросом по индексу
+orderitem (seller_id, order_id) без DISTINCT.
+"""
+from django.db.models import OuterRef, Subquery
+
+from .models import Order, OrderItem, Product
+
+
+def seller_items(seller):
+    return OrderItem.objects.filter(seller=seller)
+
+
+def seller_orders(seller):
+    """Заказы, в которых есть хотя бы одна позиция продавца (без дублей)."""
+    return Order.objects.filter(id__in=seller_items(seller).values('order_id'))
+
+
+def is_order_seller(order, seller):
+    return seller_items(seller).filter(order=order).exists()
+
+
+def backfill_sellers():
+    """Проставляет seller позициям, где он ещё пуст, одним UPDATE."""
+    farmer = Product.objects.filter(pk=OuterRef('product_id')).values('farmer_id')[:1]
+    return OrderItem.objects.filter(
+        seller__isnull=True, product__isnull=False
+    ).update(seller_id=Subquery(farmer))
@@ -1,12 +1,14 @@
 from rest_framework import serializers
-from .models import Product, Category, CartItem, Order, OrderItem, Message, Review
-from django.db import transaction
-from django.core.exceptions import ValidationError
-from django.db.models import F
+from .models import Product, Category, CartItem, Order, OrderItem, Message, Review, BackgroundTask
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
 from authentication.models import CustomUser 
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from authentication.serializers import UserMediaSerializer
+from .checkout import place_order
+from .inbox import last_message_of
+from .sellers import seller_orders
+from .thumbnails import get_srcset
 
 User = get_user_model()
 
@@ -43,12 +45,14 @@ class ProductSerializer(serializers.ModelSerializer):
         required=True
     )
     farmer_name = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    available = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = [
-            'id', 'name', 'description', 'price', 'quantity',
-            'unit', 'category', 'category_id', 'image',
+            'id', 'name', 'description', 'price', 'quantity', 'available',
+            'unit', 'category', 'category_id', 'image', 'image_srcset',
             'farmer', 'farmer_name', 'created_at',
             'is_owner', 'editable', 'delivery_available', 'seller_address'
         ]
@@ -60,6 +64,14 @@ class ProductSerializer(serializers.ModelSerializer):
     def get_farmer_name(self, obj):
         return f"{obj.farmer.first_name} {obj.farmer.last_name}" if obj.farmer else "Неизвестный производитель"
 
+    def get_image_srcset(self, obj):
+        return get_srcset(obj, 'image', self.context.get('request'))
+
+    def get_available(self, obj):
+        # Аннотацию добавляет каталог; без неё резервы не учитываются
+        available = getattr(obj, 'available', obj.quantity)
+        return max(available, 0)
+
     def get_is_owner(self, obj):
         request = self.context.get('request')
         return request and request.user == obj.farmer
@@ -114,11 +126,12 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
 class UserSerializer(serializers.ModelSerializer):
     avatar = serializers.ImageField(required=False, allow_null=True)
+    avatar_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = [
-            "id", "username", "email", "avatar", "first_name", "last_name",
+            "id", "username", "email", "avatar", "avatar_srcset", "first_name", "last_name",
             "middle_name", "phone", "show_phone", "is_staff", "bio"
         ]
         extra_kwargs = {
@@ -134,6 +147,9 @@ class UserSerializer(serializers.ModelSerializer):
             return obj.avatar.url
         return None
 
+    def get_avatar_srcset(self, obj):
+        return get_srcset(obj, "avatar", self.context.get("request"))
+
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     status_display = serializers.SerializerMethodField()
@@ -151,6 +167,16 @@ class OrderSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['user', 'total_amount', 'canceled_by']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Всё, что читает сериализатор, загружается двумя запросами на
+        страницу: заказы с покупателем и отменившим, позиции с товаром и продавцом.
+        """
+        return queryset.select_related('user', 'canceled_by').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product__farmer'))
+        )
+
     def get_status_display(self, obj):
         return dict(Order.STATUS_CHOICES).get(obj.status, "Неизвестный статус")
 
@@ -170,36 +196,7 @@ class OrderSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data.pop('user', None)
         items_data = validated_data.pop('items', [])
-        user = self.context['request'].user
-
-        total = 0
-        products_to_update = []
-
-        for item_data in items_data:
-            product_id = item_data.get('product')
-            quantity = item_data.get('quantity', 1)
-            try:
-                product = Product.objects.get(id=product_id)
-            except Product.DoesNotExist:
-                raise ValidationError({'product': f'Продукт с ID {product_id} не найден'})
-            if product.quantity < quantity:
-                raise ValidationError(
-                    f"Недостаточно товара '{product.name}'. Доступно: {product.quantity}"
-                )
-            total += product.price * quantity
-            products_to_update.append((product, quantity))
-
-        with transaction.atomic():
-            order = Order.objects.create(user=user, total_amount=total, **validated_data)
-            OrderItem.objects.bulk_create([
-                OrderItem(order=order, product=product, quantity=quantity, price=product.price)
-                for product, quantity in products_to_update
-            ])
-            for product, quantity in products_to_update:
-                product.quantity = F('quantity') - quantity
-                product.save()
-
-        return order
+        return place_order(self.context['request'].user, items_data, **validated_data)
 
 class UserProfileSerializer(serializers.ModelSerializer):
     average_rating = serializers.FloatField(read_only=True)
@@ -215,7 +212,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         }
 
     def get_successful_deals(self, obj):
-        return Order.objects.filter(items__product__farmer=obj, status='delivered').distinct().count()
+        return seller_orders(obj).filter(status='delivered').count()
 
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
@@ -231,6 +228,17 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ["id", "sender", "recipient", "recipient_id", "content", "timestamp", "is_deleted"]
         read_only_fields = ["sender", "timestamp", "is_deleted"]
 
+class ConversationSerializer(serializers.BaseSerializer):
+    """Диалог в виде собеседника с последним сообщением и числом непрочитанных."""
+
+    def to_representation(self, conversation):
+        user = self.context["request"].user
+        data = UserSerializer(conversation.partner_of(user), context=self.context).data
+        message = last_message_of(conversation)
+        data["last_message"] = MessageSerializer(message).data if message else None
+        data["unread_count"] = conversation.unread_for(user)
+        return data
+
 class ReviewSerializer(serializers.ModelSerializer):
     author = serializers.PrimaryKeyRelatedField(read_only=True)
     author_name = serializers.SerializerMethodField()
@@ -245,9 +253,46 @@ class ReviewSerializer(serializers.ModelSerializer):
     def get_author_name(self, obj):
         return f"{obj.author.first_name} {obj.author.last_name}"
 
+class BackgroundTaskSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BackgroundTask
+        fields = ["id", "name", "status", "result", "error", "attempts", "created_at", "started_at", "finished_at"]
+        read_only_fields = fields
+
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
         data = super().validate(attrs)
         data['is_staff'] = self.user.is_staff
         data['is_superuser'] = self.user.is_superuser
-        return data
\ No newline at end of file
+        return data
+
+class ProductBulkRowSerializer(serializers.Serializer):
+    """Строка массового импорта. Строка с id обновляет существующий товар продавца."""
+    id = serializers.IntegerField(required=False, min_value=1)
+    name = serializers.CharField(max_length=100)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    quantity = serializers.IntegerField(min_value=0, default=0)
+    unit = serializers.CharField(max_length=20, required=False, default='шт')
+    category_id = serializers.IntegerField(required=False)
+    category = serializers.CharField(required=False, help_text='Название категории')
+    delivery_available = serializers.BooleanField(required=False, default=False)
+    seller_address = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate(self, data):
+        # Категории загружены заранее, чтобы не делать запрос на каждую строку
+        categories = self.context['categories']
+        category_names = self.context['category_names']
+        if 'category_id' in data:
+            category = categories.get(data.pop('category_id'))
+            if category is None:
+                raise serializers.ValidationError({'category_id': 'Категория не найдена'})
+            data['category'] = category
+        elif 'category' in data:
+            category = category_names.get(data['category'].strip().lower())
+            if category is None:
+                raise serializers.ValidationError({'category': 'Категория не найдена'})
+            data['category'] = category
+        elif not self.partial:
+            raise serializers.ValidationError({'category_id': 'Обязательное поле.'})
+        return data
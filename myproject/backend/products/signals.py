@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import search
+from .caching import bump_categories_version, invalidate_cart_summary, invalidate_user_message_data
+from .models import CartItem, Category, OrderItem, Product
+from .thumbnails import thumbnails_ready
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def create_product_thumbnails(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image and not thumbnails_ready(instance, 'image'):
+        from .tasks import enqueue_once
+
+        # Правки цены или остатка до прихода воркера не плодят задачи
+        enqueue_once('process_image', {'model': 'products.Product', 'pk': instance.pk, 'field': 'image'})
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created=False, raw=False, **kwargs):
+    # Название категории входит в поисковый документ товара
+    if not created and not raw:
+        search.index_products(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories_cache(sender, **kwargs):
+    bump_categories_version()
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart(sender, instance, **kwargs):
+    invalidate_cart_summary(instance.user_id)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_carts_with_product(sender, instance, created=False, raw=False, **kwargs):
+    # Итог корзины зависит от цены товара
+    if not created and not raw:
+        invalidate_cart_summary(
+            *CartItem.objects.filter(product=instance).values_list('user_id', flat=True)
+        )
+
+
+@receiver(pre_save, sender=OrderItem)
+def fill_order_item_seller(sender, instance, raw=False, **kwargs):
+    # Продавец фиксируется в позиции, чтобы пережить удаление товара
+    if not raw and instance.seller_id is None and instance.product_id is not None:
+        instance.seller_id = instance.product.farmer_id
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_message_data(sender, instance, **kwargs):
+    # Профиль входит в ответ users/messages-data
+    invalidate_user_message_data(instance.pk)
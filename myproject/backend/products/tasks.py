@@ -0,0 +1,208 @@
+"""
+Простая фоновая очередь задач поверх таблицы BackgroundTask.
+
+Задачи регистрируются декоратором @task и ставятся в очередь через
+enqueue(). Воркер (manage.py run_tasks) забирает задачу условным UPDATE по
+статусу, поэтому несколько воркеров не выполнят одну задачу дважды.
+Упавшая задача повторяется до MAX_ATTEMPTS раз с растущей паузой
+(RETRY_DELAY, затем вдвое больше); PermanentTaskError повторов не получает.
+"""
+import logging
+import mimetypes
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from .models import BackgroundTask
+from .thumbnails import ensure_thumbnails, state_field
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = timedelta(seconds=30)
+
+_registry = {}
+
+
+class PermanentTaskError(Exception):
+    """Ошибка, которую повтор не исправит, — например, файл не является изображением."""
+
+
+def task(func):
+    _registry[func.__name__] = func
+    return func
+
+
+def enqueue(name, payload=None, user=None):
+    if name not in _registry:
+        raise ValueError(f"Неизвестная задача: {name}")
+    return BackgroundTask.objects.create(name=name, payload=payload or {}, user=user)
+
+
+def enqueue_once(name, payload=None, user=None):
+    """
+    Как enqueue, но не ставит дубль, пока такая же задача ждёт в очереди:
+    она и так возьмёт актуальное состояние объекта. Возвращает задачу из
+    очереди или новую.
+    """
+    payload = payload or {}
+    lookups = {f'payload__{key}': value for key, value in payload.items()}
+    pending = BackgroundTask.objects.filter(name=name, status='pending', **lookups).first()
+    return pending or enqueue(name, payload, user=user)
+
+
+def claim_next():
+    """Забирает задачу, раньше всех ставшую доступной, или возвращает None."""
+    while True:
+        candidate = (
+            BackgroundTask.objects.filter(status='pending', run_after__lte=timezone.now())
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if candidate is None:
+            return None
+        claimed = BackgroundTask.objects.filter(id=candidate, status='pending').update(
+            status='running', started_at=timezone.now(), attempts=F('attempts') + 1
+        )
+        if claimed:
+            return BackgroundTask.objects.get(id=candidate)
+        # Задачу перехватил другой воркер — пробуем следующую
+
+
+def run_task(background_task):
+    func = _registry.get(background_task.name)
+    try:
+        if func is None:
+            raise ValueError(f"Неизвестная задача: {background_task.name}")
+        background_task.result = func(**background_task.payload)
+        background_task.status = 'done'
+        background_task.error = None
+    except Exception as exc:
+        logger.exception("Задача %s завершилась с ошибкой", background_task)
+        background_task.error = traceback.format_exc(limit=5)
+        retry = (
+            func is not None
+            and not isinstance(exc, PermanentTaskError)
+            and background_task.attempts < MAX_ATTEMPTS
+        )
+        background_task.status = 'pending' if retry else 'failed'
+    background_task.finished_at = timezone.now()
+    if background_task.status == 'pending':
+        background_task.run_after = (
+            background_task.finished_at + RETRY_DELAY * 2 ** (background_task.attempts - 1)
+        )
+    background_task.save(update_fields=['result', 'status', 'error', 'run_after', 'finished_at'])
+    return background_task
+
+
+def requeue_stale(timeout=timedelta(minutes=30)):
+    """
+    Возвращает в очередь задачи, «зависшие» после падения воркера. Задача,
+    исчерпавшая MAX_ATTEMPTS, помечается failed: раз за разом роняющая
+    воркер задача не должна повторяться бесконечно.
+    """
+    now = timezone.now()
+    stale = BackgroundTask.objects.filter(status='running', started_at__lt=now - timeout)
+    stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status='failed', error='Воркер завершился, не закончив задачу', finished_at=now
+    )
+    return stale.filter(attempts__lt=MAX_ATTEMPTS).update(status='pending')
+
+
+def run_pending(limit=None):
+    """Выполняет задачи из очереди, пока она не опустеет. Возвращает число задач."""
+    processed = 0
+    while limit is None or processed < limit:
+        background_task = claim_next()
+        if background_task is None:
+            break
+        run_task(background_task)
+        processed += 1
+    return processed
+
+
+def _image_metadata(storage, name):
+    try:
+        with storage.open(name, 'rb') as source:
+            with Image.open(source) as image:
+                width, height, image_format = image.width, image.height, image.format
+                image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError) as exc:
+        raise PermanentTaskError(f"Файл {name} не является корректным изображением: {exc}")
+    return {'width': width, 'height': height, 'format': image_format}
+
+
+def _auto_now_fields(model):
+    return [f.name for f in model._meta.concrete_fields if getattr(f, 'auto_now', False)]
+
+
+def _mark_thumbnails(instance, field, name):
+    """Записывает в <поле>_thumbnails имя файла, для которого готовы превью."""
+    model = type(instance)
+    state = state_field(field)
+    if not any(f.name == state for f in model._meta.concrete_fields):
+        return
+    # updated_at сдвигаем, чтобы сменился ETag ответа со srcset
+    values = {auto_now: timezone.now() for auto_now in _auto_now_fields(model)}
+    values[state] = name
+    # Условие по имени: если файл успели заменить, отметка ему не достанется
+    model.objects.filter(pk=instance.pk, **{field: name}).update(**values)
+
+
+def _discard_invalid_file(instance, field):
+    """
+    Удаляет файл, который не открылся как изображение. Необязательное поле
+    (фото товара, аватар) очищается, а объект, который без файла не имеет
+    смысла (медиафайл, фото заявки продавца), удаляется целиком.
+    """
+    getattr(instance, field).delete(save=False)
+    if instance._meta.get_field(field).blank:
+        # auto_now-поля тоже обновляем: от updated_at зависит ETag товара
+        instance.save(update_fields=[field, *_auto_now_fields(type(instance))])
+    else:
+        instance.delete()
+
+
+@task
+def process_image(model, pk, field):
+    """Проверяет загруженное изображение, извлекает метаданные и создаёт превью."""
+    instance = apps.get_model(model).objects.filter(pk=pk).first()
+    if instance is None:
+        return {'skipped': 'объект удалён'}
+    fieldfile = getattr(instance, field)
+    if not fieldfile:
+        return {'skipped': 'файл не загружен'}
+    try:
+        metadata = _image_metadata(fieldfile.storage, fieldfile.name)
+    except PermanentTaskError:
+        _discard_invalid_file(instance, field)
+        raise
+    metadata['size'] = fieldfile.size
+    metadata['thumbnails'] = ensure_thumbnails(fieldfile)
+    if metadata['thumbnails']:
+        _mark_thumbnails(instance, field, fieldfile.name)
+    return metadata
+
+
+@task
+def process_uploaded_file(name):
+    """Метаданные файла из чата; для изображений — ещё и проверка с превью."""
+    if not default_storage.exists(name):
+        return {'skipped': 'файл удалён'}
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    metadata = {'size': default_storage.size(name), 'content_type': content_type}
+    if content_type.startswith('image/'):
+        try:
+            metadata.update(_image_metadata(default_storage, name))
+        except PermanentTaskError:
+            # Как и в process_image: битое «изображение» не должно раздаваться
+            default_storage.delete(name)
+            raise
+        metadata['thumbnails'] = ensure_thumbnails(name)
+    return metadata
@@ -1,11 +1,92 @@
-from django.test import TestCase
-from rest_framework.test import APIClient
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from datetime import datetime, timedelta
+
+from PIL import Image
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from django.contrib.auth import get_user_model
+from authentication.models import UserMedia
+from products import checkout
+from products.cart import increment_cart_item
+from products.checkout import place_order
+from products.checks import check_shared_cache
+from products.idempotency import idempotent_response
+from products.conversations import (
+    MESSAGES_PAGE_SIZE,
+    get_conversation,
+    record_message,
+    refresh_last_message,
+    refresh_unread,
+)
+from products.models import (
+    BackgroundTask, CartItem, Category, Conversation, IdempotencyKey, Message, Order, OrderItem, Product, StockReservation,
+)
+from products.tasks import MAX_ATTEMPTS, RETRY_DELAY, enqueue, requeue_stale, run_pending, task
+from products.views import GPTAssistantView
+from products.thumbnails import (
+    THUMBNAIL_WIDTHS,
+    delete_thumbnails,
+    generate_thumbnails,
+    has_thumbnails,
+    thumbnail_name,
+)
 
 User = get_user_model()
 
+
+# Кэш в памяти процесса вместо DatabaseCache — так в тестах ведёт себя
+# Redis: обращения к кэшу не идут в БД и не попадают в счётчик запросов
+IN_MEMORY_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_user(username, **fields):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com', password='password123', **fields
+    )
+
+
+class MarketFixtureMixin:
+    """
+    Общая обстановка тестов товаров, корзины и заказов: категория «Овощи»,
+    продавец farmer, покупатель buyer и API-клиент. Товары создаёт
+    make_product.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Овощи')
+        self.farmer = make_user('farmer')
+        self.buyer = make_user('buyer')
+
+    def make_product(self, name='Морковь', price=50, quantity=10, farmer=None, **fields):
+        return Product.objects.create(
+            name=name, description='', price=price, quantity=quantity,
+            category=self.category, farmer=farmer or self.farmer, **fields
+        )
+
+
 class RegisterViewTest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -98,4 +179,1515 @@ class RegisterViewTest(TestCase):
         response = self.client.post(self.register_url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('email', response.data)
-        self.assertEqual(User.objects.count(), 1)
\ No newline at end of file
+        self.assertEqual(User.objects.count(), 1)
+
+class ProductListTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('product-list')
+        self.category = Category.objects.create(name='Овощи')
+        self.farmers = [
+            User.objects.create_user(
+                username=f'farmer{i}', email=f'farmer{i}@example.com',
+                password='password123', first_name='Farmer', last_name=str(i)
+            )
+            for i in range(3)
+        ]
+
+    def create_products(self, count):
+        for i in range(count):
+            Product.objects.create(
+                name=f'Product {i}', description='desc', price=10, quantity=5,
+                category=self.category, farmer=self.farmers[i % len(self.farmers)]
+            )
+
+    def test_unpaginated_list_by_default(self):
+        """Без параметров пагинации эндпоинт по-прежнему отдаёт простой список."""
+        self.create_products(3)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 3)
+
+    def test_cursor_pagination_walks_all_products(self):
+        """Переходы по курсорам `next` обходят каждый товар ровно один раз, от новых к старым."""
+        self.create_products(7)
+        seen = []
+        response = self.client.get(self.url, {'page_size': 3})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        """Категория и продавец берутся JOIN, поэтому страница любого размера стоит одинаковое число запросов."""
+        self.create_products(30)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'page_size': 25})
+        self.assertEqual(len(response.data['results']), 25)
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('product-list')
+        self.vegetables = Category.objects.create(name='Овощи')
+        self.dairy = Category.objects.create(name='Молочные продукты')
+        self.farmer = User.objects.create_user(
+            username='farmer', email='farmer@example.com', password='password123'
+        )
+
+    def create_product(self, name, description='', category=None):
+        return Product.objects.create(
+            name=name, description=description, price=10, quantity=5,
+            category=category or self.vegetables, farmer=self.farmer
+        )
+
+    def search(self, query):
+        response = self.client.get(self.url, {'q': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in response.data]
+
+    def test_name_match_ranks_above_description_match(self):
+        """Совпадение в названии товара ранжируется выше совпадения в описании."""
+        self.create_product('Сыр домашний', description='Без добавок')
+        self.create_product('Творог', description='Отлично подходит к сыру и ягодам')
+        self.create_product('Морковь')
+        self.assertEqual(self.search('сыр'), ['Сыр домашний', 'Творог'])
+
+    def test_prefix_and_category_search(self):
+        """Слова ищутся по префиксу, название категории тоже участвует в поиске."""
+        self.create_product('Молоко', category=self.dairy)
+        self.create_product('Морковь')
+        self.assertEqual(self.search('морк'), ['Морковь'])
+        self.assertEqual(self.search('молочные'), ['Молоко'])
+
+    def test_index_follows_updates_and_deletes(self):
+        """Сигналы поддерживают индекс при изменении товаров и категорий."""
+        product = self.create_product('Картофель')
+        product.name = 'Свёкла'
+        product.save()
+        self.assertEqual(self.search('картофель'), [])
+        self.assertEqual(self.search('свёкла'), ['Свёкла'])
+
+        self.vegetables.name = 'Корнеплоды'
+        self.vegetables.save()
+        self.assertEqual(self.search('корнеплоды'), ['Свёкла'])
+
+        product.delete()
+        self.assertEqual(self.search('свёкла'), [])
+
+    def test_query_syntax_is_not_passed_through(self):
+        """Операторы FTS во вводе пользователя считаются обычными словами."""
+        self.create_product('Мёд липовый')
+        self.assertEqual(self.search('"мёд*'), ['Мёд липовый'])
+        self.assertEqual(self.search('***'), [])
+
+    def test_search_results_can_be_paginated(self):
+        """Курсорная пагинация сохраняет порядок по релевантности между страницами."""
+        for i in range(5):
+            self.create_product(f'Яблоки сорт {i}')
+        self.create_product('Груша', description='Вкуснее, чем яблоки')
+        response = self.client.get(self.url, {'q': 'яблоки', 'page_size': 2})
+        names = []
+        while True:
+            names.extend(item['name'] for item in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(len(names), 6)
+        self.assertEqual(names[-1], 'Груша')
+
+    def test_assistant_partial_match_keeps_original_name(self):
+        """Запасной поиск ассистента ищет и по исходному названию ингредиента, а не только по очищенному."""
+        other = Category.objects.create(name='Разное')
+        self.create_product('Помидоры черри', category=other)
+        matches = GPTAssistantView()._find_products_for_ingredient('Помидоры', '- Помидоры 300 г')
+        self.assertEqual([match['name'] for match in matches], ['Помидоры черри'])
+        self.assertEqual(matches[0]['match_type'], 'partial_match')
+
+
+class ProductFilterTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.vegetables = Category.objects.create(name='Овощи')
+        self.fruits = Category.objects.create(name='Фрукты')
+        self.alice = User.objects.create_user(
+            username='alice', email='alice@example.com', password='password123',
+            first_name='Alice', last_name='Farm'
+        )
+        self.bob = User.objects.create_user(
+            username='bob', email='bob@example.com', password='password123',
+            first_name='Bob', last_name='Farm'
+        )
+        for name, category, farmer, price, quantity, delivery in [
+            ('Морковь', self.vegetables, self.alice, 50, 10, True),
+            ('Картофель', self.vegetables, self.bob, 30, 0, False),
+            ('Яблоки', self.fruits, self.alice, 120, 3, False),
+            ('Груши', self.fruits, self.bob, 150, 7, True),
+        ]:
+            Product.objects.create(
+                name=name, description='', price=price, quantity=quantity,
+                category=category, farmer=farmer, delivery_available=delivery
+            )
+
+    def list_names(self, **params):
+        response = self.client.get(reverse('product-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['name'] for item in response.data)
+
+    def test_filters(self):
+        """Фильтры комбинируются, а in_stock по умолчанию оставляет только товары в наличии."""
+        self.assertEqual(self.list_names(), ['Груши', 'Морковь', 'Яблоки'])
+        self.assertEqual(self.list_names(in_stock='all', category=self.vegetables.id), ['Картофель', 'Морковь'])
+        self.assertEqual(self.list_names(in_stock='false'), ['Картофель'])
+        self.assertEqual(self.list_names(farmer=self.alice.id, delivery_available='true'), ['Морковь'])
+        self.assertEqual(self.list_names(min_price=100, max_price=130), ['Яблоки'])
+
+    def test_invalid_filter_value(self):
+        response = self.client.get(reverse('product-list'), {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('min_price', response.data)
+
+    def test_facet_counts_ignore_own_filter(self):
+        """Каждый фасет считается со всеми фильтрами, кроме своего; скалярные фасеты — одним запросом."""
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse('product-facets'), {'category': self.fruits.id, 'delivery_available': 'true'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        facets = response.data
+        self.assertEqual(
+            {row['name']: row['count'] for row in facets['category']},
+            {'Овощи': 1, 'Фрукты': 1},
+        )
+        self.assertEqual([row['count'] for row in facets['farmer']], [1])
+        self.assertEqual(facets['delivery_available'], {'true': 1, 'false': 1})
+        self.assertEqual(facets['in_stock'], {'true': 1, 'false': 0})
+        self.assertEqual(facets['price'], {'min': 150, 'max': 150, 'count': 1})
+
+    def test_facet_counts_without_filters(self):
+        response = self.client.get(reverse('product-facets'), {'in_stock': 'all'})
+        facets = response.data
+        self.assertEqual(facets['price'], {'min': 30, 'max': 150, 'count': 4})
+        self.assertEqual(facets['delivery_available'], {'true': 2, 'false': 2})
+        self.assertEqual(facets['in_stock'], {'true': 3, 'false': 1})
+
+
+class CategoryListTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('category-list')
+        Category.objects.create(name='Овощи')
+
+    @override_settings(CACHES=IN_MEMORY_CACHES)
+    def test_not_modified_without_db_queries(self):
+        """Клиент с актуальным ETag получает 304 без запросов к БД."""
+        cache.clear()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data], ['Овощи'])
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_database_cache_reads_version_from_cache_table(self):
+        etag = self.client.get(self.url)['ETag']
+        # С DatabaseCache версия читается из таблицы кэша: для ETag и для Last-Modified
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_category_changes_invalidate_cache(self):
+        """Сохранение или удаление категории меняет ETag и содержимое ответа."""
+        etag = self.client.get(self.url)['ETag']
+        fruits = Category.objects.create(name='Фрукты')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data], ['Овощи', 'Фрукты'])
+
+        fruits.delete()
+        response = self.client.get(self.url)
+        self.assertEqual([item['name'] for item in response.data], ['Овощи'])
+
+
+@override_settings(CACHES=IN_MEMORY_CACHES)
+class ProductConditionalGetTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.product = self.make_product()
+
+    def assert_revalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        # Один запрос отпечатка; сериализатор не запускается
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.product.price = 55
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_product_detail(self):
+        self.assert_revalidates(reverse('product-detail', args=[self.product.id]))
+
+    def test_user_products_list(self):
+        self.assert_revalidates(reverse('user-products', args=[self.farmer.id]))
+
+    def test_deleting_a_product_changes_list_etag(self):
+        url = reverse('user-products', args=[self.farmer.id])
+        extra = Product.objects.create(
+            name='Лук', description='', price=20, quantity=10,
+            category=self.category, farmer=self.farmer
+        )
+        etag = self.client.get(url)['ETag']
+        extra.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+
+    def test_etag_depends_on_viewer(self):
+        """is_owner/editable зависят от пользователя, поэтому владелец не получает ETag анонима."""
+        url = reverse('product-detail', args=[self.product.id])
+        etag = self.client.get(url)['ETag']
+        self.client.force_authenticate(self.farmer)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_owner'])
+
+
+class ProductBulkImportTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('product-bulk-import')
+        self.client.force_authenticate(self.farmer)
+
+    def test_json_import_creates_updates_and_reports_errors(self):
+        existing = self.make_product()
+        rows = [
+            {'name': 'Картофель', 'price': '30.00', 'quantity': 100, 'category_id': self.category.id},
+            {'name': 'Картофель', 'price': '35.00', 'quantity': 5, 'category': 'овощи'},
+            {'id': existing.id, 'quantity': 3},
+            {'name': 'Без цены', 'category_id': self.category.id},
+            {'name': 'Лук', 'price': '10', 'category_id': 999},
+        ]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([error['row'] for error in response.data['errors']], [4, 5])
+
+        existing.refresh_from_db()
+        self.assertEqual(existing.quantity, 3)
+        self.assertEqual(existing.price, 50)
+        slugs = list(Product.objects.values_list('slug', flat=True))
+        self.assertEqual(len(slugs), len(set(slugs)))
+        # bulk_create обходит сигналы, импорт индексирует строки сам
+        response = self.client.get(reverse('product-list'), {'q': 'картофель', 'in_stock': 'all'})
+        self.assertEqual(len(response.data), 0)  # own products are hidden from the catalog
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse('product-list'), {'q': 'картофель'})
+        self.assertEqual(len(response.data), 2)
+
+    def test_cannot_update_foreign_product(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='x')
+        product = Product.objects.create(
+            name='Морковь', description='', price=50, quantity=10,
+            category=self.category, farmer=other
+        )
+        response = self.client.post(self.url, [{'id': product.id, 'quantity': 0}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 10)
+
+    def test_csv_import(self):
+        content = (
+            'name;price;quantity;category;delivery_available\n'
+            'Свёкла;25.50;40;Овощи;true\n'
+            'Редис;;10;Овощи;false\n'
+        ).encode('utf-8')
+        upload = SimpleUploadedFile('products.csv', content, content_type='text/csv')
+        response = self.client.post(self.url + '?delimiter=;', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        product = Product.objects.get(name='Свёкла')
+        self.assertTrue(product.delivery_available)
+        self.assertEqual(product.farmer, self.farmer)
+
+
+class AdminExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='password123', is_staff=True
+        )
+        category = Category.objects.create(name='Овощи')
+        for i in range(3):
+            Product.objects.create(
+                name=f'Товар {i}', description='', price=10, quantity=i,
+                category=category, farmer=self.admin
+            )
+
+    def test_requires_admin(self):
+        user = User.objects.create_user(username='user', email='user@example.com', password='x')
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('admin-export', args=['products', 'csv']))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_csv_export_streams_all_rows(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('admin-export', args=['products', 'csv']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('id,name,slug'))
+        self.assertIn('Товар 2', lines[3])
+
+    def test_ndjson_export(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('admin-export', args=['products', 'ndjson']))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['quantity'] for row in rows], [0, 1, 2])
+        self.assertEqual(rows[0]['category__name'], 'Овощи')
+
+
+def make_image(name='photo.jpg', size=(1200, 800)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color=(200, 80, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ThumbnailTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_thumbnails_created_by_worker(self):
+        product = self.make_product(image=make_image())
+        task = BackgroundTask.objects.get(name='process_image')
+        self.assertEqual(task.status, 'pending')
+        self.assertEqual(run_pending(), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'done')
+        self.assertEqual(task.result['width'], 1200)
+
+        for width in THUMBNAIL_WIDTHS:
+            with Image.open(os.path.join(self.media_root, thumbnail_name(product.image.name, width))) as thumb:
+                self.assertEqual(thumb.width, width)
+                self.assertAlmostEqual(thumb.height, width * 2 / 3, delta=1)
+
+        response = self.client.get(reverse('product-detail', args=[product.id]))
+        srcset = response.data['image_srcset']
+        self.assertEqual(sorted(srcset, key=int), [str(width) for width in THUMBNAIL_WIDTHS])
+        self.assertTrue(srcset['160'].startswith('http://testserver/media/thumbnails/160/'))
+
+    def test_srcset_is_empty_until_worker_runs(self):
+        """Запрос никогда не рендерит превью: srcset пуст, пока не отработала задача."""
+        product = self.make_product(image=make_image(size=(100, 100)))
+        response = self.client.get(reverse('product-detail', args=[product.id]))
+        self.assertIsNone(response.data['image_srcset'])
+        self.assertFalse(has_thumbnails(product.image))
+
+        run_pending()
+        response = self.client.get(reverse('product-detail', args=[product.id]))
+        self.assertIsNotNone(response.data['image_srcset'])
+        # Маленькие оригиналы не увеличиваются
+        with Image.open(os.path.join(self.media_root, thumbnail_name(product.image.name, 640))) as thumb:
+            self.assertEqual(thumb.width, 100)
+
+    def test_srcset_does_not_touch_storage(self):
+        """Готовность читается из image_thumbnails, а не проверяется в хранилище для каждой строки."""
+        product = self.make_product(image=make_image())
+        run_pending()
+        product.refresh_from_db()
+        self.assertEqual(product.image_thumbnails, product.image.name)
+        with mock.patch('django.core.files.storage.FileSystemStorage.exists') as exists:
+            response = self.client.get(reverse('product-list'))
+        exists.assert_not_called()
+        self.assertIsNotNone(response.data[0]['image_srcset'])
+
+        # Новый файл считается необработанным, пока задача не отметит его
+        product.image = make_image(name='other.jpg')
+        product.save()
+        response = self.client.get(reverse('product-detail', args=[product.id]))
+        self.assertIsNone(response.data['image_srcset'])
+
+    def test_backfill_command_marks_ready_and_queues_missing(self):
+        ready = self.make_product(image=make_image())
+        missing = self.make_product('Лук', image=make_image(name='onion.jpg'))
+        generate_thumbnails(ready.image)
+        # Как у файлов, загруженных до появления image_thumbnails
+        BackgroundTask.objects.all().delete()
+
+        call_command('backfill_thumbnails', stdout=io.StringIO())
+        ready.refresh_from_db()
+        self.assertEqual(ready.image_thumbnails, ready.image.name)
+        task = BackgroundTask.objects.get()
+        self.assertEqual(task.payload, {'model': 'products.Product', 'pk': missing.pk, 'field': 'image'})
+
+        # Повторный запуск не трогает уже отмеченные файлы
+        call_command('backfill_thumbnails', stdout=io.StringIO())
+        self.assertEqual(BackgroundTask.objects.filter(payload__pk=ready.pk).count(), 0)
+
+    def test_product_saves_do_not_duplicate_pending_task(self):
+        product = self.make_product(image=make_image())
+        product.price = 55
+        product.save()
+        product.quantity = 5
+        product.save()
+        self.assertEqual(BackgroundTask.objects.filter(name='process_image').count(), 1)
+
+        run_pending()
+        product.image = make_image(name='other.jpg')
+        product.save()
+        self.assertEqual(BackgroundTask.objects.filter(name='process_image', status='pending').count(), 1)
+
+    def test_invalid_product_image_is_removed(self):
+        product = self.make_product(image=SimpleUploadedFile('broken.jpg', b'not an image'))
+        path = product.image.path
+        self.assertEqual(run_pending(), 1)
+        task = BackgroundTask.objects.get(name='process_image')
+        self.assertEqual((task.status, task.attempts), ('failed', 1))
+        product.refresh_from_db()
+        self.assertFalse(product.image)
+        self.assertFalse(os.path.exists(path))
+
+    def test_product_without_image(self):
+        product = self.make_product()
+        response = self.client.get(reverse('product-detail', args=[product.id]))
+        self.assertIsNone(response.data['image_srcset'])
+        self.assertFalse(BackgroundTask.objects.exists())
+
+
+@task
+def flaky_test_task():
+    raise ConnectionError('Хранилище недоступно')
+
+
+class BackgroundTaskTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_avatar_upload_is_processed_in_background(self):
+        response = self.client.post(
+            reverse('upload-avatar'), {'avatar': make_image()}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 200)
+        task_url = reverse('task-detail', args=[response.data['task_id']])
+        self.assertEqual(self.client.get(task_url).data['status'], 'pending')
+        self.user.refresh_from_db()
+        self.assertFalse(has_thumbnails(self.user.avatar))
+
+        run_pending()
+        data = self.client.get(task_url).data
+        self.assertEqual(data['status'], 'done')
+        self.assertEqual(data['result']['format'], 'JPEG')
+        self.assertTrue(has_thumbnails(self.user.avatar))
+
+    def test_chat_upload_is_streamed_and_processed(self):
+        upload = SimpleUploadedFile('notes.txt', b'hello', content_type='text/plain')
+        response = self.client.post(reverse('upload-file'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        run_pending()
+        task = BackgroundTask.objects.get(id=response.data['task_id'])
+        self.assertEqual(task.status, 'done')
+        self.assertEqual(task.result, {'size': 5, 'content_type': 'text/plain'})
+
+    def test_invalid_image_is_not_retried(self):
+        upload = SimpleUploadedFile('broken.png', b'not an image', content_type='image/png')
+        response = self.client.post(reverse('upload-file'), {'file': upload}, format='multipart')
+        self.assertEqual(run_pending(), 1)
+        task = BackgroundTask.objects.get(id=response.data['task_id'])
+        self.assertEqual(task.status, 'failed')
+        self.assertEqual(task.attempts, 1)
+        self.assertIn('PermanentTaskError', task.error)
+        self.assertFalse(default_storage.exists(task.payload['name']))
+
+    def test_invalid_user_media_is_deleted(self):
+        media = UserMedia.objects.create(
+            user=self.user, media_type='image', file=SimpleUploadedFile('broken.jpg', b'not an image')
+        )
+        path = media.file.path
+        enqueue('process_image', {'model': 'authentication.UserMedia', 'pk': media.pk, 'field': 'file'})
+        run_pending()
+        self.assertFalse(UserMedia.objects.filter(pk=media.pk).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_transient_error_is_retried_with_backoff(self):
+        background_task = enqueue('flaky_test_task')
+        self.assertEqual(run_pending(), 1)
+        background_task.refresh_from_db()
+        self.assertEqual(background_task.status, 'pending')
+        self.assertEqual(background_task.run_after - background_task.finished_at, RETRY_DELAY)
+        # Повтор не берётся, пока не подошло run_after
+        self.assertEqual(run_pending(), 0)
+
+        BackgroundTask.objects.filter(pk=background_task.pk).update(run_after=timezone.now())
+        self.assertEqual(run_pending(), 1)
+        background_task.refresh_from_db()
+        self.assertEqual(background_task.run_after - background_task.finished_at, RETRY_DELAY * 2)
+
+        for _ in range(MAX_ATTEMPTS):
+            BackgroundTask.objects.filter(pk=background_task.pk).update(run_after=timezone.now())
+            run_pending()
+        background_task.refresh_from_db()
+        self.assertEqual((background_task.status, background_task.attempts), ('failed', MAX_ATTEMPTS))
+
+    def test_stale_task_fails_after_max_attempts(self):
+        started_at = timezone.now() - timedelta(hours=1)
+        retry = enqueue('flaky_test_task')
+        exhausted = enqueue('flaky_test_task')
+        BackgroundTask.objects.filter(pk=retry.pk).update(status='running', started_at=started_at, attempts=1)
+        BackgroundTask.objects.filter(pk=exhausted.pk).update(
+            status='running', started_at=started_at, attempts=MAX_ATTEMPTS
+        )
+        self.assertEqual(requeue_stale(), 1)
+        retry.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(retry.status, 'pending')
+        self.assertEqual(exhausted.status, 'failed')
+
+    def test_claim_uses_status_run_after_index(self):
+        queue = (
+            BackgroundTask.objects.filter(status='pending', run_after__lte=timezone.now())
+            .order_by('run_after', 'id')
+        )
+        self.assertIn('task_status_run_after_idx', queue.explain())
+
+    def test_tasks_are_visible_to_owner_only(self):
+        task = enqueue('process_uploaded_file', {'name': 'missing.txt'}, user=self.user)
+        other = User.objects.create_user(username='other', email='other@example.com', password='password123')
+        self.client.force_authenticate(other)
+        response = self.client.get(reverse('task-detail', args=[task.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ChunkedUploadTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'partial'),
+            CHUNKED_UPLOAD_CHUNK_SIZE=1024,
+        )
+        self.override.enable()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def start(self, filename, size, purpose):
+        response = self.client.post(
+            reverse('chunked-upload'),
+            {'filename': filename, 'size': size, 'purpose': purpose},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def put_chunk(self, upload_id, index, data):
+        return self.client.put(
+            reverse('chunked-upload-chunk', args=[upload_id, index]),
+            data=data, content_type='application/octet-stream',
+        )
+
+    def test_chat_file_uploaded_out_of_order_and_resumed(self):
+        payload = os.urandom(2500)
+        upload = self.start('report.bin', len(payload), 'chat')
+        self.assertEqual(upload['total_chunks'], 3)
+
+        self.assertEqual(self.put_chunk(upload['id'], 2, payload[2048:]).status_code, 200)
+        self.assertEqual(self.put_chunk(upload['id'], 0, payload[:1024]).status_code, 200)
+        # Повторная отправка чанка безопасна
+        self.assertEqual(self.put_chunk(upload['id'], 0, payload[:1024]).status_code, 200)
+
+        state = self.client.get(reverse('chunked-upload-detail', args=[upload['id']])).data
+        self.assertEqual(state['received_chunks'], [0, 2])
+        finalize_url = reverse('chunked-upload-finalize', args=[upload['id']])
+        self.assertEqual(self.client.post(finalize_url).status_code, 400)
+
+        self.put_chunk(upload['id'], 1, payload[1024:2048])
+        response = self.client.post(finalize_url)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['url'].startswith('/media/chat_media/user/report'))
+        stored = os.path.join(self.media_root, response.data['url'][len('/media/'):])
+        with open(stored, 'rb') as result:
+            self.assertEqual(result.read(), payload)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'partial')), [])
+        self.assertEqual(BackgroundTask.objects.get(id=response.data['task_id']).name, 'process_uploaded_file')
+
+    def test_chunk_with_wrong_length_is_rejected(self):
+        upload = self.start('report.bin', 2000, 'chat')
+        self.assertEqual(self.put_chunk(upload['id'], 0, b'x' * 10).status_code, 400)
+        self.assertEqual(self.put_chunk(upload['id'], 5, b'x' * 1024).status_code, 400)
+
+    def test_user_media_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), 'green').save(buffer, 'PNG')
+        payload = buffer.getvalue()
+        upload = self.start('photo.png', len(payload), 'user_media')
+        for index in range(upload['total_chunks']):
+            self.put_chunk(upload['id'], index, payload[index * 1024:(index + 1) * 1024])
+        response = self.client.post(
+            reverse('chunked-upload-finalize', args=[upload['id']]), {'title': 'Огород'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['title'], 'Огород')
+        self.assertEqual(response.data['media_type'], 'image')
+        run_pending()
+        self.assertEqual(BackgroundTask.objects.get(id=response.data['task_id']).status, 'done')
+
+    def test_user_media_rejects_other_files(self):
+        response = self.client.post(
+            reverse('chunked-upload'),
+            {'filename': 'notes.txt', 'size': 10, 'purpose': 'user_media'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_uploads_are_private(self):
+        upload = self.start('report.bin', 10, 'chat')
+        other = User.objects.create_user(username='other', email='other@example.com', password='password123')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.put_chunk(upload['id'], 0, b'x' * 10).status_code, 404)
+
+
+class OrderCreateTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.carrot = self.make_product(quantity=5)
+        self.potato = self.make_product('Картофель', price=30)
+        self.client.force_authenticate(self.buyer)
+
+    def order(self, items):
+        return self.client.post(reverse('orders-list'), {
+            'delivery_type': 'pickup', 'payment_method': 'cash', 'items': items,
+        }, format='json')
+
+    def test_order_decrements_stock(self):
+        response = self.order([
+            {'product': self.carrot.id, 'quantity': 2},
+            {'product': self.potato.id, 'quantity': 3},
+            {'product': self.carrot.id, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_amount'], '240.00')
+        self.carrot.refresh_from_db()
+        self.potato.refresh_from_db()
+        self.assertEqual((self.carrot.quantity, self.potato.quantity), (2, 7))
+        self.assertEqual(OrderItem.objects.get(product=self.carrot).quantity, 3)
+
+    def test_insufficient_stock_rolls_back_whole_order(self):
+        response = self.order([
+            {'product': self.potato.id, 'quantity': 3},
+            {'product': self.carrot.id, 'quantity': 6},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Морковь', str(response.data))
+        self.potato.refresh_from_db()
+        self.assertEqual(self.potato.quantity, 10)
+        self.assertFalse(Order.objects.exists())
+
+    def test_unknown_product(self):
+        response = self.order([{'product': 999999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_stock_is_reserved_with_single_update(self):
+        items = [{'product': self.carrot.id, 'quantity': 1}, {'product': self.potato.id, 'quantity': 1}]
+        with CaptureQueriesContext(connection) as queries:
+            place_order(self.buyer, items, delivery_type='pickup', payment_method='cash')
+        statements = [query['sql'].split()[0] for query in queries.captured_queries
+                      if 'SAVEPOINT' not in query['sql']]
+        # UPDATE остатков, SELECT товаров, INSERT заказа, INSERT позиций, снятие резервов
+        self.assertEqual(statements, ['UPDATE', 'SELECT', 'INSERT', 'INSERT', 'DELETE'])
+
+
+class OrderConcurrencyTest(MarketFixtureMixin, TransactionTestCase):
+    """Параллельные оформления заказа не продают больше остатка."""
+
+    STOCK = 10
+    BUYERS = 8
+    ORDERS_PER_BUYER = 4
+
+    def setUp(self):
+        super().setUp()
+        self.product = self.make_product(quantity=self.STOCK)
+        self.buyers = [make_user(f'buyer{i}') for i in range(self.BUYERS)]
+
+    def test_parallel_orders_do_not_oversell(self):
+        results = []
+        start = threading.Barrier(self.BUYERS)
+
+        def buy(user):
+            start.wait()
+            try:
+                for _ in range(self.ORDERS_PER_BUYER):
+                    while True:
+                        try:
+                            place_order(user, [{'product': self.product.id, 'quantity': 1}],
+                                        delivery_type='pickup', payment_method='cash')
+                            results.append('ok')
+                        except ValidationError:
+                            results.append('out_of_stock')
+                        except OperationalError:
+                            # SQLite отвечает «database is locked» — клиент повторит запрос
+                            time.sleep(0.01)
+                            continue
+                        break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in self.buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+        self.assertEqual(results.count('ok'), self.STOCK)
+        self.assertEqual(len(results), self.BUYERS * self.ORDERS_PER_BUYER)
+        self.assertEqual(OrderItem.objects.filter(product=self.product).count(), self.STOCK)
+
+
+class StockReservationTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = make_user('first')
+        self.second = make_user('second')
+        self.product = self.make_product('Клубника', price=300, quantity=5)
+
+    def add_to_cart(self, user, quantity):
+        self.client.force_authenticate(user)
+        return self.client.post(
+            reverse('cart-list'), {'product': self.product.id, 'quantity': quantity}, format='json'
+        )
+
+    def test_cart_reserves_stock(self):
+        self.assertEqual(self.add_to_cart(self.first, 2).status_code, 201)
+        self.assertEqual(self.add_to_cart(self.first, 1).status_code, 201)
+        reservation = StockReservation.objects.get()
+        self.assertEqual((reservation.user, reservation.quantity), (self.first, 3))
+
+        response = self.add_to_cart(self.second, 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Доступно: 2', str(response.data))
+        self.assertFalse(CartItem.objects.filter(user=self.second).exists())
+
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.data[0]['available'], 2)
+        self.assertEqual(response.data[0]['quantity'], 5)
+
+    def test_catalog_available_is_a_single_query(self):
+        self.add_to_cart(self.first, 2)
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.data[0]['available'], 3)
+
+    def test_expired_reservations_are_ignored_and_swept(self):
+        self.add_to_cart(self.first, 5)
+        self.assertEqual(self.add_to_cart(self.second, 1).status_code, 400)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.add_to_cart(self.second, 1).status_code, 201)
+
+        call_command('release_expired_reservations', stdout=io.StringIO())
+        self.assertEqual(list(StockReservation.objects.values_list('user__username', flat=True)), ['second'])
+
+    def test_order_honours_other_reservations_and_releases_own(self):
+        self.add_to_cart(self.first, 4)
+        with self.assertRaises(ValidationError):
+            place_order(self.second, [{'product': self.product.id, 'quantity': 2}],
+                        delivery_type='pickup', payment_method='cash')
+
+        place_order(self.first, [{'product': self.product.id, 'quantity': 4}],
+                    delivery_type='pickup', payment_method='cash')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 1)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_removing_cart_item_releases_reservation(self):
+        self.add_to_cart(self.first, 2)
+        cart_item = CartItem.objects.get()
+        self.client.delete(reverse('cart-detail', args=[cart_item.id]))
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class IdempotentOrderTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.make_product(quantity=5)
+        self.client.force_authenticate(self.buyer)
+
+    def order(self, key, quantity=2):
+        return self.client.post(reverse('orders-list'), {
+            'delivery_type': 'pickup', 'payment_method': 'cash',
+            'items': [{'product': self.product.id, 'quantity': quantity}],
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_returns_stored_response(self):
+        first = self.order('key-1')
+        self.assertEqual(first.status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.order('key-1')
+        # Повтор не трогает ни заказы, ни остатки
+        touched = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('products_order', touched)
+        self.assertNotIn('products_product', touched)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 3)
+
+    def test_different_keys_create_different_orders(self):
+        self.order('key-1')
+        self.order('key-2')
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_key_reused_with_other_body(self):
+        self.order('key-1')
+        self.assertEqual(self.order('key-1', quantity=1).status_code, 422)
+
+    def test_request_in_progress(self):
+        self.order('key-1')
+        IdempotencyKey.objects.update(status_code=None, response=None)
+        self.assertEqual(self.order('key-1').status_code, 409)
+
+    def test_failed_request_can_be_retried(self):
+        self.assertEqual(self.order('key-1', quantity=50).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.product.quantity = 100
+        self.product.save()
+        self.assertEqual(self.order('key-1', quantity=50).status_code, 201)
+
+    def test_keys_are_scoped_per_user(self):
+        self.order('key-1')
+        other = User.objects.create_user(username='other', email='other@example.com', password='password123')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.order('key-1').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_expired_key_runs_request_again(self):
+        self.order('key-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.order('key-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_cleanup_command_deletes_expired_keys(self):
+        self.order('key-1')
+        self.order('key-2')
+        IdempotencyKey.objects.filter(key='key-1').update(expires_at=timezone.now())
+        call_command('cleanup_idempotency_keys', stdout=io.StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['key-2'])
+
+    def test_result_is_rolled_back_when_key_was_taken_over(self):
+        """Ответ сохраняется в транзакции обработчика и только пока ключ ещё за нами."""
+        django_request = APIRequestFactory().post(
+            '/api/orders/', {'note': 'x'}, format='json', HTTP_IDEMPOTENCY_KEY='key-1'
+        )
+        request = Request(django_request, parsers=[JSONParser()])
+        request.user = self.buyer
+
+        def handler():
+            Category.objects.create(name='Побочный эффект')
+            # Пока обработчик работал, ключ перехватил другой процесс
+            IdempotencyKey.objects.update(created_at=timezone.now() + timedelta(seconds=1))
+            return Response({'ok': True}, status=201)
+
+        response = idempotent_response(request, handler)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Category.objects.filter(name='Побочный эффект').exists())
+        self.assertIsNone(IdempotencyKey.objects.get().status_code)
+
+
+class CartCheckoutTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = [self.make_product(f'Товар {i}', price=10 * (i + 1), quantity=5) for i in range(3)]
+        self.client.force_authenticate(self.buyer)
+
+    def fill_cart(self, count):
+        for product in self.products[:count]:
+            self.client.post(reverse('cart-list'), {'product': product.id, 'quantity': 2}, format='json')
+
+    def checkout(self, **extra):
+        return self.client.post(
+            reverse('cart-checkout'),
+            {'delivery_type': 'pickup', 'payment_method': 'cash'},
+            format='json', **extra
+        )
+
+    def test_checkout_creates_order_and_clears_cart(self):
+        self.fill_cart(3)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_amount'], '120.00')
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('quantity', flat=True)), [3, 3, 3]
+        )
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.fill_cart(1)
+        with CaptureQueriesContext(connection) as small:
+            self.checkout()
+        self.fill_cart(3)
+        with CaptureQueriesContext(connection) as large:
+            self.checkout()
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_empty_cart(self):
+        self.assertEqual(self.checkout().status_code, 400)
+
+    def test_prices_are_read_after_stock_update(self):
+        """Списывается цена, закоммиченная до того, как UPDATE остатка взял блокировку."""
+        self.fill_cart(1)
+        deduct_stock = checkout.deduct_stock
+
+        def reprice_then_deduct(user, quantities):
+            # Продавец успел поменять цену между чтением корзины и списанием
+            Product.objects.filter(id=self.products[0].id).update(price=15)
+            deduct_stock(user, quantities)
+
+        with mock.patch('products.checkout.deduct_stock', reprice_then_deduct):
+            response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_amount'], '30.00')
+        self.assertEqual(response.data['items'][0]['price'], '15.00')
+
+    def test_out_of_stock_keeps_cart(self):
+        self.fill_cart(2)
+        Product.objects.filter(id=self.products[1].id).update(quantity=1)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Товар 1', str(response.data))
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_is_idempotent(self):
+        self.fill_cart(1)
+        first = self.checkout(HTTP_IDEMPOTENCY_KEY='checkout-1')
+        retry = self.checkout(HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class AddToCartTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = [self.make_product(f'Товар {i}', price=10, quantity=20) for i in range(3)]
+        self.client.force_authenticate(self.buyer)
+
+    def add(self, product, quantity=1):
+        return self.client.post(
+            reverse('cart-list'), {'product': product.id, 'quantity': quantity}, format='json'
+        )
+
+    def test_add_uses_fixed_number_of_queries(self):
+        for product in self.products[:2]:
+            self.add(product)
+        for product in (self.products[2], self.products[0]):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.add(product, 2)
+            self.assertEqual(response.status_code, 201)
+            statements = [query['sql'].split()[0] for query in queries.captured_queries
+                          if 'SAVEPOINT' not in query['sql']]
+            # SELECT товара с корзиной, INSERT/UPDATE позиции, upsert резерва
+            self.assertEqual(len(statements), 3, statements)
+
+    def test_repeated_add_increments_single_row(self):
+        self.add(self.products[0], 2)
+        response = self.add(self.products[0], 3)
+        self.assertEqual(response.data['quantity'], 5)
+        cart_item = CartItem.objects.get()
+        self.assertEqual(cart_item.quantity, 5)
+        self.assertEqual(response.data['id'], cart_item.id)
+        self.assertEqual(cart_item.reservation.quantity, 5)
+
+    def test_other_farmer_is_rejected(self):
+        self.add(self.products[0])
+        foreign = self.make_product('Чужой', price=10, quantity=5, farmer=make_user('other'))
+        response = self.add(foreign)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('разных продавцов', str(response.data))
+
+    def test_invalid_input(self):
+        self.assertEqual(self.add(self.products[0], 0).status_code, 400)
+        self.assertEqual(self.add(self.products[0], 'abc').status_code, 400)
+        response = self.client.post(reverse('cart-list'), {'product': 999999}, format='json')
+        self.assertEqual(response.status_code, 400)
+        for product_id in ('abc', '', None, [1]):
+            response = self.client.post(reverse('cart-list'), {'product': product_id}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('product', response.data)
+
+    def test_concurrent_insert_fallback_checks_stock(self):
+        """Если строку первым создал параллельный запрос, увеличение всё равно учитывает остаток."""
+        product = self.products[0]
+        CartItem.objects.create(user=self.buyer, product=product, quantity=15)
+        with self.assertRaisesMessage(ValidationError, 'Доступно: 20'):
+            increment_cart_item(self.buyer, product, 10, available=20)
+        self.assertEqual(increment_cart_item(self.buyer, product, 5, available=20).quantity, 20)
+
+
+class CartSummaryTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.carrot = self.make_product(price='12.50', quantity=20)
+        self.potato = self.make_product('Картофель', price=30, quantity=20)
+        self.client.force_authenticate(self.buyer)
+
+    def add(self, product, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('cart-list'), {'product': product.id, 'quantity': quantity}, format='json')
+
+    def summary(self):
+        return self.client.get(reverse('cart-summary')).data
+
+    def test_empty_cart(self):
+        self.assertEqual(self.summary(), {'items': 0, 'quantity': 0, 'total': '0.00'})
+
+    @override_settings(CACHES=IN_MEMORY_CACHES)
+    def test_summary_is_cached_and_invalidated_on_writes(self):
+        self.add(self.carrot, 2)
+        self.add(self.potato, 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.summary(), {'items': 2, 'quantity': 3, 'total': '55.00'})
+        with self.assertNumQueries(0):
+            self.summary()
+
+        self.add(self.carrot, 1)
+        self.assertEqual(self.summary()['total'], '67.50')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('cart-detail', args=[CartItem.objects.get(product=self.potato).id]))
+        self.assertEqual(self.summary(), {'items': 1, 'quantity': 3, 'total': '37.50'})
+
+    def test_process_local_cache_is_reported(self):
+        """Версиям сводки нужен общий для воркеров кэш; LocMemCache не проходит проверку."""
+        self.assertEqual(check_shared_cache(None), [])
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['products.W001'])
+
+    def test_price_change_invalidates_summary(self):
+        self.add(self.carrot, 2)
+        self.summary()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.carrot.price = 20
+            self.carrot.save()
+        self.assertEqual(self.summary()['total'], '40.00')
+
+
+class OrderListQueryBudgetTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = [self.make_product(f'Товар {i}', price=10, quantity=1000) for i in range(3)]
+
+    def create_orders(self, count):
+        items = [{'product': product.id, 'quantity': 1} for product in self.products]
+        for _ in range(count):
+            place_order(self.buyer, items, delivery_type='pickup', payment_method='cash')
+
+    def test_buyer_list_query_count_is_constant(self):
+        self.create_orders(1)
+        self.client.force_authenticate(self.buyer)
+        with self.assertNumQueries(2):
+            self.client.get(reverse('orders-list'))
+        self.create_orders(5)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('orders-list'))
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(len(response.data[0]['items']), 3)
+        self.assertEqual(response.data[0]['items'][0]['farmer']['id'], self.farmer.id)
+
+    def test_seller_orders_paginated(self):
+        self.create_orders(5)
+        self.client.force_authenticate(self.farmer)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('orders-seller-orders'), {'page_size': 3})
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+
+class SellerOrdersFilterTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        product = self.make_product(price=10, quantity=1000)
+        foreign = self.make_product('Свёкла', price=10, quantity=1000, farmer=make_user('other'))
+        self.orders = {}
+        for name, status_value, delivery_type, day in [
+            ('old', 'delivered', 'pickup', '2026-01-10'),
+            ('mid', 'processing', 'delivery', '2026-02-15'),
+            ('new', 'processing', 'pickup', '2026-03-20'),
+        ]:
+            order = place_order(
+                self.buyer, [{'product': product.id, 'quantity': 1}, {'product': foreign.id, 'quantity': 1}],
+                delivery_type=delivery_type, payment_method='cash',
+            )
+            Order.objects.filter(pk=order.pk).update(
+                status=status_value, created_at=timezone.make_aware(datetime.fromisoformat(day + 'T12:00'))
+            )
+            self.orders[name] = order.pk
+        place_order(self.buyer, [{'product': foreign.id, 'quantity': 1}], delivery_type='pickup', payment_method='cash')
+        self.client.force_authenticate(self.farmer)
+
+    def ids(self, **params):
+        response = self.client.get(reverse('orders-seller-orders'), params)
+        self.assertEqual(response.status_code, 200)
+        return [order['id'] for order in response.data['results']]
+
+    def test_only_own_orders_without_duplicates(self):
+        self.assertEqual(self.ids(), [self.orders['new'], self.orders['mid'], self.orders['old']])
+
+    def test_filters(self):
+        self.assertEqual(self.ids(status='processing', delivery_type='pickup'), [self.orders['new']])
+        self.assertEqual(self.ids(status='delivered,processing', date_to='2026-02-15'),
+                         [self.orders['mid'], self.orders['old']])
+        self.assertEqual(self.ids(date_from='2026-02-01', date_to='2026-02-28'), [self.orders['mid']])
+
+    def test_amount_search_and_ordering(self):
+        Order.objects.filter(pk=self.orders['mid']).update(total_amount=500)
+        self.assertEqual(self.ids(min_amount='100'), [self.orders['mid']])
+        self.assertEqual(self.ids(max_amount='100'), [self.orders['new'], self.orders['old']])
+        self.assertEqual(self.ids(search='Морков'), [self.orders['new'], self.orders['mid'], self.orders['old']])
+        self.assertEqual(self.ids(search=str(self.orders['old']).rjust(3, '0')), [self.orders['old']])
+        self.assertEqual(self.ids(ordering='oldest'), [self.orders['old'], self.orders['mid'], self.orders['new']])
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.client.get(reverse('orders-seller-orders'), {'status': 'lost'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('orders-seller-orders'), {'date_from': 'вчера'}).status_code, 400)
+
+    def test_keyset_pagination_with_filters(self):
+        response = self.client.get(reverse('orders-seller-orders'), {'status': 'processing', 'page_size': 1})
+        self.assertEqual([order['id'] for order in response.data['results']], [self.orders['new']])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([order['id'] for order in response.data['results']], [self.orders['mid']])
+        self.assertIsNone(response.data['next'])
+
+    def test_deleted_product_keeps_order_visible(self):
+        Product.objects.filter(farmer=self.farmer).delete()
+        self.assertEqual(self.ids(), [self.orders['new'], self.orders['mid'], self.orders['old']])
+
+    def test_paginated_by_default(self):
+        """Без cursor/page_size продавец всё равно получает ограниченную первую страницу."""
+        response = self.client.get(reverse('orders-seller-orders'))
+        self.assertEqual(set(response.data), {'next', 'previous', 'results'})
+        self.assertIsNone(response.data['next'])
+
+
+class OrderItemSellerTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.make_product(price=10, quantity=100)
+
+    def test_checkout_records_seller(self):
+        order = place_order(self.buyer, [{'product': self.product.id, 'quantity': 2}],
+                            delivery_type='pickup', payment_method='cash')
+        self.assertEqual(order.items.get().seller, self.farmer)
+
+    def test_save_fills_missing_seller(self):
+        order = Order.objects.create(user=self.buyer, total_amount=10, delivery_type='pickup', payment_method='cash')
+        item = OrderItem.objects.create(order=order, product=self.product, quantity=1, price=10)
+        self.assertEqual(item.seller_id, self.farmer.id)
+
+    def test_backfill_command(self):
+        order = Order.objects.create(user=self.buyer, total_amount=10, delivery_type='pickup', payment_method='cash')
+        item = OrderItem.objects.create(order=order, product=self.product, quantity=1, price=10)
+        OrderItem.objects.filter(pk=item.pk).update(seller=None)
+        call_command('backfill_order_sellers', stdout=io.StringIO())
+        item.refresh_from_db()
+        self.assertEqual(item.seller_id, self.farmer.id)
+
+    def test_statistics_count_each_order_once(self):
+        place_order(self.buyer, [{'product': self.product.id, 'quantity': 2}],
+                    delivery_type='pickup', payment_method='cash')
+        other = self.make_product('Лук', price=5, quantity=100)
+        place_order(self.buyer, [{'product': self.product.id, 'quantity': 1}, {'product': other.id, 'quantity': 2}],
+                    delivery_type='delivery', payment_method='cash')
+        client = APIClient()
+        client.force_authenticate(self.farmer)
+        response = client.get(reverse('seller-statistics'))
+        self.assertEqual(response.status_code, 200)
+        customers = response.data['customers']
+        self.assertEqual(len(customers), 1)
+        self.assertEqual(customers[0]['order_count'], 2)
+        self.assertEqual(customers[0]['total_spent'], 40)
+
+
+class OrderStatusTransitionTest(MarketFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        product = self.make_product(price=10, quantity=1000)
+        foreign = self.make_product('Свёкла', price=10, quantity=1000, farmer=make_user('other'))
+        self.orders = {}
+        for status_value in ['processing', 'confirmed', 'delivered', 'canceled']:
+            order = place_order(self.buyer, [{'product': product.id, 'quantity': 1}],
+                                delivery_type='delivery', payment_method='cash')
+            Order.objects.filter(pk=order.pk).update(status=status_value)
+            self.orders[status_value] = order.pk
+        self.foreign_order = place_order(self.buyer, [{'product': foreign.id, 'quantity': 1}],
+                                         delivery_type='delivery', payment_method='cash').pk
+        self.client.force_authenticate(self.farmer)
+
+    def test_bulk_transition_reports_each_order(self):
+        ids = [self.orders['processing'], self.orders['confirmed'], self.orders['delivered'],
+               self.orders['canceled'], self.foreign_order]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('orders-bulk-update-status'),
+                                        {'order_ids': ids, 'status': 'shipped'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual([result['success'] for result in response.data['results']],
+                         [True, True, False, False, False])
+        self.assertEqual(response.data['results'][2]['error'], 'Нельзя изменить статус доставленного заказа')
+        self.assertEqual(response.data['results'][4]['error'], 'Вы не можете изменить статус этого заказа')
+        updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            dict(Order.objects.filter(pk__in=ids).values_list('id', 'status')),
+            {ids[0]: 'shipped', ids[1]: 'shipped', ids[2]: 'delivered', ids[3]: 'canceled', ids[4]: 'processing'},
+        )
+
+    def test_bulk_transition_rejects_bad_input(self):
+        url = reverse('orders-bulk-update-status')
+        self.assertEqual(self.client.post(url, {'order_ids': [self.orders['processing']], 'status': 'lost'},
+                                          format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'order_ids': [], 'status': 'shipped'},
+                                          format='json').status_code, 400)
+
+    def test_single_transition_cannot_go_back(self):
+        url = reverse('orders-update-status', args=[self.orders['confirmed']])
+        response = self.client.post(url, {'status': 'processing'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'status': 'in_transit'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'in_transit')
+
+
+class ChatInboxTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='me', email='me@example.com', password='password123')
+        self.partners = [
+            User.objects.create_user(username=f'p{i}', email=f'p{i}@example.com', password='password123')
+            for i in range(3)
+        ]
+        User.objects.create_user(username='stranger', email='stranger@example.com', password='password123')
+        start = timezone.now() - timedelta(hours=1)
+        for minute, (sender, recipient, content) in enumerate([
+            (self.partners[0], self.user, 'привет'),
+            (self.user, self.partners[1], 'здравствуйте'),
+            (self.partners[2], self.user, 'есть морковь?'),
+            (self.partners[0], self.user, 'ау'),
+        ]):
+            message = Message.objects.create(sender=sender, recipient=recipient, content=content)
+            Message.objects.filter(pk=message.pk).update(timestamp=start + timedelta(minutes=minute))
+            message.refresh_from_db()
+            record_message(message)
+        Message.objects.filter(sender=self.partners[2]).update(is_read=True)
+        refresh_unread(self.user.id, [self.partners[2].id])
+        self.client.force_authenticate(self.user)
+
+    def test_inbox_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('chat-list-with-details'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([chat['username'] for chat in response.data], ['p0', 'p2', 'p1'])
+        self.assertEqual([chat['unread_count'] for chat in response.data], [2, 0, 0])
+        first = response.data[0]['last_message']
+        self.assertEqual(first['content'], 'ау')
+        self.assertEqual(first['sender']['username'], 'p0')
+        self.assertEqual(response.data[2]['last_message']['sender']['username'], 'me')
+
+    def test_cursor_pagination_by_last_activity(self):
+        response = self.client.get(reverse('chat-list-with-details'), {'page_size': 2})
+        self.assertEqual([chat['username'] for chat in response.data['results']], ['p0', 'p2'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([chat['username'] for chat in response.data['results']], ['p1'])
+        self.assertIsNone(response.data['next'])
+
+    def test_deleted_last_message(self):
+        Message.objects.filter(recipient=self.partners[1]).update(is_deleted=True)
+        refresh_last_message(self.user.id, self.partners[1].id)
+        response = self.client.get(reverse('chat-list-with-details'))
+        self.assertEqual(response.data[2]['username'], 'p1')
+        self.assertIsNone(response.data[2]['last_message'])
+
+
+class ConversationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='password123')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='password123')
+
+    def send(self, sender, recipient, content):
+        self.client.force_authenticate(sender)
+        response = self.client.post(reverse('send-message'), {'recipient_id': recipient.id, 'content': content})
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def unread(self, user):
+        self.client.force_authenticate(user)
+        return self.client.get(reverse('unread-count')).data['unread_count']
+
+    def test_counters_follow_messages(self):
+        self.client.force_authenticate(self.alice)
+        self.assertFalse(self.client.get(reverse('has-messages')).data['has_messages'])
+        self.send(self.alice, self.bob, 'раз')
+        last = self.send(self.alice, self.bob, 'два')
+        reply = self.send(self.bob, self.alice, 'ответ')
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.last_message_id, Message.objects.latest('id').id)
+        self.assertEqual(self.unread(self.bob), 2)
+        self.assertEqual(self.unread(self.alice), 1)
+        self.assertTrue(self.client.get(reverse('has-messages')).data['has_messages'])
+
+        self.client.force_authenticate(self.bob)
+        self.client.get(reverse('chat_messages', args=[self.alice.id]))
+        self.assertEqual(self.unread(self.bob), 0)
+        self.assertEqual(self.unread(self.alice), 1)
+
+        self.client.force_authenticate(self.bob)
+        response = self.client.delete(reverse('message-delete', args=[reply]))
+        self.assertEqual(response.status_code, 204)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.last_message_id, last)
+        self.assertEqual(self.unread(self.alice), 0)
+
+    def test_admin_create_and_update_keep_conversations(self):
+        carol = User.objects.create_user(username='carol', email='carol@example.com', password='password123')
+        admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='password123', is_staff=True
+        )
+        self.send(self.alice, self.bob, 'привет')
+        self.client.force_authenticate(admin)
+        response = self.client.post('/api/admin/messages/', {'recipient_id': self.bob.id, 'content': 'от админа'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.unread(self.bob), 2)
+        self.assertEqual(get_conversation(admin.id, self.bob.id).last_message_id, response.data['id'])
+
+        last = Message.objects.create(sender=self.alice, recipient=self.bob, content='перешлю')
+        record_message(last)
+        self.client.force_authenticate(admin)
+        response = self.client.patch(f'/api/admin/messages/{last.id}/', {'recipient_id': carol.id})
+        self.assertEqual(response.status_code, 200)
+        first = Message.objects.get(content='привет')
+        self.assertEqual(get_conversation(self.alice.id, self.bob.id).last_message_id, first.id)
+        self.assertEqual(get_conversation(self.alice.id, carol.id).last_message_id, last.id)
+        self.assertEqual(self.unread(self.bob), 2)
+        self.assertEqual(self.unread(carol), 1)
+
+    def test_unread_count_is_one_query(self):
+        self.send(self.alice, self.bob, 'привет')
+        self.client.force_authenticate(self.bob)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('unread-count'))
+        self.assertEqual(response.data['unread_count'], 1)
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(DEBUG=False)
+    def test_benchmark_refuses_without_debug(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_messages', messages=10, users=2, stdout=io.StringIO())
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Message._meta.db_table)
+        self.assertLessEqual({index.name for index in Message._meta.indexes}, set(constraints))
+
+
+class ChatMessagesPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='password123')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='password123')
+        self.ids = []
+        for i in range(MESSAGES_PAGE_SIZE + 5):
+            sender, recipient = (self.bob, self.alice) if i % 2 else (self.alice, self.bob)
+            message = Message.objects.create(sender=sender, recipient=recipient, content=f'm{i}')
+            record_message(message)
+            self.ids.append(message.id)
+        self.client.force_authenticate(self.alice)
+        self.url = reverse('chat_messages', args=[self.bob.id])
+
+    def ids_of(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [message['id'] for message in response.data]
+
+    def test_latest_page_then_older(self):
+        self.assertEqual(self.ids_of(), self.ids[-MESSAGES_PAGE_SIZE:])
+        self.assertEqual(self.ids_of(before_id=self.ids[-MESSAGES_PAGE_SIZE]), self.ids[:5])
+
+    def test_after_id_returns_newer_messages(self):
+        self.assertEqual(self.ids_of(after_id=self.ids[-3]), self.ids[-2:])
+        self.assertEqual(self.ids_of(after_id=self.ids[-1]), [])
+
+    def test_page_query_budget_and_read_marking(self):
+        self.ids_of()
+        self.assertFalse(Message.objects.filter(recipient=self.alice, is_read=False).exists())
+        with CaptureQueriesContext(connection) as queries:
+            self.ids_of()
+        # Собеседник, диалог (непрочитанных нет — без UPDATE) и страница с JOIN отправителя и получателя
+        self.assertEqual(len(queries), 3)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.url, {'before_id': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'before_id': 1, 'after_id': 2}).status_code, 400)
@@ -0,0 +1,160 @@
+"""
+Превью изображений для товаров, аватаров и медиафайлов пользователей.
+
+Для исходного файла ``products/photo.jpg`` превью лежат рядом в хранилище:
+``thumbnails/<ширина>/products/photo.webp``. Создаёт их только фоновая
+задача после загрузки (см. products/tasks.py), в запросе превью никогда
+не рендерятся. Все ширины создаются вместе, поэтому наличие самой
+маленькой означает, что готовы и остальные.
+
+Чтобы не проверять хранилище на каждой строке ответа, задача записывает
+имя обработанного файла в поле ``<поле>_thumbnails`` модели
+(Product.image_thumbnails, CustomUser.avatar_thumbnails,
+UserMedia.file_thumbnails). Превью готовы, если оно совпадает с текущим
+именем файла, — новый файл с другим именем сразу считается необработанным.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.apps import apps
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (160, 320, 640)
+THUMBNAIL_ROOT = 'thumbnails'
+
+if features.check('webp'):
+    THUMBNAIL_FORMAT, THUMBNAIL_EXTENSION = 'WEBP', 'webp'
+else:
+    THUMBNAIL_FORMAT, THUMBNAIL_EXTENSION = 'JPEG', 'jpg'
+
+
+def thumbnail_name(name, width):
+    base, _ = os.path.splitext(name)
+    return f'{THUMBNAIL_ROOT}/{width}/{base}.{THUMBNAIL_EXTENSION}'
+
+
+def _resolve(file):
+    """Принимает FieldFile или имя файла в default_storage."""
+    if isinstance(file, str):
+        return default_storage, file
+    return file.storage or default_storage, file.name
+
+
+def generate_thumbnails(file):
+    """Создаёт превью всех ширин. Возвращает False, если файл не является изображением."""
+    storage, source_name = _resolve(file)
+    try:
+        with storage.open(source_name, 'rb') as source:
+            image = Image.open(source)
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError) as exc:
+        logger.warning("Не удалось открыть изображение %s: %s", source_name, exc)
+        return False
+
+    if THUMBNAIL_FORMAT == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB' if THUMBNAIL_FORMAT == 'JPEG' else 'RGBA')
+
+    # От большей ширины к меньшей: каждое следующее уменьшение дешевле
+    for width in sorted(THUMBNAIL_WIDTHS, reverse=True):
+        if image.width > width:
+            image.thumbnail((width, image.height), Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, THUMBNAIL_FORMAT, quality=80)
+        name = thumbnail_name(source_name, width)
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(buffer.getvalue()))
+    return True
+
+
+def has_thumbnails(file):
+    if not file:
+        return False
+    storage, name = _resolve(file)
+    return storage.exists(thumbnail_name(name, min(THUMBNAIL_WIDTHS)))
+
+
+def ensure_thumbnails(file):
+    if not file:
+        return False
+    return has_thumbnails(file) or generate_thumbnails(file)
+
+
+def delete_thumbnails(file):
+    if not file:
+        return
+    storage, source_name = _resolve(file)
+    for width in THUMBNAIL_WIDTHS:
+        name = thumbnail_name(source_name, width)
+        if storage.exists(name):
+            storage.delete(name)
+
+
+def state_field(field):
+    return f'{field}_thumbnails'
+
+
+def thumbnails_ready(instance, field):
+    """Готовы ли превью файла из поля field — без обращения к хранилищу."""
+    file = getattr(instance, field)
+    return bool(file) and getattr(instance, state_field(field), '') == file.name
+
+
+def get_srcset(instance, field, request=None):
+    """
+    Карта ``{ширина: url}`` для атрибута srcset. Пока фоновая задача не
+    создала превью (и для не-изображений) возвращается None — клиент
+    показывает оригинал.
+    """
+    if not thumbnails_ready(instance, field):
+        return None
+    file = getattr(instance, field)
+    storage, name = _resolve(file)
+    srcset = {}
+    for width in THUMBNAIL_WIDTHS:
+        url = storage.url(thumbnail_name(name, width))
+        srcset[str(width)] = request.build_absolute_uri(url) if request else url
+    return srcset
+
+
+# Поля с изображениями, для которых ведётся <поле>_thumbnails
+THUMBNAIL_SOURCES = [
+    ('products.Product', 'image', {}),
+    ('authentication.CustomUser', 'avatar', {}),
+    ('authentication.UserMedia', 'file', {'media_type': 'image'}),
+]
+
+
+def backfill_thumbnails():
+    """
+    Отмечает файлы, превью которых уже лежат в хранилище, а для остальных
+    ставит process_image в очередь. Возвращает (отмечено, поставлено в очередь).
+    """
+    from .tasks import enqueue
+
+    marked = queued = 0
+    for label, field, filters in THUMBNAIL_SOURCES:
+        model = apps.get_model(label)
+        files = (
+            model.objects.filter(**filters)
+            .exclude(**{f'{field}__isnull': True})
+            .exclude(**{field: ''})
+            .exclude(**{state_field(field): models.F(field)})
+            .values_list('id', field)
+        )
+        for pk, name in files.iterator():
+            if has_thumbnails(name):
+                model.objects.filter(pk=pk, **{field: name}).update(**{state_field(field): name})
+                marked += 1
+            else:
+                enqueue('process_image', {'model': label, 'pk': pk, 'field': field})
+                queued += 1
+    return marked, queued
@@ -0,0 +1,161 @@
+"""
+Возобновляемая загрузка больших файлов частями.
+
+Протокол:
+  POST   uploads/                      — начать загрузку (filename, size, purpose);
+  PUT    uploads/<id>/chunks/<номер>/  — тело запроса — байты чанка;
+  GET    uploads/<id>/                 — какие чанки уже получены (для докачки);
+  POST   uploads/<id>/finalize/        — собрать файл и передать его по назначению.
+
+Чанк пишется прямо в частичный файл по смещению номер * chunk_size блоками
+по COPY_BLOCK_SIZE, поэтому память на загрузку — O(блока), а чанки можно
+слать в любом порядке и повторять. При завершении частичный файл
+перемещается в хранилище, а не копируется через память.
+"""
+import mimetypes
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from authentication.models import UserMedia
+
+from .models import ChunkedUpload
+from .tasks import enqueue
+
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class PartialFile(File):
+    """Файл на локальном диске, который хранилище может переместить целиком."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def partial_path(upload):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{upload.id}.part')
+
+
+def media_type_for(filename):
+    content_type = mimetypes.guess_type(filename)[0] or ''
+    return content_type.split('/')[0]
+
+
+def start_upload(user, filename, size, purpose):
+    filename = os.path.basename(filename or '')
+    if not filename:
+        raise ValidationError({'filename': 'Не указано имя файла'})
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise ValidationError({'size': 'Некорректный размер файла'})
+    if size <= 0:
+        raise ValidationError({'size': 'Файл пуст'})
+    if size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise ValidationError({'size': 'Файл слишком большой'})
+    if purpose not in dict(ChunkedUpload.PURPOSE_CHOICES):
+        raise ValidationError({'purpose': 'Недопустимое назначение загрузки'})
+    if purpose == 'user_media' and media_type_for(filename) not in ('image', 'video'):
+        raise ValidationError({'filename': 'Файл должен быть изображением или видео'})
+
+    upload = ChunkedUpload.objects.create(
+        user=user,
+        purpose=purpose,
+        filename=filename,
+        total_size=size,
+        chunk_size=settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+    )
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    with open(partial_path(upload), 'wb') as partial:
+        partial.truncate(size)
+    return upload
+
+
+def write_chunk(upload, index, stream, content_length):
+    """Пишет чанк из потока запроса в частичный файл, не читая его в память целиком."""
+    if not 0 <= index < upload.total_chunks:
+        raise ValidationError({'chunk': 'Некорректный номер чанка'})
+    expected = upload.chunk_length(index)
+    if content_length != expected:
+        raise ValidationError({'chunk': f'Ожидается {expected} байт, получено {content_length}'})
+
+    with open(partial_path(upload), 'r+b') as partial:
+        partial.seek(index * upload.chunk_size)
+        remaining = expected
+        while remaining:
+            block = stream.read(min(COPY_BLOCK_SIZE, remaining))
+            if not block:
+                raise ValidationError({'chunk': 'Чанк получен не полностью'})
+            partial.write(block)
+            remaining -= len(block)
+
+    # Чанки могут приходить параллельно — список обновляем под блокировкой строки
+    with transaction.atomic():
+        locked = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+        if index not in locked.received_chunks:
+            locked.received_chunks = sorted(locked.received_chunks + [index])
+            locked.save(update_fields=['received_chunks', 'updated_at'])
+    return locked
+
+
+def finalize_upload(upload, media_type=None, title='', description=''):
+    """
+    Переносит собранный файл в хранилище и создаёт итоговый объект.
+    Возвращает (сохранённый объект или имя файла, фоновая задача).
+    """
+    if not upload.is_complete:
+        missing = sorted(set(range(upload.total_chunks)) - set(upload.received_chunks))
+        raise ValidationError({'chunks': f'Получены не все чанки, не хватает: {missing[:20]}'})
+
+    path = partial_path(upload)
+    with open(path, 'rb') as partial:
+        content = PartialFile(partial, name=upload.filename)
+        if upload.purpose == 'user_media':
+            media_type = media_type or media_type_for(upload.filename)
+            if media_type not in ('image', 'video') or media_type != media_type_for(upload.filename):
+                raise ValidationError({'media_type': 'Недопустимый тип медиа'})
+            result = UserMedia(
+                user=upload.user, media_type=media_type, title=title, description=description
+            )
+            result.file.save(upload.filename, content, save=True)
+            task = None
+            if media_type == 'image':
+                task = enqueue(
+                    'process_image',
+                    {'model': 'authentication.UserMedia', 'pk': result.pk, 'field': 'file'},
+                    user=upload.user,
+                )
+        else:
+            result = default_storage.save(
+                f'chat_media/{upload.user.username}/{upload.filename}', content
+            )
+            task = enqueue('process_uploaded_file', {'name': result}, user=upload.user)
+
+    discard_upload(upload)
+    return result, task
+
+
+def discard_upload(upload):
+    try:
+        os.remove(partial_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def delete_expired_uploads():
+    """Удаляет брошенные загрузки старше CHUNKED_UPLOAD_EXPIRE_HOURS."""
+    expired = ChunkedUpload.objects.filter(
+        updated_at__lt=timezone.now() - timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRE_HOURS)
+    )
+    count = 0
+    for upload in expired.iterator():
+        discard_upload(upload)
+        count += 1
+    return count
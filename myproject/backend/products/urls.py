@@ -1,14 +1,15 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
 from products.views import (
-    ProductList, ProductCreate, CategoryList, ProductDetail, CartItemViewSet,
+    ProductList, ProductFacets, ProductCreate, ProductBulkImport, CategoryList, ProductDetail, CartItemViewSet,
     OrderViewSet, MyProductsList, UserProductsList, UserProfileView, UpdateProfileView,
     send_message, has_messages, unread_messages_count, user_message_data, ChatListView, ChatListWithDetailsView, ChatMessagesView, UploadFileView,
     MessageDetailView, MessageDeleteView, ReviewListCreateView, ReviewDetailView,
     SellerStatisticsView, 
     AdminUserViewSet, AdminProductViewSet, AdminCategoryViewSet, AdminCartItemViewSet,
     AdminOrderViewSet, AdminMessageViewSet, AdminReviewViewSet, GPTAssistantView,
-    ChatMessagesBetweenUsersView
+    ChatMessagesBetweenUsersView, AdminExportView, BackgroundTaskDetailView,
+    ChunkedUploadView, ChunkedUploadDetailView, ChunkedUploadChunkView, ChunkedUploadFinalizeView
 )
 from django.conf import settings
 from django.conf.urls.static import static
@@ -28,7 +29,14 @@ router.register('orders', OrderViewSet, basename='orders')
 
 urlpatterns = [
     path('', include(router.urls)),
+    re_path(
+        r'^admin/export/(?P<resource>products|orders|order-items)\.(?P<export_format>csv|ndjson)$',
+        AdminExportView.as_view(),
+        name='admin-export',
+    ),
     path('products/', ProductList.as_view(), name='product-list'),
+    path('products/facets/', ProductFacets.as_view(), name='product-facets'),
+    path('products/bulk/', ProductBulkImport.as_view(), name='product-bulk-import'),
     path('products/create/', ProductCreate.as_view(), name='product-create'),
     path('products/<int:pk>/', ProductDetail.as_view(), name='product-detail'),
     path('categories/', CategoryList.as_view(), name='category-list'),
@@ -47,6 +55,11 @@ urlpatterns = [
     path('users/me/', CurrentUserView.as_view(), name='current-user'),
     path('users/messages-data/', user_message_data, name='user_message_data'),
     path('upload/', UploadFileView.as_view(), name='upload-file'),
+    path('tasks/<int:pk>/', BackgroundTaskDetailView.as_view(), name='task-detail'),
+    path('uploads/', ChunkedUploadView.as_view(), name='chunked-upload'),
+    path('uploads/<uuid:upload_id>/', ChunkedUploadDetailView.as_view(), name='chunked-upload-detail'),
+    path('uploads/<uuid:upload_id>/chunks/<int:index>/', ChunkedUploadChunkView.as_view(), name='chunked-upload-chunk'),
+    path('uploads/<uuid:upload_id>/finalize/', ChunkedUploadFinalizeView.as_view(), name='chunked-upload-finalize'),
     path('messages/<int:pk>/', MessageDetailView.as_view(), name='message-detail'),
     path('messages/<int:pk>/delete/', MessageDeleteView.as_view(), name='message-delete'),
     path('users/<int:recipient_id>/reviews/', ReviewListCreateView.as_view(), name='review-list-create'),
@@ -1,6 +1,5 @@
-from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
-from django.db import models
+from django.db import models, transaction
 from django.db.models import (
     Avg,
     Case,
@@ -16,13 +15,17 @@ from django.db.models import (
     When,
     IntegerField,
     OuterRef,
+    Prefetch,
     DateTimeField,
     CharField,
 )
 from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.db.models.functions import ExtractHour, TruncMonth, ExtractIsoWeekDay, TruncDate, ExtractMonth, ExtractWeekDay, Lower
 from django.shortcuts import render, get_object_or_404
 from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
@@ -45,7 +48,8 @@ from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.serializers import SerializerMethodField
 
 from authentication.models import CustomUser
-from .models import Product, Category, CartItem, Order, OrderItem, Message, Review
+from authentication.serializers import UserMediaSerializer
+from .models import Product, Category, CartItem, Order, OrderItem, Message, Conversation, Review, BackgroundTask, ChunkedUpload
 from .serializers import (
     ProductSerializer,
     CategorySerializer,
@@ -56,7 +60,40 @@ from .serializers import (
     ReviewSerializer,
     UserProfileSerializer,
     UserSerializer,
+    BackgroundTaskSerializer,
+    ConversationSerializer,
 )
+from .bulk import ProductImporter, iter_csv_rows, iter_json_rows
+from .cart import add_to_cart, parse_product_id, parse_quantity
+from .caching import (
+    ConditionalGetMixin,
+    categories_etag,
+    categories_last_modified,
+    get_cached_categories,
+    get_cart_summary,
+    get_user_message_data,
+)
+from .checkout import checkout_cart
+from .conversations import (
+    get_conversation,
+    has_conversations,
+    mark_conversation_read,
+    message_page,
+    record_message,
+    refresh_last_message,
+    unread_total,
+)
+from .export import CONTENT_TYPES, STREAMERS
+from .filters import OrderFilter, ProductFilter
+from .idempotency import IdempotentCreateMixin, idempotent_response
+from .inbox import INBOX_ORDERING, inbox_queryset
+from .order_status import CONFLICT_ERROR, parse_order_ids, transition_error, transition_orders
+from .pagination import DefaultCursorPagination, OptionalCursorPagination
+from .reservations import annotate_available, reserve
+from .search import search_products
+from .sellers import is_order_seller, seller_items, seller_orders
+from .tasks import enqueue
+from .uploads import discard_upload, finalize_upload, start_upload, write_chunk
 from yandexcloud import SDK
 import requests
 import os
@@ -104,27 +141,113 @@ class ProductCreate(generics.CreateAPIView):
         serializer.save(farmer=self.request.user)
 
 
+class ProductBulkImport(APIView):
+    """
+    Массовое создание/обновление товаров продавца: JSON-массив строк
+    или CSV-файл в поле ``file`` (разделитель — параметр ``delimiter``).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is not None:
+            delimiter = request.query_params.get("delimiter", ",")
+            if len(delimiter) != 1:
+                return Response(
+                    {"error": "Разделитель должен быть одним символом"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            rows = iter_csv_rows(upload, delimiter=delimiter)
+        elif isinstance(request.data, list):
+            rows = iter_json_rows(request.data)
+        else:
+            return Response(
+                {"error": "Ожидается JSON-массив товаров или CSV-файл"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            report = ProductImporter(request.user).run(rows)
+        except UnicodeDecodeError:
+            return Response(
+                {"error": "CSV-файл должен быть в кодировке UTF-8"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if report["errors"] and not (report["created"] or report["updated"]):
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
+
 class ProductList(generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    pagination_class = OptionalCursorPagination
 
     def get_queryset(self):
-        queryset = Product.objects.filter(quantity__gt=0)  # Only show products with quantity > 0
+        # category и farmer нужны сериализатору для каждой строки — берём их одним JOIN
+        queryset = Product.objects.select_related("category", "farmer")
+        # По умолчанию фильтр in_stock оставляет только товары с quantity > 0
+        queryset = ProductFilter(self.request.query_params).filter_queryset(queryset)
         # Если пользователь авторизован - исключаем его товары
         if self.request.user.is_authenticated:
             queryset = queryset.exclude(farmer=self.request.user)
-        return queryset
+        if self.search_query:
+            queryset = search_products(queryset, self.search_query)
+        # available = quantity минус активные резервы — подзапросом в том же SELECT
+        queryset = annotate_available(queryset)
+        return queryset.order_by(*self.get_cursor_ordering())
+
+    @property
+    def search_query(self):
+        return self.request.query_params.get("q", "").strip()
+
+    def get_cursor_ordering(self):
+        # При поиске сначала самые релевантные товары, затем новые
+        if self.search_query:
+            return ("search_rank", "-created_at", "-id")
+        return ("-created_at", "-id")
 
 
+class ProductFacets(APIView):
+    """Фасетные счётчики для тех же фильтров и поиска, что и у ProductList."""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        queryset = Product.objects.all()
+        if request.user.is_authenticated:
+            queryset = queryset.exclude(farmer=request.user)
+        query = request.query_params.get("q", "").strip()
+        if query:
+            queryset = search_products(queryset, query, ranked=False)
+        product_filter = ProductFilter(request.query_params)
+        return Response(product_filter.facet_counts(queryset))
+
+
+@method_decorator(
+    condition(etag_func=categories_etag, last_modified_func=categories_last_modified),
+    name="get",
+)
 class CategoryList(generics.ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    # Справочник публичный, аутентификация не нужна. С кэшем в Redis 304
+    # обходится без запросов к БД; с DatabaseCache версия читается из
+    # таблицы кэша (см. CACHES в settings.py)
+    authentication_classes = []
+    permission_classes = [AllowAny]
 
+    def list(self, request, *args, **kwargs):
+        return Response(get_cached_categories())
 
-class ProductDetail(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Product.objects.all()
+
+class ProductDetail(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = Product.objects.select_related("category", "farmer")
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    conditional_prefix = "product"
+
+    def get_conditional_queryset(self):
+        return Product.objects.filter(pk=self.kwargs["pk"])
 
     def perform_update(self, serializer):
         if serializer.instance.farmer != self.request.user:
@@ -169,37 +292,22 @@ class CartItemViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return CartItem.objects.filter(user=self.request.user).select_related("product")
 
-    def perform_create(self, serializer):
-        product_id = self.request.data.get("product")
-        quantity = int(self.request.data.get("quantity", 1))
-
-        try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            raise ValidationError({"product": "Товар не найден"})
-
-        current_cart_items = CartItem.objects.filter(user=self.request.user)
-
-        if current_cart_items.exists():
-            first_item_farmer = current_cart_items.first().product.farmer
-            if product.farmer != first_item_farmer:
-                raise ValidationError(
-                    "Нельзя добавлять товары от разных продавцов в одну корзину."
-                )
-
-        cart_item, created = CartItem.objects.get_or_create(
-            user=self.request.user, product=product, defaults={"quantity": quantity}
+    def create(self, request, *args, **kwargs):
+        # Быстрый путь без ModelSerializer: проверка продавца, upsert позиции
+        # и резерв товара укладываются в три запроса (см. products/cart.py)
+        cart_item = add_to_cart(
+            request.user,
+            parse_product_id(request.data.get("product")),
+            parse_quantity(request.data.get("quantity", 1)),
         )
-
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
+        return Response(CartItemSerializer(cart_item).data, status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            reserve(serializer.save())
         return Response(serializer.data)
 
     def list(self, request, *args, **kwargs):
@@ -213,30 +321,62 @@ class CartItemViewSet(viewsets.ModelViewSet):
         cart_items.delete()
         return Response({"status": "cart cleared"})
 
+    @action(detail=False, methods=["get"])
+    def summary(self, request):
+        """Лёгкая сводка для значка корзины: позиции, количество, итог."""
+        return Response(get_cart_summary(request.user))
+
+    @action(detail=False, methods=["post"])
+    def checkout(self, request):
+        """Оформляет заказ из корзины одним запросом и очищает корзину."""
+        return idempotent_response(request, lambda: self._checkout(request))
+
+    def _checkout(self, request):
+        serializer = OrderSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        order_fields = dict(serializer.validated_data)
+        order_fields.pop("items", None)
+        order_fields.pop("user", None)
+        order = checkout_cart(request.user, **order_fields)
+        order = OrderSerializer.setup_eager_loading(Order.objects.all()).get(pk=order.pk)
+        return Response(
+            OrderSerializer(order, context={"request": request}).data,
+            status=status.HTTP_201_CREATED,
+        )
+
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OptionalCursorPagination
 
     def get_queryset(self):
         if self.action == "seller_orders":
-            return Order.objects.filter(
-                items__product__farmer=self.request.user
-            ).distinct()
-        return Order.objects.filter(user=self.request.user)
-
-    @action(detail=False, methods=["get"])
+            # Полусоединение через id__in вместо DISTINCT по всем колонкам заказа:
+            # подзапрос читает только индекс orderitem (seller_id, order_id)
+            queryset = seller_orders(self.request.user)
+        else:
+            queryset = Order.objects.filter(user=self.request.user)
+        if self.action in ("list", "seller_orders"):
+            queryset = OrderFilter(self.request.query_params).filter_queryset(queryset)
+        return OrderSerializer.setup_eager_loading(queryset).order_by(*self.get_cursor_ordering())
+
+    def get_cursor_ordering(self):
+        # ordering=oldest — от старых заказов к новым
+        if self.request.query_params.get("ordering") == "oldest":
+            return ("created_at", "id")
+        return ("-created_at", "-id")
+
+    @action(detail=False, methods=["get"], pagination_class=DefaultCursorPagination)
     def seller_orders(self, request):
+        # Заказы продавца копятся без ограничений, поэтому отдаются только страницами
         try:
-            seller = request.user
-            orders = (
-                Order.objects.filter(items__product__farmer=seller)
-                .distinct()
-                .prefetch_related("items__product")
-            )
-            serializer = self.get_serializer(orders, many=True)
-            return Response(serializer.data)
+            page = self.paginate_queryset(self.get_queryset())
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        except ValidationError:
+            raise
         except Exception as e:
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -249,7 +389,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         reason = request.data.get("reason", "")
 
         # Проверка: если пользователь — покупатель или продавец
-        if order.user == user or order.items.filter(product__farmer=user).exists():
+        if order.user == user or is_order_seller(order, user):
             if order.status != "processing":
                 return Response(
                     {"error": "Невозможно отменить заказ в текущем статусе"},
@@ -271,7 +411,7 @@ class OrderViewSet(viewsets.ModelViewSet):
     def confirm(self, request, pk=None):
         order = get_object_or_404(Order, pk=pk)
         seller = request.user
-        if not order.items.filter(product__farmer=seller).exists():
+        if not is_order_seller(order, seller):
             return Response(
                 {"error": "Вы не можете подтвердить этот заказ"},
                 status=status.HTTP_403_FORBIDDEN,
@@ -288,71 +428,63 @@ class OrderViewSet(viewsets.ModelViewSet):
         new_status = request.data.get("status")
 
         # Проверяем, является ли пользователь продавцом заказа
-        if not order.items.filter(product__farmer=seller).exists():
+        if not is_order_seller(order, seller):
             return Response(
                 {"error": "Вы не можете изменить статус этого заказа"},
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        # Проверяем валидность нового статуса
-        valid_statuses = [choice[0] for choice in Order.STATUS_CHOICES]
-        if new_status not in valid_statuses:
-            return Response(
-                {"error": "Недопустимый статус заказа"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # Проверяем возможность изменения статуса
-        if order.status == "canceled":
-            return Response(
-                {"error": "Нельзя изменить статус отмененного заказа"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        # Допустимые переходы описаны в order_status.py
+        error = transition_error(order.status, new_status)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
 
-        if order.status == "delivered":
-            return Response(
-                {"error": "Нельзя изменить статус доставленного заказа"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # Проверяем последовательность статусов
-        status_sequence = ["processing", "confirmed", "shipped", "in_transit", "delivered"]
-        current_index = status_sequence.index(order.status) if order.status in status_sequence else -1
-        new_index = status_sequence.index(new_status) if new_status in status_sequence else -1
-
-        if new_index <= current_index:
-            return Response(
-                {"error": "Невозможно вернуться к предыдущему статусу"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # Обновляем статус
+        # Условный UPDATE вместо save(): заказ могли параллельно отменить
+        updated = Order.objects.filter(pk=order.pk, status=order.status).update(
+            status=new_status
+        )
+        if not updated:
+            return Response({"error": CONFLICT_ERROR}, status=status.HTTP_409_CONFLICT)
         order.status = new_status
-        order.save()
         serializer = self.get_serializer(order)
         return Response(serializer.data)
 
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated])
+    def bulk_update_status(self, request):
+        order_ids = parse_order_ids(request.data.get("order_ids"))
+        results = transition_orders(request.user, order_ids, request.data.get("status"))
+        return Response(
+            {
+                "updated": sum(result["success"] for result in results),
+                "results": results,
+            }
+        )
+
     def perform_create(self, serializer):
         serializer.save()
 
 
-class MyProductsList(generics.ListAPIView):
+class MyProductsList(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
+    conditional_prefix = "my-products"
 
     def get_queryset(self):
         return Product.objects.filter(farmer=self.request.user).select_related(
-            "category"
+            "category", "farmer"
         )
 
 
-class UserProductsList(generics.ListAPIView):
+class UserProductsList(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    conditional_prefix = "user-products"
 
     def get_queryset(self):
         user_id = self.kwargs["user_id"]
-        return Product.objects.filter(farmer_id=user_id)
+        return Product.objects.filter(farmer_id=user_id).select_related(
+            "category", "farmer"
+        )
 
     # Добавьте контекст запроса для формирования полных URL
     def get_serializer_context(self):
@@ -373,7 +505,9 @@ def send_message(request):
 
     serializer = MessageSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save(sender=request.user)
+        with transaction.atomic():
+            message = serializer.save(sender=request.user)
+            record_message(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -385,51 +519,23 @@ def user_message_data(request):
     Get user data along with message status and unread message count in a single request
     """
     user = request.user
-    
-    # Use Django's cache framework if available
-    # or implement a simple in-memory cache with timeout
-    cache_key = f"user_message_data_{user.id}"
-    cache_timeout = 5  # 5 seconds cache
-    
-    # Check if we have this data in request session cache
-    # This helps prevent excessive database queries
-    if hasattr(request, '_cached_data') and cache_key in request._cached_data:
-        cached_item = request._cached_data[cache_key]
-        # Check if cache is still valid
-        if cached_item['expires'] > timezone.now():
-            return Response(cached_item['data'])
-    
-    # Data not in cache, fetch from database
-    # Check if user has any messages
-    has_messages = Message.objects.filter(Q(sender=user) | Q(recipient=user)).exists()
-    
-    # Get unread message count
-    unread_count = Message.objects.filter(recipient=user, is_read=False).count()
-    
-    # Prepare response data
-    response_data = {
-        "user": UserSerializer(user, context={"request": request}).data,
-        "has_messages": has_messages,
-        "unread_count": unread_count
-    }
-    
-    # Store in request cache
-    if not hasattr(request, '_cached_data'):
-        request._cached_data = {}
-    
-    request._cached_data[cache_key] = {
-        'data': response_data,
-        'expires': timezone.now() + timedelta(seconds=cache_timeout)
-    }
-    
-    return Response(response_data)
+
+    def build():
+        return {
+            "user": UserSerializer(user, context={"request": request}).data,
+            "has_messages": has_conversations(user),
+            "unread_count": unread_total(user),
+        }
+
+    # Кэш Django, а не атрибут request: тот жил ровно один запрос
+    return Response(get_user_message_data(user, build))
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def unread_messages_count(request):
     user = request.user
-    count = Message.objects.filter(recipient=user, is_read=False).count()
+    count = unread_total(user)
     return Response({"unread_count": count})
 
 
@@ -437,62 +543,26 @@ def unread_messages_count(request):
 @permission_classes([IsAuthenticated])
 def has_messages(request):
     user = request.user
-    # Проверяем, есть ли сообщения, где пользователь — отправитель или получатель
-    has_messages = Message.objects.filter(Q(sender=user) | Q(recipient=user)).exists()
+    # Диалог появляется с первым сообщением в любую сторону
+    has_messages = has_conversations(user)
     return Response({"has_messages": has_messages})
 
 
-class ChatListWithDetailsView(APIView):
+class ChatListWithDetailsView(generics.ListAPIView):
+    """
+    Диалоги пользователя, новые сверху. Весь список — один запрос
+    (см. inbox.py); ?page_size / ?cursor включают курсорную пагинацию по
+    времени последней активности.
+    """
+    serializer_class = ConversationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OptionalCursorPagination
 
-    def get(self, request):
-        user = request.user
-        # Get all users with whom the current user has exchanged messages
-        sent_messages = Message.objects.filter(sender=user).values('recipient').distinct()
-        received_messages = Message.objects.filter(recipient=user).values('sender').distinct()
-
-        chat_partners_ids = set()
-        for msg in sent_messages:
-            chat_partners_ids.add(msg['recipient'])
-        for msg in received_messages:
-            chat_partners_ids.add(msg['sender'])
-
-        # Get the partner users
-        partners = User.objects.filter(id__in=chat_partners_ids)
-        
-        result = []
-        for partner in partners:
-            # Get the last message
-            last_message = Message.objects.filter(
-                (Q(sender=user) & Q(recipient=partner)) | 
-                (Q(sender=partner) & Q(recipient=user)),
-                is_deleted=False
-            ).order_by('-timestamp').first()
-            
-            # Count unread messages
-            unread_count = Message.objects.filter(
-                sender=partner,
-                recipient=user,
-                is_read=False,
-                is_deleted=False
-            ).count()
-            
-            # Prepare the partner data
-            partner_data = UserSerializer(partner, context={"request": request}).data
-            
-            # Add last message and unread count
-            partner_data['last_message'] = MessageSerializer(last_message).data if last_message else None
-            partner_data['unread_count'] = unread_count
-            
-            result.append(partner_data)
-        
-        # Sort by last message timestamp (newest first)
-        result.sort(
-            key=lambda x: x['last_message']['timestamp'] if x['last_message'] else '1970-01-01T00:00:00Z',
-            reverse=True
-        )
-        
-        return Response(result)
+    def get_queryset(self):
+        return inbox_queryset(self.request.user)
+
+    def get_cursor_ordering(self):
+        return INBOX_ORDERING
 
 
 class ChatListView(APIView):
@@ -500,20 +570,10 @@ class ChatListView(APIView):
 
     def get(self, request):
         user = request.user
-        sent_messages = (
-            Message.objects.filter(sender=user).values("recipient").distinct()
-        )
-        received_messages = (
-            Message.objects.filter(recipient=user).values("sender").distinct()
+        partners = User.objects.filter(
+            Q(id__in=Conversation.objects.filter(first_user=user).values("second_user"))
+            | Q(id__in=Conversation.objects.filter(second_user=user).values("first_user"))
         )
-
-        chat_partners = set()
-        for msg in sent_messages:
-            chat_partners.add(msg["recipient"])
-        for msg in received_messages:
-            chat_partners.add(msg["sender"])
-
-        partners = User.objects.filter(id__in=chat_partners)
         serializer = UserSerializer(partners, many=True, context={"request": request})
         return Response(serializer.data)
 
@@ -524,19 +584,22 @@ class ChatMessagesView(APIView):
     def get(self, request, pk):
         user = request.user
         partner = get_object_or_404(User, pk=pk)
-        messages = Message.objects.filter(
-            (Q(sender=user) & Q(recipient=partner))
-            | (Q(sender=partner) & Q(recipient=user)),
-            is_deleted=False,  # Фильтруем удаленные сообщения
-        ).order_by("timestamp")
-        
-        # Mark all messages from the partner as read
-        Message.objects.filter(
-            sender=partner,
-            recipient=user,
-            is_read=False
-        ).update(is_read=True)
-        
+        cursor = {}
+        for param in ("before_id", "after_id"):
+            if param in request.query_params:
+                try:
+                    cursor[param] = int(request.query_params[param])
+                except ValueError:
+                    raise ValidationError({param: "Некорректный ID сообщения"})
+        if len(cursor) > 1:
+            raise ValidationError({"error": "Укажите только before_id или after_id"})
+
+        # Новые сообщения прочитаны, как только их страница отдана клиенту
+        if "before_id" not in cursor:
+            mark_conversation_read(user, partner.id)
+
+        # Страница по MESSAGES_PAGE_SIZE, по возрастанию времени, как и раньше
+        messages = message_page(user.id, partner.id, **cursor)
         serializer = MessageSerializer(messages, many=True)
         return Response(serializer.data)
 
@@ -549,7 +612,7 @@ class ChatMessagesBetweenUsersView(APIView):
             (Q(sender_id=sender_id) & Q(recipient_id=recipient_id))
             | (Q(sender_id=recipient_id) & Q(recipient_id=sender_id)),
             is_deleted=False
-        ).order_by("timestamp")
+        ).select_related("sender", "recipient").order_by("timestamp")
         
         serializer = MessageSerializer(messages, many=True)
         return Response(serializer.data)
@@ -569,11 +632,95 @@ class UploadFileView(APIView):
         # Создаем путь для сохранения файла с именем пользователя
         user_folder = f"chat_media/{request.user.username}"
         
-        # Сохраняем файл в созданную папку
-        file_name = default_storage.save(f"{user_folder}/{file.name}", ContentFile(file.read()))
+        # Сохраняем файл в созданную папку: хранилище копирует загрузку
+        # по частям, не читая её в память целиком
+        file_name = default_storage.save(f"{user_folder}/{file.name}", file)
         file_url = default_storage.url(file_name)
+        task = enqueue('process_uploaded_file', {'name': file_name}, user=request.user)
+
+        return Response({"url": file_url, "task_id": task.id}, status=status.HTTP_201_CREATED)
+
+
+class BackgroundTaskDetailView(generics.RetrieveAPIView):
+    """Статус фоновой обработки загруженного файла (для опроса клиентом)."""
+    serializer_class = BackgroundTaskSerializer
+    permission_classes = [IsAuthenticated]
 
-        return Response({"url": file_url}, status=status.HTTP_201_CREATED)
+    def get_queryset(self):
+        return BackgroundTask.objects.filter(user=self.request.user)
+
+
+def chunked_upload_state(upload):
+    return {
+        "id": str(upload.id),
+        "filename": upload.filename,
+        "purpose": upload.purpose,
+        "size": upload.total_size,
+        "chunk_size": upload.chunk_size,
+        "total_chunks": upload.total_chunks,
+        "received_chunks": upload.received_chunks,
+    }
+
+
+class ChunkedUploadView(APIView):
+    """Начало загрузки файла частями: чат-вложения и медиафайлы профиля."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        upload = start_upload(
+            request.user,
+            request.data.get("filename"),
+            request.data.get("size"),
+            request.data.get("purpose", "chat"),
+        )
+        return Response(chunked_upload_state(upload), status=status.HTTP_201_CREATED)
+
+
+class ChunkedUploadDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, upload_id):
+        upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+        return Response(chunked_upload_state(upload))
+
+    def delete(self, request, upload_id):
+        upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+        discard_upload(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ChunkedUploadChunkView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, upload_id, index):
+        upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            content_length = 0
+        # Тело читаем из потока напрямую, минуя парсеры DRF
+        upload = write_chunk(upload, index, request.stream, content_length)
+        return Response(chunked_upload_state(upload))
+
+
+class ChunkedUploadFinalizeView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+        result, task = finalize_upload(
+            upload,
+            media_type=request.data.get("media_type"),
+            title=request.data.get("title", ""),
+            description=request.data.get("description", ""),
+        )
+        if upload.purpose == "user_media":
+            data = dict(UserMediaSerializer(result, context={"request": request}).data)
+        else:
+            data = {"url": default_storage.url(result)}
+        if task is not None:
+            data["task_id"] = task.id
+        return Response(data, status=status.HTTP_201_CREATED)
 
 
 class MessageDetailView(APIView):
@@ -597,8 +744,10 @@ class MessageDetailView(APIView):
                 {"error": "Вы не можете удалить это сообщение"},
                 status=status.HTTP_403_FORBIDDEN,
             )
-        message.is_deleted = True
-        message.save()
+        with transaction.atomic():
+            message.is_deleted = True
+            message.save()
+            refresh_last_message(message.sender_id, message.recipient_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -610,8 +759,10 @@ class MessageDeleteView(APIView):
                 {"error": "Вы не можете удалить это сообщение"},
                 status=status.HTTP_403_FORBIDDEN,
             )
-        message.is_deleted = True
-        message.save()
+        with transaction.atomic():
+            message.is_deleted = True
+            message.save()
+            refresh_last_message(message.sender_id, message.recipient_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -729,16 +880,15 @@ class SellerStatisticsView(APIView):
         )
 
     def get_orders_data(self, seller, start_date=None, end_date=None):
-        orders = Order.objects.filter(
-            items__product__farmer=seller,
+        orders = seller_orders(seller).filter(
             status__in=["confirmed", "shipped", "in_transit", "delivered"],
         )
         if start_date and end_date:
             orders = orders.filter(
                 created_at__range=(start_date, end_date + timedelta(days=1))
             )
-        total_orders = orders.distinct().count()
-        order_items = OrderItem.objects.filter(order__in=orders, product__farmer=seller)
+        total_orders = orders.count()
+        order_items = OrderItem.objects.filter(order__in=orders, seller=seller)
         total_quantity = order_items.aggregate(Sum("quantity"))["quantity__sum"] or 0
         total_revenue = (
             order_items.aggregate(total_revenue=Sum(F("quantity") * F("price")))[
@@ -754,7 +904,7 @@ class SellerStatisticsView(APIView):
 
     def get_products_data(self, seller, start_date=None, end_date=None):
         qs = OrderItem.objects.filter(
-            product__farmer=seller,
+            seller=seller,
             order__status__in=["confirmed", "shipped", "in_transit", "delivered"],
         )
         if start_date and end_date:
@@ -771,7 +921,7 @@ class SellerStatisticsView(APIView):
         )
 
     def get_customers_data(self, seller, start_date=None, end_date=None):
-        qs = Order.objects.filter(items__product__farmer=seller)
+        qs = seller_orders(seller)
         if start_date and end_date:
             qs = qs.filter(created_at__range=(start_date, end_date + timedelta(days=1)))
         customers = qs.values(
@@ -791,7 +941,7 @@ class SellerStatisticsView(APIView):
 
     def get_monthly_stats(self, seller, start_date=None, end_date=None):
         qs = OrderItem.objects.filter(
-            product__farmer=seller,
+            seller=seller,
             order__status__in=["confirmed", "shipped", "in_transit", "delivered"],
         )
         if start_date and end_date:
@@ -813,9 +963,7 @@ class SellerStatisticsView(APIView):
         return monthly_data
 
     def get_rating_stats(self, seller, start_date=None, end_date=None):
-        order_count_subquery = Order.objects.filter(
-            user=OuterRef("recipient"), items__product__farmer=seller
-        )
+        order_count_subquery = seller_orders(seller).filter(user=OuterRef("recipient"))
         if start_date and end_date:
             order_count_subquery = order_count_subquery.filter(
                 created_at__range=(start_date, end_date + timedelta(days=1))
@@ -828,7 +976,7 @@ class SellerStatisticsView(APIView):
         rating_stats = (
             Review.objects.filter(
                 recipient__in=CustomUser.objects.filter(
-                    id__in=OrderItem.objects.filter(product__farmer=seller)
+                    id__in=seller_items(seller)
                     .values_list("order__user", flat=True)
                     .distinct()
                 )
@@ -844,7 +992,7 @@ class SellerStatisticsView(APIView):
 
     def get_avg_customer_rating(self, seller):
         customer_ids = (
-            OrderItem.objects.filter(product__farmer=seller)
+            seller_items(seller)
             .values_list("order__user__id", flat=True)
             .distinct()
         )
@@ -857,8 +1005,7 @@ class SellerStatisticsView(APIView):
         return avg_rating
 
     def get_peak_hours(self, seller, start_date=None, end_date=None):
-        qs = Order.objects.filter(
-            items__product__farmer=seller,
+        qs = seller_orders(seller).filter(
             status__in=["confirmed", "shipped", "in_transit", "delivered"],
         )
         if start_date and end_date:
@@ -872,7 +1019,7 @@ class SellerStatisticsView(APIView):
 
     def get_purchases(self, seller, start_date=None, end_date=None):
         qs = OrderItem.objects.filter(
-            product__farmer=seller,
+            seller=seller,
             order__status__in=["confirmed", "shipped", "in_transit", "delivered"],
         )
         if start_date and end_date:
@@ -890,7 +1037,7 @@ class SellerStatisticsView(APIView):
 
     def get_seasonal_products(self, seller, start_date=None, end_date=None):
         qs = OrderItem.objects.filter(
-            product__farmer=seller,
+            seller=seller,
             order__status__in=["confirmed", "shipped", "in_transit", "delivered"],
         )
         if start_date and end_date:
@@ -905,7 +1052,7 @@ class SellerStatisticsView(APIView):
 
     def get_category_sales(self, seller, start_date=None, end_date=None):
         qs = OrderItem.objects.filter(
-            product__farmer=seller,
+            seller=seller,
             order__status__in=["confirmed", "shipped", "in_transit", "delivered"],
         )
         if start_date and end_date:
@@ -923,8 +1070,7 @@ class SellerStatisticsView(APIView):
         )
 
     def get_sales_by_day_of_week(self, seller, start_date=None, end_date=None):
-        qs = Order.objects.filter(
-            items__product__farmer=seller,
+        qs = seller_orders(seller).filter(
             status__in=["confirmed", "shipped", "in_transit", "delivered"],
         )
         if start_date and end_date:
@@ -940,25 +1086,25 @@ class SellerStatisticsView(APIView):
         )
 
     def get_order_statuses(self, seller, start_date=None, end_date=None):
-        qs = Order.objects.filter(items__product__farmer=seller)
+        qs = seller_orders(seller)
         if start_date and end_date:
             qs = qs.filter(created_at__range=(start_date, end_date + timedelta(days=1)))
         return qs.values("status").annotate(count=Count("id", distinct=True))
 
     def get_delivery_pickup_stats(self, seller, start_date=None, end_date=None):
-        qs = Order.objects.filter(items__product__farmer=seller)
+        qs = seller_orders(seller)
         if start_date and end_date:
             qs = qs.filter(created_at__range=(start_date, end_date + timedelta(days=1)))
         return qs.values("delivery_type").annotate(count=Count("id", distinct=True))
 
     def get_payment_method_stats(self, seller, start_date=None, end_date=None):
-        qs = Order.objects.filter(items__product__farmer=seller)
+        qs = seller_orders(seller)
         if start_date and end_date:
             qs = qs.filter(created_at__range=(start_date, end_date + timedelta(days=1)))
         return qs.values("payment_method").annotate(count=Count("id", distinct=True))
 
     def get_cancellation_stats(self, seller, start_date=None, end_date=None):
-        qs = Order.objects.filter(items__product__farmer=seller, status="canceled")
+        qs = seller_orders(seller).filter(status="canceled")
         if start_date and end_date:
             qs = qs.filter(created_at__range=(start_date, end_date + timedelta(days=1)))
         cancellations = qs.aggregate(total_cancellations=Count("id", distinct=True))
@@ -977,8 +1123,7 @@ class SellerStatisticsView(APIView):
         }
         
         # Get customer IDs who bought from this seller
-        customer_ids = Order.objects.filter(
-            items__product__farmer=seller,
+        customer_ids = seller_orders(seller).filter(
             status__in=["confirmed", "shipped", "in_transit", "delivered"]
         ).values_list('user_id', flat=True).distinct()
         
@@ -995,25 +1140,29 @@ class SellerStatisticsView(APIView):
         }
 
     def get_customer_purchases(self, seller, start_date=None, end_date=None):
-        orders = Order.objects.filter(
-            items__product__farmer=seller,
+        orders = seller_orders(seller).filter(
             status__in=["confirmed", "shipped", "in_transit", "delivered", "canceled"],
         )
         if start_date and end_date:
             orders = orders.filter(
                 created_at__range=(start_date, end_date + timedelta(days=1))
             )
+        # Позиции продавца подгружаются одним запросом на все заказы
         orders = (
             orders.select_related("user")
-            .prefetch_related("items__product")
-            .distinct()
+            .prefetch_related(
+                Prefetch(
+                    "items",
+                    queryset=seller_items(seller).select_related("product"),
+                    to_attr="seller_items",
+                )
+            )
             .order_by("-created_at")
         )
         customer_purchases = []
         for order in orders:
-            seller_items = order.items.filter(product__farmer=seller)
             total_seller_amount = sum(
-                item.quantity * item.price for item in seller_items
+                item.quantity * item.price for item in order.seller_items
             )
             customer_purchases.append(
                 {
@@ -1035,7 +1184,7 @@ class SellerStatisticsView(APIView):
                             "price": float(item.price),
                             "total": float(item.quantity * item.price),
                         }
-                        for item in seller_items
+                        for item in order.seller_items
                     ],
                 }
             )
@@ -1121,6 +1270,28 @@ class AdminMessageViewSet(viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [IsAdminUser]
 
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            message = serializer.save(sender=self.request.user)
+            record_message(message)
+
+    def perform_update(self, serializer):
+        previous_recipient_id = serializer.instance.recipient_id
+        with transaction.atomic():
+            message = serializer.save()
+            if message.recipient_id != previous_recipient_id:
+                # Сообщение ушло в другой диалог: старый пересчитываем, а нового может
+                # ещё не быть — тогда он создаётся как при отправке
+                refresh_last_message(message.sender_id, previous_recipient_id)
+                if get_conversation(message.sender_id, message.recipient_id) is None:
+                    record_message(message)
+            refresh_last_message(message.sender_id, message.recipient_id)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            refresh_last_message(instance.sender_id, instance.recipient_id)
+
 
 class AdminReviewViewSet(viewsets.ModelViewSet):
     queryset = Review.objects.all()
@@ -1128,6 +1299,20 @@ class AdminReviewViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminUser]
 
 
+class AdminExportView(APIView):
+    """Потоковая выгрузка products / orders / order-items в CSV или NDJSON."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, resource, export_format):
+        response = StreamingHttpResponse(
+            STREAMERS[export_format](resource),
+            content_type=CONTENT_TYPES[export_format],
+        )
+        filename = f"{resource}-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
 class GPTAssistantView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -1532,12 +1717,19 @@ class GPTAssistantView(APIView):
         
         # Если все еще не нашли достаточно совпадений, используем частичное совпадение
         if len(matched_products_info) < 3:
-            partial_matches = all_products.filter(
-                Q(name__icontains=cleaned_name) | 
-                Q(name__icontains=ingredient_name)
-            ).exclude(id__in=found_product_ids)
+            partial_matches = list(search_products(
+                all_products.select_related("category"), cleaned_name
+            ).exclude(id__in=found_product_ids).order_by("search_rank")[:3])
+            # Исходное название тоже ищем подстрокой: после нормализации
+            # («помидоры» → «томат») очищенное имя может не найти товар
+            if len(partial_matches) < 3:
+                partial_matches += all_products.select_related("category").filter(
+                    name__icontains=ingredient_name
+                ).exclude(
+                    id__in=found_product_ids | {product.id for product in partial_matches}
+                )[:3 - len(partial_matches)]
             
-            for product in partial_matches[:3]:
+            for product in partial_matches:
                 match_info = {
                     "id": product.id,
                     "name": product.name,
@@ -24,10 +24,12 @@ const SellerOrdersPage = () => {
   const [endDate, setEndDate] = useState("");
   const [minAmount, setMinAmount] = useState("");
   const [maxAmount, setMaxAmount] = useState("");
-  const [filteredOrders, setFilteredOrders] = useState([]);
   const [currentPage, setCurrentPage] = useState(1);
   const [ordersPerPage] = useState(10); // Заказов на странице
   const [dateSort, setDateSort] = useState("newest");
+  // Сервер отдаёт заказы страницами; ссылка на следующую страницу
+  const [nextPageUrl, setNextPageUrl] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   // Функция для получения возможных следующих статусов
   const getPossibleNextStatuses = (currentStatus) => {
@@ -139,100 +141,81 @@ const SellerOrdersPage = () => {
     }
   };
 
-  // Загрузка заказов
+  // Фильтры и сортировка уходят серверу (OrderFilter), поэтому работают
+  // по всем заказам продавца, а не только по уже загруженным страницам
+  const buildOrdersUrl = () => {
+    const params = new URLSearchParams({ page_size: "50", ordering: dateSort });
+    if (searchTerm.trim().length >= 3) params.set("search", searchTerm.trim());
+    if (statusFilter) params.set("status", statusFilter);
+    if (startDate) params.set("date_from", startDate);
+    if (endDate) params.set("date_to", endDate);
+    if (minAmount) params.set("min_amount", minAmount);
+    if (maxAmount) params.set("max_amount", maxAmount);
+    return `http://localhost:8000/api/orders/seller_orders/?${params}`;
+  };
+
+  // Загрузка одной страницы заказов по ссылке
+  const fetchOrdersPage = async (url) => {
+    const token = Cookies.get("token");
+    if (!token) {
+      navigate("/login");
+      return null;
+    }
+    const response = await axios.get(url, {
+      headers: { Authorization: `Bearer ${token}` },
+    });
+    return response.data;
+  };
+
+  // Загрузка первой страницы при открытии и при каждом изменении фильтров
   useEffect(() => {
-    const fetchSellerOrders = async () => {
-      const token = Cookies.get("token");
-      if (!token) {
-        navigate("/login");
-        return;
-      }
+    let cancelled = false;
+    // Пауза, чтобы не запрашивать сервер на каждый введённый символ
+    const timer = setTimeout(async () => {
       try {
-        const response = await axios.get(
-          "http://localhost:8000/api/orders/seller_orders/",
-          {
-            headers: { Authorization: `Bearer ${token}` },
-          }
-        );
-        // Сортируем заказы сразу после получения
-        const sortedOrders = [...response.data].sort((a, b) => {
-          const dateA = moment(a.created_at);
-          const dateB = moment(b.created_at);
-          return dateB - dateA; // Сортировка от новых к старым
-        });
-        setOrders(sortedOrders);
-        setFilteredOrders(sortedOrders);
+        const data = await fetchOrdersPage(buildOrdersUrl());
+        // Ответ на устаревшие фильтры не должен затереть актуальный
+        if (cancelled || !data) return;
+        setOrders(data.results);
+        setNextPageUrl(data.next);
+        setCurrentPage(1);
+        setError(null);
       } catch (err) {
-        setError(err.message);
+        if (!cancelled) setError(err.message);
       } finally {
-        setLoading(false);
+        if (!cancelled) setLoading(false);
       }
+    }, 300);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
     };
-    fetchSellerOrders();
-  }, [navigate]);
-
-  // Фильтрация заказов
-  useEffect(() => {
-    let filtered = orders;
-
-    if (searchTerm.length >= 3) {
-      filtered = filtered.filter(
-        (order) =>
-          order.id.toString().includes(searchTerm) ||
-          order.items.some((item) =>
-            (item.product?.name || "").toLowerCase().includes(searchTerm.toLowerCase())
-          )
-      );
-    }
-
-    if (statusFilter) {
-      filtered = filtered.filter((order) => order.status === statusFilter);
-    }
-
-    if (startDate) {
-      filtered = filtered.filter((order) =>
-        moment(order.created_at).isSameOrAfter(moment(startDate))
-      );
-    }
-
-    if (endDate) {
-      filtered = filtered.filter((order) =>
-        moment(order.created_at).isSameOrBefore(moment(endDate))
-      );
-    }
-
-    if (minAmount) {
-      filtered = filtered.filter(
-        (order) => order.total_amount >= parseFloat(minAmount)
-      );
-    }
-
-    if (maxAmount) {
-      filtered = filtered.filter(
-        (order) => order.total_amount <= parseFloat(maxAmount)
-      );
-    }
-
-    // Add sorting logic
-    filtered.sort((a, b) => {
-      const dateA = moment(a.created_at);
-      const dateB = moment(b.created_at);
-      return dateSort === "newest" ? dateB - dateA : dateA - dateB;
-    });
-
-    setFilteredOrders(filtered);
-    setCurrentPage(1);
   }, [
+    navigate,
     searchTerm,
     statusFilter,
     startDate,
     endDate,
     minAmount,
     maxAmount,
-    orders,
     dateSort,
   ]);
 
+  const loadMoreOrders = async () => {
+    setLoadingMore(true);
+    try {
+      const data = await fetchOrdersPage(nextPageUrl);
+      if (data) {
+        setOrders((previous) => [...previous, ...data.results]);
+        setNextPageUrl(data.next);
+      }
+    } catch (err) {
+      toast.error("Не удалось загрузить заказы");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Подтверждение заказа
   const confirmOrderAction = async (orderId) => {
     const token = Cookies.get("token");
@@ -325,7 +308,7 @@ const SellerOrdersPage = () => {
   // Вычисление текущих заказов для отображения
   const indexOfLastOrder = currentPage * ordersPerPage;
   const indexOfFirstOrder = indexOfLastOrder - ordersPerPage;
-  const currentOrders = filteredOrders.slice(
+  const currentOrders = orders.slice(
     indexOfFirstOrder,
     indexOfLastOrder
   );
@@ -422,7 +405,7 @@ const SellerOrdersPage = () => {
           </div>
         </div>
 
-        {filteredOrders.length === 0 ? (
+        {orders.length === 0 ? (
           <div className="text-center py-20">
             <div className="inline-block bg-white dark:bg-gray-800 p-8 rounded-2xl shadow-xl transform transition hover:scale-105">
               <div className="text-6xl mb-4">📭</div>
@@ -651,7 +634,7 @@ const SellerOrdersPage = () => {
             ))}
             <div className="flex justify-center mt-8">
               {Array.from(
-                { length: Math.ceil(filteredOrders.length / ordersPerPage) },
+                { length: Math.ceil(orders.length / ordersPerPage) },
                 (_, i) => (
                   <button
                     key={i}
@@ -667,6 +650,21 @@ const SellerOrdersPage = () => {
                 )
               )}
             </div>
+            {nextPageUrl && (
+              <div className="flex flex-col items-center mt-4 gap-2">
+                {/* Курсорная пагинация не считает общее число заказов, поэтому показываем, что список неполный */}
+                <p className="text-sm text-gray-500 dark:text-gray-400">
+                  Загружено заказов: {orders.length}, есть ещё
+                </p>
+                <button
+                  onClick={loadMoreOrders}
+                  disabled={loadingMore}
+                  className="px-4 py-2 bg-blue-500 text-white rounded-lg hover:bg-blue-600 transition-colors disabled:opacity-50"
+                >
+                  {loadingMore ? "Загрузка..." : "Показать ещё"}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>